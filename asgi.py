@@ -0,0 +1,140 @@
+"""Optional ASGI entry point for the same Flask app
+
+    uvicorn asgi:app
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+Every route (main.py and the blueprints) runs unchanged on a bounded thread
+executor, so the event loop only moves bytes. A streamed export occupies a
+thread just while producing each chunk; while a slow client drains it, other
+requests use the thread. `gunicorn main:app` keeps working as before.
+"""
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from main import app as flask_app, DATABASE_POOL_SIZE
+
+# Threads running Flask/SQLite work; defaults to the connection pool size so
+# no thread has to open a connection outside the pool
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', DATABASE_POOL_SIZE))
+
+# Request bodies above this are spooled to disk (bulk imports)
+ASGI_BODY_SPOOL = 1024 * 1024
+
+_DONE = object()
+
+class WsgiToAsgi:
+    """Serve a WSGI app over ASGI, running it on a bounded executor"""
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=ASGI_BODY_SPOOL)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        # One context per request: stream_with_context pushes the Flask
+        # contexts on the first chunk, and later chunks may run on other threads
+        context = contextvars.copy_context()
+
+        def run(function, *args):
+            return loop.run_in_executor(self.executor, context.run, function, *args)
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return self._write_unsupported
+
+        iterable = await run(self.wsgi_app, self._environ(scope, body), start_response)
+        try:
+            iterator = iter(iterable)
+            chunk = await run(next, iterator, _DONE)
+            await send({'type': 'http.response.start', 'status': response['status'],
+                        'headers': response['headers']})
+            while chunk is not _DONE:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await run(next, iterator, _DONE)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await run(iterable.close)
+            body.close()
+
+    @staticmethod
+    def _write_unsupported(data):
+        raise NotImplementedError('write() callables are not supported')
+
+    @staticmethod
+    def _environ(scope, body):
+        """PEP 3333 environ for an ASGI HTTP scope"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'REMOTE_ADDR': client[0],
+            'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            # The body is fully buffered, so chunked uploads can be read to EOF
+            'wsgi.input_terminated': True,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = name
+            else:
+                key = 'HTTP_' + name
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+        return environ
+
+app = WsgiToAsgi(flask_app, ASGI_THREADS)
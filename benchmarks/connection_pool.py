@@ -0,0 +1,122 @@
+"""Concurrent read/write throughput: per-request connections vs the pool
+
+    python benchmarks/connection_pool.py [--seconds 5] [--readers 8] [--writers 2]
+
+"before" opens a fresh sqlite3 connection per operation with the default
+rollback journal, like the old get_db(). "after" uses ConnectionPool (WAL,
+synchronous=NORMAL, mmap, cache_size, busy_timeout, statement cache).
+Each run uses its own temporary database seeded with the same rows.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.connection import ConnectionPool
+
+SEED_ROWS = 20000
+
+def seed(path):
+    db = sqlite3.connect(path)
+    db.execute('''
+        CREATE TABLE expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            project_id INTEGER,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            date DATE NOT NULL,
+            payment_method TEXT NOT NULL,
+            status TEXT DEFAULT 'pending'
+        )
+    ''')
+    db.execute('CREATE INDEX idx_expenses_project_date ON expenses (project_id, date)')
+    db.executemany(
+        'INSERT INTO expenses (category, project_id, description, amount, date, payment_method) VALUES (?, ?, ?, ?, ?, ?)',
+        ((f'cat{i % 8}', i % 50, 'seed', i % 1000, f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 'cash')
+         for i in range(SEED_ROWS))
+    )
+    db.commit()
+    db.close()
+
+def run(path, acquire, release, seconds, readers, writers):
+    counts = {'read': 0, 'write': 0, 'busy': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def reader(worker):
+        done = busy = 0
+        while time.monotonic() < stop:
+            db = acquire()
+            try:
+                db.execute('SELECT * FROM expenses WHERE project_id = ? ORDER BY date DESC LIMIT 50',
+                           (worker % 50,)).fetchall()
+                done += 1
+            except sqlite3.OperationalError:
+                busy += 1
+            finally:
+                release(db)
+        with lock:
+            counts['read'] += done
+            counts['busy'] += busy
+
+    def writer(worker):
+        done = busy = 0
+        while time.monotonic() < stop:
+            db = acquire()
+            try:
+                db.execute('INSERT INTO expenses (category, project_id, description, amount, date, payment_method) '
+                           'VALUES (?, ?, ?, ?, ?, ?)', ('bench', worker, 'bench', 1.0, '2024-06-01', 'cash'))
+                db.commit()
+                done += 1
+            except sqlite3.OperationalError:
+                busy += 1
+            finally:
+                release(db)
+        with lock:
+            counts['write'] += done
+            counts['busy'] += busy
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {name: value / seconds if name != 'busy' else value for name, value in counts.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        before_path = os.path.join(directory, 'before.db')
+        seed(before_path)
+
+        def connect_per_request():
+            db = sqlite3.connect(before_path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            return db
+
+        before = run(before_path, connect_per_request, lambda db: db.close(),
+                     args.seconds, args.readers, args.writers)
+
+        after_path = os.path.join(directory, 'after.db')
+        seed(after_path)
+        pool = ConnectionPool(after_path, size=args.readers + args.writers)
+        after = run(after_path, pool.acquire, pool.release, args.seconds, args.readers, args.writers)
+        pool.close_all()
+
+    print(f'{"":8}{"reads/s":>12}{"writes/s":>12}{"busy errors":>14}')
+    for name, result in (('before', before), ('after', after)):
+        print(f'{name:8}{result["read"]:12.0f}{result["write"]:12.0f}{result["busy"]:14d}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""List serialization: sqlite3.Row -> dict -> jsonify vs SQLite json_object()
+
+    python benchmarks/list_serialization.py [--rows 100000] [--repeat 5]
+
+"before" is Expense.get_page(): every row becomes a sqlite3.Row and a dict,
+then the whole list goes through Flask's JSON provider. "after" is
+Expense.get_page_json(): SQLite renders each row with json_object() into a
+plain tuple and Python only joins the encoded rows. Both build the full
+response for the unpaginated list inside a request context, which the
+streamed "after" body needs. Latency is the median of --repeat runs; peak
+memory is measured separately with tracemalloc so it does not skew timings.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask
+from models.expense import Expense
+from models.pagination import paginated_response
+
+CATEGORIES = ('معدات', 'إيجار استوديو', 'مواقع', 'تسويق', 'نقل', 'طعام')
+
+def seed(path, rows):
+    db = sqlite3.connect(path)
+    Expense.create_table(db)
+    db.execute('ALTER TABLE expenses ADD COLUMN version INTEGER NOT NULL DEFAULT 1')  # migration 3
+    db.executemany(
+        'INSERT INTO expenses (category, project_id, description, amount, date, vendor, payment_method, status) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        ((CATEGORIES[i % len(CATEGORIES)], i % 50 + 1, f'مصروف رقم {i}', round(i % 10000 * 1.25, 2),
+          f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}', f'vendor {i % 200}', 'cash',
+          'paid' if i % 3 else 'pending')
+         for i in range(rows))
+    )
+    db.commit()
+    db.close()
+
+def before(db):
+    rows, next_cursor = Expense.get_page(db)
+    return paginated_response(rows, next_cursor).get_data()
+
+def after(db):
+    body, next_cursor = Expense.get_page_json(db)
+    return paginated_response(body, next_cursor).get_data()
+
+def measure(function, db, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = function(db)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with tempfile.TemporaryDirectory() as directory, app.test_request_context():
+        path = os.path.join(directory, 'bench.db')
+        seed(path, args.rows)
+        db = sqlite3.connect(path)
+        db.row_factory = sqlite3.Row
+
+        results = {name: measure(function, db, args.repeat)
+                   for name, function in (('before', before), ('after', after))}
+        db.close()
+
+    # Same data either way (key order and escaping may differ)
+    assert json.loads(results['before'][2]) == json.loads(results['after'][2])
+
+    print(f'{args.rows} rows')
+    print(f'{"":8}{"median ms":>12}{"peak MiB":>12}{"body KiB":>12}')
+    for name, (seconds, peak, body) in results.items():
+        print(f'{name:8}{seconds * 1000:12.1f}{peak / 2 ** 20:12.1f}{len(body) / 1024:12.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+"""Load test: seed a realistic dataset and drive the real routes
+
+    python benchmarks/load_test.py [--employees 10000] [--expenses 1000000]
+        [--requests 200] [--concurrency 4] [--scenarios list_expenses,login]
+        [--url http://127.0.0.1:8000] [--workdir benchmarks/.data]
+        [--output benchmarks/results/<timestamp>.json] [--seed 1]
+        [--no-response-cache]
+
+projects, budget_breakdown, employees, payroll, expenses and salaries are
+generated from --seed, so every run sees the same rows. They are written
+through the app's own schema (and its summary triggers) into
+<workdir>/src/database/app.db, which is reused as long as the sizes and
+seed match; seeding 1M expenses takes a few minutes the first time.
+
+Without --url the routes run in process through Flask's test client. With
+--url they go over HTTP to a server started on the seeded database:
+
+    cd benchmarks/.data && gunicorn --pythonpath ../.. -w 4 main:app
+
+Each scenario sends --requests requests from --concurrency logged-in
+clients and reports p50/p99 latency, throughput and the share of responses
+served from conditional_get's in-process body cache (X-Cache: hit). The
+list scenarios vary their limit, filters and cursor per request so most
+of them reach SQLite; --no-response-cache turns the body cache off for an
+uncached pass (for --url, start the server with HTTP_CACHE_SIZE=0). The
+results and the run's parameters are saved as JSON to compare runs.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# Logins are rate limited per username, so every client gets its own user
+BENCH_USERS = 16
+BENCH_PASSWORD = 'bench-password'
+
+PROJECT_TYPES = ('film', 'series', 'documentary', 'commercial')
+PROJECT_STATUSES = ('planning', 'in_progress', 'paused', 'completed')
+EMPLOYEE_TYPES = ('ممثل', 'مساعد ممثل', 'مخرج', 'منتج', 'فني صوت', 'فني إضاءة', 'مصور', 'مونتير',
+                  'كاتب سيناريو', 'مساعد إخراج', 'فنان مكياج', 'مصمم أزياء', 'مصمم ديكور', 'سائق')
+PAYMENT_TYPES = ('شهري', 'يومي', 'بالساعة', 'إجمالي المشروع', 'لكل مشهد')
+EXPENSE_CATEGORIES = ('معدات', 'إيجار استوديو', 'مواصلات', 'طعام وشراب', 'أزياء ومكياج', 'ديكور',
+                      'تسويق', 'أخرى')
+PAYMENT_METHODS = ('نقدي', 'شيك', 'تحويل بنكي', 'بطاقة ائتمان')
+FIRST_NAMES = ('أحمد', 'محمد', 'محمود', 'علي', 'عمر', 'يوسف', 'خالد', 'منى', 'سارة', 'نور', 'ليلى',
+               'هدى', 'ياسمين', 'مريم', 'كريم', 'طارق', 'هشام', 'رانيا', 'دينا', 'إبراهيم')
+LAST_NAMES = ('حمدي', 'السيد', 'عبد الله', 'حسن', 'مصطفى', 'إبراهيم', 'سالم', 'فاروق', 'النجار',
+              'الشريف', 'عثمان', 'رشاد', 'زكي', 'منصور', 'البنا')
+VENDORS = ('استوديو الأهرام', 'شركة النور للمعدات', 'مطعم الشام', 'أزياء الفن', 'نقل سريع',
+           'مطبعة الحديثة', 'ديكورات القاهرة', 'إضاءة المحترف')
+
+FIRST_DAY = date(2022, 1, 1)
+DAYS = 4 * 365
+
+# Rows per executemany() while seeding
+SEED_BATCH = 10000
+
+def _day(rng):
+    return (FIRST_DAY + timedelta(days=rng.randrange(DAYS))).isoformat()
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == SEED_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def seed(database, params):
+    """Fill the app's tables with params['seed']-determined rows, unless a
+    previous run already seeded this database with the same params"""
+    db = sqlite3.connect(database)
+    db.execute('CREATE TABLE IF NOT EXISTS benchmark_seed (params TEXT NOT NULL)')
+    existing = db.execute('SELECT params FROM benchmark_seed').fetchone()
+    if existing:
+        db.close()
+        if json.loads(existing[0]) != params:
+            raise SystemExit(f'{database} was seeded with {existing[0]}; use another --workdir')
+        return False
+
+    from main import hash_password
+    rng = random.Random(params['seed'])
+    projects, employees, expenses = params['projects'], params['employees'], params['expenses']
+    started = time.perf_counter()
+
+    def insert(sql, rows, label):
+        for batch in _batches(rows):
+            db.executemany(sql, batch)
+        db.commit()
+        print(f'  seeded {label} ({time.perf_counter() - started:.0f} s)', file=sys.stderr)
+
+    db.executemany('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                   [(f'bench{i}', hash_password(BENCH_PASSWORD), 'admin') for i in range(BENCH_USERS)])
+
+    insert('''INSERT INTO projects (name, type, description, total_budget, start_date, end_date, status)
+              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+           ((f'مشروع {i + 1}', rng.choice(PROJECT_TYPES), 'مشروع إنتاج', rng.randrange(500, 20000) * 1000,
+             _day(rng), (FIRST_DAY + timedelta(days=DAYS + rng.randrange(365))).isoformat(),
+             rng.choice(PROJECT_STATUSES)) for i in range(projects)), f'{projects} projects')
+
+    insert('''INSERT INTO budget_breakdown (project_id, artists_salaries, technical_crew, equipment,
+                                            locations, marketing, other)
+              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+           ((i + 1, *(rng.randrange(50, 3000) * 1000 for _ in range(6))) for i in range(projects)),
+           'budget_breakdown')
+
+    insert('''INSERT INTO employees (name, type, project_id, salary, payment_type, phone, id_number,
+                                     start_date)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+           ((_name(rng), rng.choice(EMPLOYEE_TYPES), rng.randrange(projects) + 1,
+             rng.randrange(30, 400) * 100, rng.choice(PAYMENT_TYPES), f'010{rng.randrange(10 ** 8):08d}',
+             f'{rng.randrange(10 ** 14):014d}', _day(rng)) for _ in range(employees)),
+           f'{employees} employees')
+
+    def payroll_rows():
+        for employee_id in range(1, employees + 1):
+            for month in range(params['payroll_months']):
+                period = f'{2024 + month // 12}-{month % 12 + 1:02d}'
+                base = rng.randrange(30, 400) * 100
+                bonus, deductions = rng.choice((0, 0, 500, 1000)), rng.choice((0, 0, 250))
+                yield (employee_id, period, f'{period}-01', f'{period}-28', base, bonus, deductions, 0,
+                       base + bonus - deductions, f'{period}-28', rng.choice(('paid', 'paid', 'pending')))
+
+    insert('''INSERT INTO payroll (employee_id, period, start_date, end_date, base_amount, bonus,
+                                   deductions, overtime, total, payment_date, status)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+           payroll_rows(), f'{employees * params["payroll_months"]} payroll records')
+
+    insert('''INSERT INTO expenses (category, project_id, description, amount, date, vendor,
+                                    payment_method, status)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+           ((category, rng.randrange(projects) + 1, f'{category} - {rng.choice(VENDORS)}',
+             round(rng.lognormvariate(7, 1.2), 2), _day(rng), rng.choice(VENDORS),
+             rng.choice(PAYMENT_METHODS), rng.choice(('paid', 'paid', 'pending')))
+            for category in (rng.choice(EXPENSE_CATEGORIES) for _ in range(expenses))),
+           f'{expenses} expenses')
+
+    insert('''INSERT INTO salaries (project_id, employee_name, employee_type, amount, payment_type, status)
+              VALUES (?, ?, ?, ?, ?, ?)''',
+           ((rng.randrange(projects) + 1, _name(rng), rng.choice(EMPLOYEE_TYPES), rng.randrange(30, 400) * 100,
+             rng.choice(PAYMENT_TYPES), rng.choice(('paid', 'pending'))) for _ in range(params['salaries'])),
+           f'{params["salaries"]} salaries')
+
+    db.execute('INSERT INTO benchmark_seed (params) VALUES (?)', (json.dumps(params, sort_keys=True),))
+    db.commit()
+    db.execute('ANALYZE')
+    db.close()
+    return True
+
+class FlaskClientDriver:
+    """Requests through the app's test client, in this process"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.test_client()
+
+        def send(method, path, body=None):
+            response = client.open(path, method=method, json=body)
+            data = response.get_data()
+            response.close()
+            return response.status_code, data, response.headers
+        return send
+
+class HttpDriver:
+    """Requests over HTTP to a running server (gunicorn, uvicorn asgi:app)"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def session(self):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+        def send(method, path, body=None):
+            data = json.dumps(body).encode('utf-8') if body is not None else None
+            request = urllib.request.Request(self.url + path, data=data, method=method,
+                                             headers={'Content-Type': 'application/json'})
+            try:
+                with opener.open(request) as response:
+                    return response.status, response.read(), response.headers
+            except urllib.error.HTTPError as error:
+                return error.code, error.read(), error.headers
+        return send
+
+def _login(user):
+    return 'POST', '/api/login', {'username': f'bench{user}', 'password': BENCH_PASSWORD}
+
+def _expense(rng, params):
+    category = rng.choice(EXPENSE_CATEGORIES)
+    return {'category': category, 'project_id': rng.randrange(params['projects']) + 1,
+            'description': f'{category} - {rng.choice(VENDORS)}', 'amount': round(rng.uniform(50, 5000), 2),
+            'date': _day(rng), 'vendor': rng.choice(VENDORS), 'payment_method': rng.choice(PAYMENT_METHODS)}
+
+def _employee(rng, params):
+    return {'name': _name(rng), 'type': rng.choice(EMPLOYEE_TYPES),
+            'project_id': rng.randrange(params['projects']) + 1, 'salary': rng.randrange(30, 400) * 100,
+            'payment_type': rng.choice(PAYMENT_TYPES), 'start_date': _day(rng)}
+
+def _random_cursor(rng, value=_day):
+    from models.pagination import encode_cursor
+    return encode_cursor(value(rng), 10 ** 9)
+
+def _limit(rng):
+    return rng.randrange(50, 151)
+
+def _project(rng, params):
+    return rng.randrange(params['projects']) + 1
+
+def _created_id(state, kind):
+    ids = state[kind]
+    return ids.pop() if ids else None
+
+# name -> function(rng, params, state) returning (method, path, json body).
+# state is per client: it carries the ids created by the create scenarios
+# so the delete scenarios remove exactly those rows.
+SCENARIOS = {
+    'login': lambda rng, params, state: _login(state['user']),
+    # Lists vary per request, so they measure the routes rather than
+    # repeat hits on the in-process body cache
+    'list_projects': lambda rng, params, state: (
+        'GET', f'/api/projects?limit={rng.randrange(20, 101)}&status={rng.choice(PROJECT_STATUSES)}', None),
+    'list_employees': lambda rng, params, state: (
+        'GET', f'/api/employees?limit={_limit(rng)}&cursor={_random_cursor(rng, _name)}', None),
+    'list_employees_by_project': lambda rng, params, state: (
+        'GET', f'/api/employees?limit={_limit(rng)}&project_id={_project(rng, params)}', None),
+    'list_payroll': lambda rng, params, state: (
+        'GET', f'/api/payroll?limit={_limit(rng)}&status={rng.choice(("paid", "pending"))}'
+               f'&cursor={_random_cursor(rng)}', None),
+    'list_expenses': lambda rng, params, state: (
+        'GET', f'/api/expenses?limit={_limit(rng)}&category={quote(rng.choice(EXPENSE_CATEGORIES))}', None),
+    'list_expenses_by_project': lambda rng, params, state: (
+        'GET', f'/api/expenses?limit={_limit(rng)}&project_id={_project(rng, params)}', None),
+    'list_expenses_deep_page': lambda rng, params, state: (
+        'GET', f'/api/expenses?limit={_limit(rng)}&cursor={_random_cursor(rng)}', None),
+    'get_expense': lambda rng, params, state: (
+        'GET', f'/api/expenses/{rng.randrange(params["expenses"]) + 1}', None),
+    'create_expense': lambda rng, params, state: ('POST', '/api/expenses', _expense(rng, params)),
+    'update_expense': lambda rng, params, state: (
+        'PUT', f'/api/expenses/{rng.randrange(params["expenses"]) + 1}',
+        {'amount': round(rng.uniform(50, 5000), 2), 'status': rng.choice(('paid', 'pending'))}),
+    'delete_expense': lambda rng, params, state: (
+        'DELETE', f'/api/expenses/{_created_id(state, "expenses")}', None),
+    'create_employee': lambda rng, params, state: ('POST', '/api/employees', _employee(rng, params)),
+    'update_employee': lambda rng, params, state: (
+        'PUT', f'/api/employees/{rng.randrange(params["employees"]) + 1}',
+        {'salary': rng.randrange(30, 400) * 100}),
+    'delete_employee': lambda rng, params, state: (
+        'DELETE', f'/api/employees/{_created_id(state, "employees")}', None),
+}
+
+def run_scenario(clients, name, requests, warmup, params):
+    """Send `requests` requests of one scenario spread over the clients"""
+    scenario = SCENARIOS[name]
+    latencies = []
+    statuses = Counter()
+    cache = Counter()
+    lock = threading.Lock()
+
+    def worker(index, client, count):
+        rng = random.Random(f'{params["seed"]}-{name}-{index}')
+        send, state = client
+        timings = []
+        codes = Counter()
+        hits = Counter()
+        for i in range(warmup + count):
+            method, path, body = scenario(rng, params, state)
+            start = time.perf_counter()
+            status, data, headers = send(method, path, body)
+            elapsed = time.perf_counter() - start
+            if name.startswith('create_') and status == 201:
+                state[name.removeprefix('create_') + 's'].append(json.loads(data)['id'])
+            if i < warmup:
+                continue
+            timings.append(elapsed)
+            codes[status] += 1
+            hits[headers.get('X-Cache')] += 1
+        with lock:
+            latencies.extend(timings)
+            statuses.update(codes)
+            cache.update(hits)
+
+    share, extra = divmod(requests, len(clients))
+    threads = [threading.Thread(target=worker, args=(i, client, share + (i < extra)))
+               for i, client in enumerate(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        # Share of responses replayed from the body cache (None: not cached)
+        'cache_hit_share': round(cache['hit'] / (cache['hit'] + cache['miss']), 3)
+                           if cache['hit'] + cache['miss'] else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--payroll-months', type=int, default=12)
+    parser.add_argument('--expenses', type=int, default=1000000)
+    parser.add_argument('--salaries', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help='per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unrecorded requests per client and scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--url', help='drive a running server instead of the test client')
+    parser.add_argument('--workdir', default=os.path.join(ROOT, 'benchmarks', '.data'))
+    parser.add_argument('--output')
+    parser.add_argument('--no-response-cache', action='store_true',
+                        help="turn off conditional_get's in-process body cache")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name}; choose from {", ".join(SCENARIOS)}')
+    if args.concurrency > BENCH_USERS:
+        parser.error(f'--concurrency is limited to {BENCH_USERS} (one bench user per client)')
+
+    params = {'projects': args.projects, 'employees': args.employees, 'payroll_months': args.payroll_months,
+              'expenses': args.expenses, 'salaries': args.salaries, 'seed': args.seed}
+
+    output = os.path.abspath(args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f'load_test-{datetime.now():%Y%m%d-%H%M%S}.json'))
+
+    # main.py keeps its database under the working directory and creates
+    # the schema on import
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    os.environ.setdefault('BUDGET_RECONCILE_INTERVAL', '0')
+    if args.no_response_cache:
+        os.environ['HTTP_CACHE_SIZE'] = '0'
+    import main as app_module
+    print(f'seeding {os.path.abspath(app_module.DATABASE)}', file=sys.stderr)
+    seeded = seed(app_module.DATABASE, params)
+
+    driver = HttpDriver(args.url) if args.url else FlaskClientDriver(app_module.app)
+    clients = []
+    for user in range(args.concurrency):
+        send = driver.session()
+        status, body, _ = send(*_login(user))
+        if status != 200:
+            raise SystemExit(f'login failed ({status}): {body[:200]!r}')
+        clients.append((send, {'user': user, 'expenses': [], 'employees': []}))
+
+    results = {}
+    for name in scenarios:
+        results[name] = result = run_scenario(clients, name, args.requests, args.warmup, params)
+        hit_share = '' if result['cache_hit_share'] is None else f'{result["cache_hit_share"]:.0%} cached'
+        print(f'{name:28}{result["p50_ms"]:10.2f} ms p50{result["p99_ms"]:10.2f} ms p99'
+              f'{result["throughput_rps"]:10.1f} req/s {hit_share:>10}  {result["statuses"]}')
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'target': args.url or 'flask-test-client',
+        'dataset': params,
+        'freshly_seeded': seeded,
+        'requests_per_scenario': args.requests,
+        'concurrency': args.concurrency,
+        'response_cache': not args.no_response_cache,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'scenarios': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'results written to {output}', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,48 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, g
 from flask_cors import CORS
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
+from models.connection import get_pool
+from models.pagination import parse_list_args, paginated_response
+from models.project import Project
+from models.versions import DataVersion
+from models.http_cache import conditional_get
+from models.json_provider import FastJSONProvider
+from models.compression import compress_response
+from models.assets import send_page, send_asset, load as load_assets
+from models.metrics import MetricsMiddleware, label_request, sampler, METRICS_ENABLED
+from models.passwords import hash_password, verify_password, needs_rehash, login_limiter, LoginBusy
+from models.sessions import SessionStore, login_required
 
 app = Flask(__name__, static_folder='static')
 app.config['SECRET_KEY'] = 'your_secret_key_here'
 CORS(app, supports_credentials=True)
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
+if METRICS_ENABLED:
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+    app.before_request(label_request)
 
 DATABASE = 'src/database/app.db'
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 8))
+# Seconds between budget drift checks; off (0) by default. Each check scans
+# expenses and payroll in every process that sets it, so enable it in one
+# (POST /api/projects/reconcile runs a check on demand).
+BUDGET_RECONCILE_INTERVAL = int(os.environ.get('BUDGET_RECONCILE_INTERVAL', 0))
 
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = get_pool(DATABASE, DATABASE_POOL_SIZE).acquire()
     return db
 
+app.session_interface = SessionStore(get_db)
+
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        get_pool(DATABASE, DATABASE_POOL_SIZE).release(db)
 
 def init_db():
     with app.app_context():
@@ -82,39 +103,43 @@ def init_db():
 
 @app.route('/')
 def index():
-    return app.send_static_file('index.html')
+    return send_page('index.html')
 
 @app.route('/login.html')
 def login_page():
-    return app.send_static_file('login.html')
+    return send_page('login.html')
 
 @app.route('/dashboard.html')
 def dashboard_page():
-    return app.send_static_file('dashboard.html')
+    return send_page('dashboard.html')
 
 @app.route('/users.html')
 def users_page():
-    return app.send_static_file('users.html')
+    return send_page('users.html')
 
 @app.route('/projects.html')
 def projects_page():
-    return app.send_static_file('projects.html')
+    return send_page('projects.html')
 
 @app.route('/payroll.html')
 def payroll_page():
-    return app.send_static_file('payroll.html')
+    return send_page('payroll.html')
 
 @app.route('/transactions.html')
 def transactions_page():
-    return app.send_static_file('transactions.html')
+    return send_page('transactions.html')
 
 @app.route('/reports.html')
 def reports_page():
-    return app.send_static_file('reports.html')
+    return send_page('reports.html')
 
 @app.route('/settings.html')
 def settings_page():
-    return app.send_static_file('settings.html')
+    return send_page('settings.html')
+
+@app.route('/assets/<name>')
+def asset(name):
+    return send_asset(name)
 
 # User routes
 @app.route('/api/login', methods=['POST'])
@@ -123,60 +148,63 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
+    if not username or not password:
+        return jsonify({'error': 'Invalid credentials'}), 401
+
+    retry_after = login_limiter.hit(username)
+    if retry_after:
+        return jsonify({'error': 'Too many login attempts'}), 429, {'Retry-After': str(retry_after)}
+
     db = get_db()
-    user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+    user = db.execute('SELECT id, username, password, role FROM users WHERE username = ?',
+                      (username,)).fetchone()
+
+    try:
+        valid = user is not None and verify_password(user['password'], password)
+        if valid and needs_rehash(user['password']):
+            # Upgrade hashes made with older parameters while we have the password
+            db.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                       (hash_password(password), user['id'], user['password']))
+            db.commit()
+    except LoginBusy:
+        return jsonify({'error': 'Server busy, try again'}), 503, {'Retry-After': '1'}
 
-    if user and check_password_hash(user['password'], password):
+    if valid:
+        login_limiter.reset(username)
+        session.clear()
+        session.rotate()
         session['user_id'] = user['id']
-        session['username'] = user['username']
-        session['role'] = user['role']
         return jsonify({'message': 'Login successful', 'user': {'username': user['username'], 'role': user['role']}}), 200
     else:
         return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/logout', methods=['POST'])
 def logout():
-    session.pop('user_id', None)
-    session.pop('username', None)
-    session.pop('role', None)
+    session.clear()
     return jsonify({'message': 'Logout successful'}), 200
 
 @app.route('/api/current-user')
+@login_required
 def current_user():
-    if 'user_id' in session:
-        return jsonify({'username': session['username'], 'role': session['role']}), 200
-    else:
-        return jsonify({'error': 'Not logged in'}), 401
+    return jsonify({'username': g.user['username'], 'role': g.user['role']}), 200
 
 @app.route('/api/projects', methods=['GET'])
+@login_required
+@conditional_get(*Project.SOURCE_TABLES)
 def get_projects():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        query = parse_list_args(request.args, Project.COLUMNS, Project.FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     db = get_db()
-    projects = db.execute('SELECT * FROM projects ORDER BY created_at DESC').fetchall()
+    projects_list, next_cursor = Project.get_page_json(db, **query)
     
-    projects_list = []
-    for project in projects:
-        projects_list.append({
-            'id': project['id'],
-            'name': project['name'],
-            'type': project['type'],
-            'description': project['description'],
-            'total_budget': project['total_budget'],
-            'spent_amount': project['spent_amount'],
-            'start_date': project['start_date'],
-            'end_date': project['end_date'],
-            'status': project['status']
-        })
-    
-    return jsonify(projects_list), 200
+    return paginated_response(projects_list, next_cursor), 200
 
 @app.route('/api/projects', methods=['POST'])
+@login_required
 def create_project():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not logged in'}), 401
-    
     data = request.get_json()
     
     db = get_db()
@@ -210,10 +238,43 @@ def create_project():
         budget_breakdown.get('other', 0)
     ))
     
+    DataVersion.bump(db, 'projects', 'budget_breakdown')
     db.commit()
     
     return jsonify({'message': 'Project created successfully', 'project_id': project_id}), 201
 
+@app.route('/api/dashboard/stats', methods=['GET'])
+@login_required
+@conditional_get('expenses', 'payroll', 'projects', daily=True)
+def dashboard_stats():
+    from models.stats import DashboardStats
+    return jsonify(DashboardStats.get(get_db())), 200
+
+@app.route('/api/projects/budget', methods=['GET'])
+@login_required
+@conditional_get(*Project.SOURCE_TABLES, 'budget_breakdown')
+def projects_budget():
+    from models.budget import BudgetConsumption
+    return jsonify(BudgetConsumption.get(get_db())), 200
+
+@app.route('/api/projects/<int:project_id>/budget', methods=['GET'])
+@login_required
+@conditional_get(*Project.SOURCE_TABLES, 'budget_breakdown')
+def project_budget(project_id):
+    from models.budget import BudgetConsumption
+    budget = BudgetConsumption.get(get_db(), project_id)
+    if not budget:
+        return jsonify({'error': 'Project not found'}), 404
+    return jsonify(budget[0]), 200
+
+@app.route('/api/projects/reconcile', methods=['POST'])
+@login_required(role='admin')
+def reconcile_budgets():
+    from models.budget import BudgetConsumption
+    repair = request.args.get('dry_run') not in ('1', 'true')
+    drift = BudgetConsumption.reconcile(get_db(), repair=repair)
+    return jsonify({'repaired': repair and bool(drift), 'drift': drift}), 200
+
 # Admin route to create initial admin user (for development only)
 @app.route('/api/create-admin', methods=['POST'])
 def create_admin():
@@ -223,41 +284,98 @@ def create_admin():
     if admin_user:
         return jsonify({'message': 'Admin user already exists'}), 200
 
-    hashed_password = generate_password_hash('admin123')
+    try:
+        hashed_password = hash_password('admin123')
+    except LoginBusy:
+        return jsonify({'error': 'Server busy, try again'}), 503, {'Retry-After': '1'}
     db.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
                ('admin', hashed_password, 'admin'))
     db.commit()
     return jsonify({'message': 'Admin user created'}), 201
 
-# Register payroll blueprint
+# Register blueprints
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from routes.payroll import payroll_bp
 app.register_blueprint(payroll_bp)
+from routes.reports import reports_bp
+app.register_blueprint(reports_bp)
+from routes.transactions import transactions_bp
+app.register_blueprint(transactions_bp)
+from routes.search import search_bp
+app.register_blueprint(search_bp)
+from routes.metrics import metrics_bp
+app.register_blueprint(metrics_bp)
+from routes.periods import periods_bp
+app.register_blueprint(periods_bp)
 
-if __name__ == '__main__':
+def setup_db():
+    """Create every table and apply pending migrations (idempotent)"""
+    init_db()
     with app.app_context():
-        init_db()
-        
         # Initialize payroll tables
         from models.employee import Employee
         from models.payroll import Payroll
         from models.expense import Expense
+        from models.stats import DashboardStats
+        from models.versions import DataVersion
+        from models.transaction import Transaction
+        from models.budget import BudgetConsumption
+        from models.search import Search
+        from models.rollups import Rollups
+        from models.archive import Archives
         
         db = get_db()
         Employee.create_table(db)
         Payroll.create_table(db)
         Expense.create_table(db)
+        DashboardStats.create_table(db)
+        DataVersion.create_table(db)
+        SessionStore.create_table(db)
+        Transaction.create_table(db)
+        # Before BudgetConsumption, whose first reconcile reads closed_period_totals
+        Archives.create_table(db)
+        BudgetConsumption.create_table(db)
+        Search.create_table(db)
+        Rollups.create_table(db)
+        
+        # Apply versioned schema migrations (indexes etc.)
+        from models.migrations import run_migrations
+        run_migrations(db)
+
+# Runs on import too, so `gunicorn main:app` workers find the tables that
+# the write paths and summary triggers depend on.
+setup_db()
+
+# Likewise, rebuild static/dist if the static sources changed
+load_assets()
+
+if BUDGET_RECONCILE_INTERVAL > 0:
+    from models.budget import start_reconciler
+    start_reconciler(get_pool(DATABASE, DATABASE_POOL_SIZE), BUDGET_RECONCILE_INTERVAL)
+
+# Opt-in group commit (GROUP_COMMIT=1): single-row inserts are batched by
+# one writer thread per process
+from models.group_commit import start_writer, GROUP_COMMIT_ENABLED
+if GROUP_COMMIT_ENABLED:
+    start_writer(get_pool(DATABASE, DATABASE_POOL_SIZE))
+
+# Opt-in stack sampling profiler (PROFILE_INTERVAL_MS), read at /metrics/profile
+if sampler is not None:
+    sampler.start()
+
+if __name__ == '__main__':
+    with app.app_context():
+        db = get_db()
         
         # Create admin user if it doesn't exist
         admin_user = db.execute('SELECT * FROM users WHERE username = ?', ('admin',)).fetchone()
         if not admin_user:
-            hashed_password = generate_password_hash('admin123')
+            hashed_password = hash_password('admin123')
             db.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
                        ('admin', hashed_password, 'admin'))
             db.commit()
             print("Admin user created: username=admin, password=admin123")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
-
@@ -0,0 +1,194 @@
+from flask import g
+import sqlite3
+from datetime import date
+import numpy as np
+from models.budget import _expense_category, _employee_category
+from models.reports import BUDGET_CATEGORIES
+
+# Trailing window (days) the burn rate is averaged over
+BURN_WINDOW_DAYS = 90
+
+# Months in the moving average of monthly spend
+MOVING_AVERAGE_MONTHS = 3
+
+def _sums(cells, weights, size):
+    """Sum of weights per cell 0..size-1 (bincount returns ints when empty)"""
+    return np.bincount(cells, weights=weights, minlength=size).astype(np.float64)
+
+class Analytics:
+    # Budget forecasting over the expense and payroll ledgers. Their daily
+    # rollups are loaded in one bulk fetch into column arrays and aggregated
+    # with NumPy (bincount over project/category codes) instead of per-row
+    # dicts.
+
+    @staticmethod
+    def load(db, as_of, project_id=None):
+        """Column arrays (amount, day, project_id, category code) of all spend
+        up to as_of, expenses and payroll together, from the day-grain
+        rollups (so archived periods are included and nothing is row-level)"""
+        cases = ' '.join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(BUDGET_CATEGORIES))
+        project_filter = 'AND project_id = ?' if project_id else ''
+        params = [as_of.isoformat(), *([project_id] if project_id else [])]
+
+        def buckets(ledger, category):
+            # dimension is the expense category or the employee type
+            return f'''
+                SELECT total AS amount, date(bucket) AS day, project_id, {category} AS category
+                FROM (SELECT total, bucket, project_id, dimension AS category, dimension AS type
+                      FROM rollups
+                      WHERE ledger = '{ledger}' AND grain = 'day' AND row_count != 0 AND project_id != 0
+                        AND bucket <= ? {project_filter}) r
+            '''
+
+        cursor = db.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'''
+            SELECT amount, day, project_id, CASE category {cases} END FROM (
+                {buckets('expenses', _expense_category('r'))}
+                UNION ALL
+                {buckets('payroll', _employee_category('r.type'))}
+            )
+            WHERE day IS NOT NULL
+        ''', params * 2)
+        rows = cursor.fetchall()
+        if not rows:
+            return (np.zeros(0), np.zeros(0, dtype='datetime64[D]'),
+                    np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+        amounts, days, projects, categories = zip(*rows)
+        return (np.array(amounts, dtype=np.float64),
+                np.array(days, dtype='datetime64[D]'),
+                np.array(projects, dtype=np.int64),
+                np.array(categories, dtype=np.int64))
+
+    @staticmethod
+    def _budgets(db, project_id=None):
+        """Project rows with their total and per-category budgets"""
+        budgets = ', '.join(f'COALESCE(b.{column}, 0) AS {column}' for column in BUDGET_CATEGORIES)
+        where = 'WHERE p.id = ?' if project_id else ''
+        cursor = db.execute(f'''
+            SELECT p.id, p.name, p.type, p.status, p.total_budget, p.end_date, {budgets}
+            FROM projects p LEFT JOIN budget_breakdown b ON b.project_id = p.id
+            {where} ORDER BY p.id
+        ''', (project_id,) if project_id else ())
+        return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _overrun_dates(remaining, burn, as_of):
+        """Date the remaining budget runs out at the current burn rate
+        (as_of when already overrun, None when not burning)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days = np.ceil(np.where(burn > 0, np.maximum(remaining, 0) / burn, np.nan))
+        days = np.where(remaining < 0, 0, days)
+        dates = np.datetime64(as_of) + np.nan_to_num(days, nan=0).astype('timedelta64[D]')
+        return [None if np.isnan(day) else str(value) for day, value in zip(days, dates)]
+
+    @staticmethod
+    def forecast(db, as_of=None, project_id=None, start=None, end=None,
+                 window=BURN_WINDOW_DAYS, months=MOVING_AVERAGE_MONTHS):
+        """Burn rate and projected overrun per project and budget category,
+        plus monthly spend with a moving average and per-category variance
+        for the start..end range"""
+        as_of = as_of or date.today()
+        amounts, days, projects, categories = Analytics.load(db, as_of, project_id)
+        budgets = Analytics._budgets(db, project_id)
+        ncategories = len(BUDGET_CATEGORIES)
+
+        # Map project ids (sorted by the query) to dense indexes for bincount
+        project_ids = np.array([project['id'] for project in budgets], dtype=np.int64)
+        nprojects = len(project_ids)
+        index = np.minimum(np.searchsorted(project_ids, projects), max(nprojects - 1, 0))
+        known = project_ids[index] == projects if nprojects else np.zeros(len(projects), dtype=bool)
+        index, amounts, days, categories = index[known], amounts[known], days[known], categories[known]
+
+        cell = index * ncategories + categories
+        spent = _sums(cell, amounts, nprojects * ncategories).reshape(nprojects, ncategories)
+
+        # Burn rate over the trailing window, shortened for projects that
+        # started spending inside it
+        today = np.datetime64(as_of)
+        first_day = np.full(nprojects, today)
+        if len(days):
+            np.minimum.at(first_day, index, days)
+        active_days = np.clip((today - first_day).astype(np.int64) + 1, 1, window)
+        recent = days > today - np.timedelta64(window, 'D')
+        recent_spent = _sums(cell[recent], amounts[recent], nprojects * ncategories).reshape(nprojects, ncategories)
+        burn = recent_spent / active_days[:, None]
+
+        total_budget = np.array([project['total_budget'] or 0 for project in budgets], dtype=np.float64)
+        category_budget = np.array([[project[column] for column in BUDGET_CATEGORIES] for project in budgets],
+                                   dtype=np.float64).reshape(nprojects, ncategories)
+        total_spent = spent.sum(axis=1)
+        total_burn = burn.sum(axis=1)
+        overrun = Analytics._overrun_dates(total_budget - total_spent, total_burn, as_of)
+        category_overrun = Analytics._overrun_dates((category_budget - spent).ravel(), burn.ravel(), as_of)
+
+        result_projects = []
+        for i, project in enumerate(budgets):
+            result_projects.append({
+                'project_id': project['id'],
+                'name': project['name'],
+                'type': project['type'],
+                'status': project['status'],
+                'end_date': project['end_date'],
+                'total_budget': total_budget[i],
+                'spent': total_spent[i],
+                'remaining': total_budget[i] - total_spent[i],
+                'burn_rate': total_burn[i],
+                'projected_overrun_date': overrun[i],
+                'overruns_before_end': bool(overrun[i] and project['end_date'] and overrun[i] <= project['end_date']),
+                'categories': {
+                    column: {
+                        'budget': category_budget[i, c],
+                        'spent': spent[i, c],
+                        'variance': spent[i, c] - category_budget[i, c],
+                        'burn_rate': burn[i, c],
+                        'projected_overrun_date': category_overrun[i * ncategories + c],
+                    }
+                    for c, column in enumerate(BUDGET_CATEGORIES)
+                },
+            })
+
+        # Monthly spend in the requested range, per category
+        in_range = np.ones(len(days), dtype=bool)
+        if start:
+            in_range &= days >= np.datetime64(start, 'D')
+        if end:
+            in_range &= days <= np.datetime64(end, 'D')
+        month = days[in_range].astype('datetime64[M]')
+        if len(month):
+            first, last = month.min(), month.max()
+            labels = np.arange(first, last + 1)
+            month_index = (month - first).astype(np.int64)
+        else:
+            labels = np.zeros(0, dtype='datetime64[M]')
+            month_index = np.zeros(0, dtype=np.int64)
+        nmonths = len(labels)
+        monthly = _sums(month_index * ncategories + categories[in_range], amounts[in_range],
+                        nmonths * ncategories).reshape(nmonths, ncategories)
+        totals = monthly.sum(axis=1)
+        span = min(months, nmonths) or 1
+        moving = np.convolve(totals, np.ones(span) / span, mode='valid') if nmonths else totals
+        moving = np.concatenate([np.full(nmonths - len(moving), np.nan), moving])
+
+        return {
+            'as_of': as_of.isoformat(),
+            'window_days': window,
+            'projects': result_projects,
+            'monthly': {
+                'months': [str(label) for label in labels],
+                'totals': totals.tolist(),
+                'moving_average': [None if np.isnan(value) else value for value in moving.tolist()],
+            },
+            'categories': [
+                {
+                    'category': column,
+                    'total': monthly[:, c].sum(),
+                    'monthly_mean': monthly[:, c].mean() if nmonths else 0,
+                    'monthly_std': monthly[:, c].std() if nmonths else 0,
+                    'budget': category_budget[:, c].sum(),
+                    'variance': spent[:, c].sum() - category_budget[:, c].sum(),
+                }
+                for c, column in enumerate(BUDGET_CATEGORIES)
+            ],
+        }
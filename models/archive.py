@@ -0,0 +1,457 @@
+from flask import g
+import sqlite3
+import logging
+import os
+import re
+import sys
+from datetime import date
+from urllib.parse import quote
+from models.budget import _expense_category, _employee_category
+from models.versions import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# Tables a period close moves out of the hot database: table -> SQL
+# expressions over a row (written as {row}) for the day that places it in a
+# period and for the project, budget category and amount its summary rows
+# are kept under. Payroll is booked to its employee's project and type at
+# close time, like BudgetConsumption does.
+ARCHIVED_TABLES = {
+    'expenses': {
+        'day': '{row}.date',
+        'project_id': '{row}.project_id',
+        'category': _expense_category('{row}'),
+        'amount': '{row}.amount',
+    },
+    'payroll': {
+        'day': 'COALESCE({row}.payment_date, {row}.start_date)',
+        'project_id': '(SELECT project_id FROM employees WHERE id = {row}.employee_id)',
+        'category': _employee_category('(SELECT type FROM employees WHERE id = {row}.employee_id)'),
+        'amount': '{row}.total',
+    },
+    'salaries': {
+        'day': '{row}.created_at',
+        'project_id': '{row}.project_id',
+        'category': _employee_category('{row}.employee_type'),
+        'amount': '{row}.amount',
+    },
+}
+
+# Statuses of unsettled rows, which keep a period from closing without
+# force: the API defaults to 'pending', the UI stores 'معلق'
+PENDING_STATUSES = ('pending', 'معلق')
+
+# Triggers that keep summaries (dashboard stats, rollups, project budgets)
+# and the transactions ledger current. They are suspended while a close
+# deletes the archived rows, so the totals keep counting them; the search
+# index triggers still run and drop the rows from search.
+SUMMARY_TRIGGER_PREFIXES = ('stats_', 'rollups_', 'budget_', 'ledger_')
+
+# Archives ATTACHed to one connection at most. SQLite allows 10 attached
+# databases by default; closing a year folds its closed months into one file,
+# and source() reads ranges spanning more archives in batches.
+MAX_ATTACHED_ARCHIVES = 8
+
+# Archive files live next to the main database, in this subdirectory
+ARCHIVE_SUBDIR = 'archive'
+
+ARCHIVE_SCHEMA_PREFIX = 'archive_'
+
+_PERIOD = re.compile(r'(\d{4})(?:-(0[1-9]|1[0-2]))?')
+
+def period_range(period):
+    """[start, end) of a 'YYYY' or 'YYYY-MM' period, as prefixes that
+    compare correctly against 'YYYY-MM-DD' dates and timestamps
+
+    Both bounds carry a month: a bare '2025' would get the NUMERIC affinity
+    of DATE columns and compare as an integer.
+    """
+    match = _PERIOD.fullmatch(period or '')
+    if not match:
+        raise ValueError('period must be YYYY or YYYY-MM')
+    year = int(match[1])
+    if match[2] is None:
+        return f'{year:04d}-01', f'{year + 1:04d}-01'
+    month = int(match[2])
+    return period, f'{year + month // 12:04d}-{month % 12 + 1:02d}'
+
+def _in_range(day):
+    return f'{day} >= ? AND {day} < ?'
+
+def _uri(path, readonly=True):
+    uri = 'file:' + quote(os.path.abspath(path))
+    # Archives never change once written, so readers skip locking entirely
+    return uri + '?mode=ro&immutable=1' if readonly else uri
+
+def _schema(period):
+    return ARCHIVE_SCHEMA_PREFIX + period.replace('-', '_')
+
+def _archive_dir(db):
+    main = next(row[2] for row in db.execute('PRAGMA database_list') if row[1] == 'main')
+    return os.path.join(os.path.dirname(main), ARCHIVE_SUBDIR)
+
+def _columns(db, table, schema='main'):
+    return [row[1] for row in db.execute(f'PRAGMA {schema}.table_info({table})')]
+
+def _select_list(columns, present):
+    """Select `columns`, as NULL where an older archive lacks one"""
+    return ', '.join(column if column in present else f'NULL AS {column}' for column in columns)
+
+class Archives:
+    # Closing a finished month or year moves its expenses, payroll and
+    # salaries rows into src/database/archive/<period>.db and leaves summary
+    # rows behind: the stats, rollups, project budgets and ledger keep
+    # counting the archived rows, and closed_period_totals records what
+    # moved per project and budget category (BudgetConsumption.reconcile
+    # adds it back). Readers that need history get the archives ATTACHed
+    # read-only through source().
+
+    @staticmethod
+    def create_table(db):
+        """Create the closed period registry and its summary rows"""
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS closed_periods (
+                period TEXT PRIMARY KEY,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                file TEXT NOT NULL,
+                closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS closed_period_totals (
+                period TEXT NOT NULL,
+                ledger TEXT NOT NULL,
+                project_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                total REAL NOT NULL,
+                PRIMARY KEY (period, ledger, project_id, category)
+            );
+
+            -- Payroll is archived by payment date, so a payroll period can
+            -- sit in any archive; this records which ones hold it
+            CREATE TABLE IF NOT EXISTS closed_period_payroll (
+                period TEXT NOT NULL,
+                payroll_period TEXT NOT NULL,
+                PRIMARY KEY (payroll_period, period)
+            );
+        ''')
+        # Periods closed before the table existed: read it from their archives
+        directory = _archive_dir(db)
+        for row in db.execute('''
+            SELECT c.period, c.file FROM closed_periods c
+            WHERE EXISTS (SELECT 1 FROM closed_period_totals t
+                          WHERE t.period = c.period AND t.ledger = 'payroll')
+              AND NOT EXISTS (SELECT 1 FROM closed_period_payroll p WHERE p.period = c.period)
+        ''').fetchall():
+            archive = sqlite3.connect(_uri(os.path.join(directory, row[1])), uri=True)
+            try:
+                payroll_periods = archive.execute('SELECT DISTINCT period FROM payroll').fetchall()
+            finally:
+                archive.close()
+            db.executemany('INSERT OR IGNORE INTO closed_period_payroll (period, payroll_period) VALUES (?, ?)',
+                           [(row[0], payroll_period) for payroll_period, in payroll_periods])
+        db.commit()
+
+    @staticmethod
+    def close(db, period, as_of=None, force=False):
+        """Move the rows of a finished period into its archive file
+
+        The archive is written and synced while the hot database is held
+        with BEGIN IMMEDIATE, then the rows are deleted in that same
+        transaction, so no write can slip in between and a failure leaves
+        the hot database untouched. Closing a year folds the archives of its
+        closed months into the year's file. Periods with pending rows are
+        refused unless force is set.
+
+        Returns {'period', 'file', 'rows': {table: count}, 'merged': [periods]}.
+        """
+        start, end = period_range(period)
+        as_of = (as_of or date.today()).isoformat()
+        if end > as_of:
+            raise ValueError(f'{period} has not ended yet')
+
+        closed = db.execute('SELECT period, file FROM closed_periods ORDER BY period').fetchall()
+        for row in closed:
+            if period.startswith(row['period']):
+                raise ValueError(f'{period} is already closed (in {row["period"]})')
+        merged = [(row['period'], row['file']) for row in closed if row['period'].startswith(period)]
+
+        directory = _archive_dir(db)
+        os.makedirs(directory, exist_ok=True)
+        name = f'{period}.db'
+        path = os.path.join(directory, name)
+        temp_path = os.path.join(directory, f'.tmp-{name}')
+
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if not force:
+                statuses = ', '.join('?' for _ in PENDING_STATUSES)
+                pending = sum(db.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE status IN ({statuses}) AND "
+                    f"{_in_range(columns['day'].format(row=table))}", (*PENDING_STATUSES, start, end)
+                ).fetchone()[0] for table, columns in ARCHIVED_TABLES.items())
+                if pending:
+                    raise ValueError(f'{period} still has {pending} pending rows (close with force to archive them anyway)')
+
+            copied = Archives._write_archive(db, temp_path, start, end, [
+                os.path.join(directory, file) for _, file in merged
+            ])
+            os.replace(temp_path, path)
+
+            for table, columns in ARCHIVED_TABLES.items():
+                expression = {key: value.format(row=table) for key, value in columns.items()}
+                db.execute(f'''
+                    INSERT INTO closed_period_totals (period, ledger, project_id, category, row_count, total)
+                    SELECT ?, '{table}', COALESCE({expression['project_id']}, 0), {expression['category']},
+                           COUNT(*), SUM(COALESCE({expression['amount']}, 0))
+                    FROM {table} WHERE {_in_range(expression['day'])}
+                    GROUP BY 3, 4
+                ''', (period, start, end))
+            db.execute(f'''
+                INSERT INTO closed_period_payroll (period, payroll_period)
+                SELECT DISTINCT ?, period FROM payroll
+                WHERE period IS NOT NULL AND {_in_range(ARCHIVED_TABLES['payroll']['day'].format(row='payroll'))}
+            ''', (period, start, end))
+            if merged:
+                months = [month for month, _ in merged]
+                placeholders = ', '.join('?' for _ in months)
+                db.execute(f'''
+                    INSERT INTO closed_period_totals (period, ledger, project_id, category, row_count, total)
+                    SELECT ?, ledger, project_id, category, SUM(row_count), SUM(total)
+                    FROM closed_period_totals WHERE period IN ({placeholders})
+                    GROUP BY ledger, project_id, category
+                    ON CONFLICT (period, ledger, project_id, category) DO UPDATE SET
+                        row_count = row_count + excluded.row_count,
+                        total = total + excluded.total
+                ''', (period, *months))
+                db.execute(f'DELETE FROM closed_period_totals WHERE period IN ({placeholders})', months)
+                db.execute(f'''
+                    INSERT OR IGNORE INTO closed_period_payroll (period, payroll_period)
+                    SELECT ?, payroll_period FROM closed_period_payroll WHERE period IN ({placeholders})
+                ''', (period, *months))
+                db.execute(f'DELETE FROM closed_period_payroll WHERE period IN ({placeholders})', months)
+                db.execute(f'DELETE FROM closed_periods WHERE period IN ({placeholders})', months)
+
+            # Delete with the summary triggers suspended (DDL is transactional)
+            triggers = [row for row in db.execute(
+                f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                f"AND tbl_name IN ({', '.join('?' for _ in ARCHIVED_TABLES)})", tuple(ARCHIVED_TABLES)
+            ).fetchall() if row['name'].startswith(SUMMARY_TRIGGER_PREFIXES)]
+            for trigger in triggers:
+                db.execute(f'DROP TRIGGER {trigger["name"]}')
+            for table, columns in ARCHIVED_TABLES.items():
+                deleted = db.execute(f'DELETE FROM {table} WHERE {_in_range(columns["day"].format(row=table))}',
+                                     (start, end)).rowcount
+                if deleted != copied[table]:
+                    raise RuntimeError(f'{table}: archived {copied[table]} rows but deleted {deleted}')
+            for trigger in triggers:
+                db.execute(trigger['sql'])
+
+            db.execute('INSERT INTO closed_periods (period, start_date, end_date, file) VALUES (?, ?, ?, ?)',
+                       (period, start, end, name))
+            DataVersion.bump(db, *ARCHIVED_TABLES, 'closed_periods')
+            db.commit()
+        except BaseException:
+            db.rollback()
+            for leftover in (temp_path, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+        for month, file in merged:
+            try:
+                os.remove(os.path.join(directory, file))
+            except OSError:
+                logger.warning('Could not remove the archive of %s, now part of %s', month, period)
+
+        return {'period': period, 'file': name, 'rows': Archives._counts(path),
+                'merged': [month for month, _ in merged]}
+
+    @staticmethod
+    def _write_archive(db, path, start, end, merged_paths):
+        """Write the period's hot rows (and those of `merged_paths`) into a
+        new archive file with the hot schema and indexes; returns the
+        number of hot rows copied per table"""
+        if os.path.exists(path):
+            os.remove(path)
+        main_path = next(row[2] for row in db.execute('PRAGMA database_list') if row[1] == 'main')
+        archive = sqlite3.connect(path, uri=True)
+        try:
+            archive.execute('PRAGMA synchronous = FULL')
+            schema = db.execute(
+                f"SELECT type, tbl_name, sql FROM sqlite_master WHERE type IN ('table', 'index') "
+                f"AND sql IS NOT NULL AND tbl_name IN ({', '.join('?' for _ in ARCHIVED_TABLES)})",
+                tuple(ARCHIVED_TABLES)
+            ).fetchall()
+            for row in schema:
+                if row[0] == 'table':
+                    archive.execute(row[2])
+
+            archive.execute('ATTACH DATABASE ? AS hot', (_uri(main_path, readonly=False),))
+            copied = {}
+            for table, columns in ARCHIVED_TABLES.items():
+                day = columns['day'].format(row=f'hot.{table}')
+                copied[table] = archive.execute(
+                    f'INSERT INTO main.{table} SELECT * FROM hot.{table} WHERE {_in_range(day)}', (start, end)
+                ).rowcount
+            archive.commit()
+            archive.execute('DETACH DATABASE hot')
+
+            for merged_path in merged_paths:
+                archive.execute('ATTACH DATABASE ? AS merged', (_uri(merged_path),))
+                for table in ARCHIVED_TABLES:
+                    columns = _columns(archive, table)
+                    present = set(_columns(archive, table, 'merged'))
+                    archive.execute(f'INSERT INTO main.{table} ({", ".join(columns)}) '
+                                    f'SELECT {_select_list(columns, present)} FROM merged.{table}')
+                archive.commit()
+                archive.execute('DETACH DATABASE merged')
+
+            for row in schema:
+                if row[0] == 'index':
+                    archive.execute(row[2])
+            archive.commit()
+        finally:
+            archive.close()
+        return copied
+
+    @staticmethod
+    def _counts(path):
+        """Rows per table in an archive file"""
+        archive = sqlite3.connect(_uri(path), uri=True)
+        try:
+            return {table: archive.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    for table in ARCHIVED_TABLES}
+        finally:
+            archive.close()
+
+    @staticmethod
+    def get_all(db):
+        """Closed periods with their summary rows per ledger"""
+        periods = [dict(row) for row in db.execute('SELECT * FROM closed_periods ORDER BY period')]
+        totals = {}
+        for row in db.execute('''
+            SELECT period, ledger, SUM(row_count) AS row_count, SUM(total) AS total
+            FROM closed_period_totals GROUP BY period, ledger
+        '''):
+            totals.setdefault(row['period'], {})[row['ledger']] = {'row_count': row['row_count'], 'total': row['total']}
+        for period in periods:
+            period['totals'] = totals.get(period['period'], {})
+        return periods
+
+    @staticmethod
+    def covering(db, start=None, end=None):
+        """(period, file) of the closed periods overlapping start..end
+        (inclusive dates; None leaves that side open)"""
+        return [tuple(row) for row in db.execute('''
+            SELECT period, file FROM closed_periods
+            WHERE (:start IS NULL OR end_date > :start) AND (:end IS NULL OR start_date <= :end)
+            ORDER BY period
+        ''', {'start': start, 'end': end})]
+
+    @staticmethod
+    def attach(db, periods):
+        """ATTACH the archives of `periods` ((period, file) pairs) read-only,
+        reusing those the connection already has; returns their schema names
+
+        Pooled connections keep their archives attached between requests;
+        ones not needed now are detached only to stay within the limit.
+        """
+        if len(periods) > MAX_ATTACHED_ARCHIVES:
+            raise ValueError(f'The requested range spans {len(periods)} closed periods; '
+                             f'at most {MAX_ATTACHED_ARCHIVES} can be read at once')
+        wanted = {_schema(period): file for period, file in periods}
+        attached = [row[1] for row in db.execute('PRAGMA database_list')
+                    if row[1].startswith(ARCHIVE_SCHEMA_PREFIX)]
+        missing = [schema for schema in wanted if schema not in attached]
+        spare = [schema for schema in attached if schema not in wanted]
+        for schema in spare[:max(len(attached) + len(missing) - MAX_ATTACHED_ARCHIVES, 0)]:
+            db.execute(f'DETACH DATABASE {schema}')
+        directory = _archive_dir(db)
+        for schema in missing:
+            db.execute(f'ATTACH DATABASE ? AS {schema}', (_uri(os.path.join(directory, wanted[schema])),))
+        return list(wanted)
+
+    @staticmethod
+    def holding_payroll(db, payroll_period):
+        """(period, file) of the closed periods whose archives hold payroll
+        records of `payroll_period`, wherever they were paid"""
+        return [tuple(row) for row in db.execute('''
+            SELECT c.period, c.file FROM closed_period_payroll p
+            JOIN closed_periods c ON c.period = p.period
+            WHERE p.payroll_period = ?
+            ORDER BY c.period
+        ''', (payroll_period,))]
+
+    @staticmethod
+    def source(db, table, start=None, end=None, periods=None):
+        """What to select `table` FROM to include archived rows of start..end
+        (or of the given (period, file) pairs)
+
+        The table name itself when no closed period is involved (the common
+        case costs one lookup in closed_periods); otherwise a UNION ALL
+        subquery over the hot table and the ATTACHed archives. When more
+        archives are involved than can be attached at once, their rows in
+        the range are copied into a temp table in batches instead.
+        """
+        if periods is None:
+            periods = Archives.covering(db, start, end)
+        if not periods:
+            return table
+        columns = _columns(db, table)
+        parts = [f'SELECT {", ".join(columns)} FROM main.{table}']
+        if len(periods) <= MAX_ATTACHED_ARCHIVES:
+            for schema in Archives.attach(db, periods):
+                present = set(_columns(db, table, schema))
+                parts.append(f'SELECT {_select_list(columns, present)} FROM {schema}.{table}')
+        else:
+            parts.append(f'SELECT {", ".join(columns)} FROM {Archives._gather(db, table, periods, start, end)}')
+        return '(' + ' UNION ALL '.join(parts) + ')'
+
+    @staticmethod
+    def _gather(db, table, periods, start=None, end=None):
+        """Copy the archived rows of start..end (inclusive dates) from
+        `periods` into temp.archived_<table>, MAX_ATTACHED_ARCHIVES archives
+        at a time; returns the temp table's name"""
+        temp = f'temp.archived_{table}'
+        columns = _columns(db, table)
+        day = ARCHIVED_TABLES[table]['day'].format(row=table)
+        where, params = [], []
+        if start:
+            where.append(f'{day} >= ?')
+            params.append(start)
+        if end:
+            # end is a date; timestamps on that day still belong to it
+            where.append(f'substr({day}, 1, 10) <= ?')
+            params.append(end)
+        clause = ('WHERE ' + ' AND '.join(where)) if where else ''
+
+        db.execute(f'DROP TABLE IF EXISTS {temp}')
+        db.execute(f'CREATE TEMP TABLE archived_{table} AS SELECT {", ".join(columns)} FROM main.{table} WHERE 0')
+        for first in range(0, len(periods), MAX_ATTACHED_ARCHIVES):
+            # ATTACH cannot run inside a transaction, so commit each batch
+            for schema in Archives.attach(db, periods[first:first + MAX_ATTACHED_ARCHIVES]):
+                present = set(_columns(db, table, schema))
+                db.execute(f'INSERT INTO {temp} SELECT {_select_list(columns, present)} '
+                           f'FROM {schema}.{table} AS {table} {clause}', params)
+            db.commit()
+        return temp
+
+if __name__ == '__main__':
+    # python -m models.archive PERIOD [path/to/app.db] [--force]
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    if not args:
+        sys.exit('usage: python -m models.archive PERIOD [path/to/app.db] [--force]')
+    connection = sqlite3.connect(args[1] if len(args) > 1 else 'src/database/app.db', uri=True)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA busy_timeout = 5000')
+    Archives.create_table(connection)
+    try:
+        result = Archives.close(connection, args[0], force='--force' in sys.argv)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"Closed {result['period']} into {result['file']}:",
+          ', '.join(f'{count} {table}' for table, count in result['rows'].items()))
+    if result['merged']:
+        print('Folded in:', ', '.join(result['merged']))
@@ -0,0 +1,162 @@
+"""Static asset pipeline
+
+    python -m models.assets
+
+Copies static/ into static/dist/. Stylesheets, scripts and icons get
+content-hashed names (styles.3f2a9c1b04de.css) and the pages' references
+to them are rewritten to /assets/<hashed name>. Every file is also written
+pre-compressed as .gz, plus .br when the optional brotli package is
+installed. Hashed assets are served with a one-year immutable
+Cache-Control; pages keep their URLs and are revalidated by ETag.
+
+The app runs this at startup whenever the sources changed since the last
+build (manifest.json records their fingerprint).
+"""
+from flask import send_file, abort
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+from models.compression import available_encodings, compress, negotiate
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'dist')
+ASSET_URL = '/assets/'
+
+# Extensions that get content-hashed names; pages (.html) keep theirs
+HASHED_EXTENSIONS = ('.css', '.js', '.ico')
+PAGE_EXTENSION = '.html'
+
+# One year, the longest max-age caches honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Suffix of each pre-compressed variant
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+_REFERENCE = re.compile(r'''(\b(?:href|src)=["'])(?:/static/|/)?([\w.-]+)(["'])''')
+
+_TEMPORARY_PREFIX = '.tmp-'
+
+_manifest = None
+
+def _write(path, data):
+    """Write atomically so concurrent workers never serve a partial file"""
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=_TEMPORARY_PREFIX)
+    with os.fdopen(descriptor, 'wb') as output:
+        output.write(data)
+    os.replace(temporary, path)
+
+def _write_variants(target, name, data):
+    _write(os.path.join(target, name), data)
+    for encoding in available_encodings():
+        _write(os.path.join(target, name + ENCODING_SUFFIXES[encoding]), compress(data, encoding, level=9))
+
+def _sources(source):
+    return sorted(name for name in os.listdir(source)
+                  if os.path.isfile(os.path.join(source, name))
+                  and name.endswith(HASHED_EXTENSIONS + (PAGE_EXTENSION,)))
+
+def fingerprint(source=STATIC_DIR):
+    """Hash of every source file (and the available encodings)"""
+    digest = hashlib.sha256(repr(available_encodings()).encode('ascii'))
+    for name in _sources(source):
+        digest.update(name.encode('utf-8'))
+        with open(os.path.join(source, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def build(source=STATIC_DIR, target=BUILD_DIR):
+    """Hash, rewrite and pre-compress the assets, returns the manifest"""
+    os.makedirs(target, exist_ok=True)
+    assets = {}
+    pages = []
+    for name in _sources(source):
+        with open(os.path.join(source, name), 'rb') as f:
+            data = f.read()
+        if name.endswith(PAGE_EXTENSION):
+            pages.append((name, data))
+            continue
+        stem, extension = os.path.splitext(name)
+        hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        _write_variants(target, hashed, data)
+        assets[name] = hashed
+
+    def rewrite(match):
+        hashed = assets.get(match.group(2))
+        if hashed is None:
+            return match.group(0)
+        return f'{match.group(1)}{ASSET_URL}{hashed}{match.group(3)}'
+
+    for name, data in pages:
+        html = _REFERENCE.sub(rewrite, data.decode('utf-8'))
+        _write_variants(target, name, html.encode('utf-8'))
+
+    manifest = {'fingerprint': fingerprint(source), 'assets': assets,
+                'pages': [name for name, _ in pages]}
+    _write(os.path.join(target, 'manifest.json'), json.dumps(manifest, indent=2).encode('utf-8'))
+
+    # Drop assets of earlier builds
+    keep = {'manifest.json', *assets.values(), *manifest['pages']}
+    for name in os.listdir(target):
+        if name.startswith(_TEMPORARY_PREFIX):
+            continue
+        if name.endswith(tuple(ENCODING_SUFFIXES.values())):
+            base = os.path.splitext(name)[0]
+        else:
+            base = name
+        if base not in keep:
+            os.remove(os.path.join(target, name))
+    return manifest
+
+def load(source=STATIC_DIR, target=BUILD_DIR):
+    """The current manifest, rebuilding first if the sources changed"""
+    global _manifest
+    try:
+        with open(os.path.join(target, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None or manifest.get('fingerprint') != fingerprint(source):
+        manifest = build(source, target)
+    _manifest = manifest
+    return manifest
+
+def _send(name, mimetype, max_age=None):
+    """send_file of the best pre-compressed variant of a built file
+    (no-cache without a max_age)"""
+    path = os.path.abspath(os.path.join(BUILD_DIR, name))
+    encoding = negotiate([encoding for encoding in available_encodings()
+                          if os.path.exists(path + ENCODING_SUFFIXES[encoding])])
+    if encoding:
+        path += ENCODING_SUFFIXES[encoding]
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=max_age)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def send_page(name):
+    """Serve a built page, revalidated on every load"""
+    if _manifest is None:
+        load()
+    if name not in _manifest['pages']:
+        abort(404)
+    return _send(name, 'text/html')
+
+def send_asset(name):
+    """Serve a content-hashed asset with an immutable Cache-Control"""
+    if _manifest is None:
+        load()
+    if name not in _manifest['assets'].values():
+        abort(404)
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = _send(name, mimetype, IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+if __name__ == '__main__':
+    manifest = build()
+    for name, hashed in manifest['assets'].items():
+        print(f'{name} -> {hashed}')
@@ -0,0 +1,274 @@
+from flask import g
+import sqlite3
+import logging
+import threading
+from models.reports import BUDGET_CATEGORIES
+from models.versions import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# Expense categories (as used by payroll.html / transactions.html) mapped to
+# budget_breakdown columns; anything else counts against 'other'.
+EXPENSE_BUDGET_CATEGORIES = {
+    'معدات': 'equipment',
+    'إيجار استوديو': 'locations',
+    'مواقع': 'locations',
+    'تسويق': 'marketing',
+}
+
+# Employee types paid from artists_salaries; every other type is technical_crew
+ARTIST_TYPES = ('ممثل', 'مساعد ممثل')
+
+# Differences below this are rounding noise, not drift
+DRIFT_TOLERANCE = 0.005
+
+def _expense_category(row):
+    cases = ' '.join(f"WHEN '{name}' THEN '{column}'" for name, column in EXPENSE_BUDGET_CATEGORIES.items())
+    return f"CASE {row}.category {cases} ELSE 'other' END"
+
+def _employee_category(employee_type):
+    types = ', '.join(f"'{name}'" for name in ARTIST_TYPES)
+    return f"CASE WHEN {employee_type} IN ({types}) THEN 'artists_salaries' ELSE 'technical_crew' END"
+
+# (table, project_id, budget category, amount, columns whose change matters)
+# as SQL expressions over a NEW/OLD row written as {row}
+SOURCES = (
+    ('expenses', '{row}.project_id', _expense_category('{row}'), '{row}.amount',
+     ('project_id', 'category', 'amount')),
+    ('payroll', '(SELECT project_id FROM employees WHERE id = {row}.employee_id)',
+     _employee_category('(SELECT type FROM employees WHERE id = {row}.employee_id)'),
+     '{row}.total', ('employee_id', 'total')),
+)
+
+class BudgetConsumption:
+    # projects.spent_amount and project_consumption (spent per budget
+    # category) are kept current by triggers on expenses and payroll, in the
+    # same transaction as Expense.save, Payroll.save and the delete paths.
+    # Moving an employee to another project or type carries their payroll
+    # along. reconcile() recomputes everything from the ledgers and repairs
+    # any drift left by writes that bypass the triggers.
+
+    @staticmethod
+    def create_table(db):
+        """Create project_consumption and the triggers that maintain it"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='project_consumption'"
+        ).fetchone()
+
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS project_consumption (
+                project_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                spent REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (project_id, category),
+                FOREIGN KEY (project_id) REFERENCES projects (id)
+            );
+        ''')
+        for source in SOURCES:
+            db.executescript(BudgetConsumption._trigger_sql(*source))
+        db.executescript(BudgetConsumption._employee_trigger_sql())
+
+        if not exists:
+            BudgetConsumption.reconcile(db)
+        db.commit()
+
+    @staticmethod
+    def _trigger_sql(table, project_id, category, amount, watched):
+        """Build the insert/update/delete triggers for one source table"""
+
+        def apply(row, sign):
+            project = project_id.format(row=row)
+            return f'''
+                UPDATE projects SET spent_amount = COALESCE(spent_amount, 0) {sign} COALESCE({amount.format(row=row)}, 0)
+                WHERE id = {project};
+                INSERT INTO project_consumption (project_id, category, spent)
+                SELECT {project}, {category.format(row=row)}, {sign}COALESCE({amount.format(row=row)}, 0)
+                WHERE {project} IS NOT NULL
+                ON CONFLICT (project_id, category) DO UPDATE SET spent = spent + excluded.spent;
+            '''
+
+        changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in watched)
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS budget_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                {apply('NEW', '+')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS budget_{table}_update AFTER UPDATE ON {table}
+            WHEN {changed}
+            BEGIN
+                {apply('OLD', '-')}
+                {apply('NEW', '+')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS budget_{table}_delete AFTER DELETE ON {table}
+            BEGIN
+                {apply('OLD', '-')}
+            END;
+        '''
+
+    @staticmethod
+    def _employee_trigger_sql():
+        """Move an employee's payroll totals when their project or type changes"""
+
+        def apply(row, sign):
+            return f'''
+                UPDATE projects SET spent_amount = COALESCE(spent_amount, 0) {sign} (
+                    SELECT COALESCE(SUM(total), 0) FROM payroll WHERE employee_id = {row}.id)
+                WHERE id = {row}.project_id;
+                INSERT INTO project_consumption (project_id, category, spent)
+                SELECT {row}.project_id, {_employee_category(f'{row}.type')}, {sign}(
+                    SELECT COALESCE(SUM(total), 0) FROM payroll WHERE employee_id = {row}.id)
+                WHERE {row}.project_id IS NOT NULL
+                ON CONFLICT (project_id, category) DO UPDATE SET spent = spent + excluded.spent;
+            '''
+
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS budget_employees_update AFTER UPDATE ON employees
+            WHEN OLD.project_id IS NOT NEW.project_id OR OLD.type IS NOT NEW.type
+            BEGIN
+                {apply('OLD', '-')}
+                {apply('NEW', '+')}
+            END;
+        '''
+
+    @staticmethod
+    def _expected(db):
+        """Recompute {(project_id, category): spent} from the ledgers plus
+        the summary rows of archived periods (see models.archive)"""
+        cursor = db.execute(f'''
+            SELECT project_id, category, SUM(amount) FROM (
+                SELECT project_id, {_expense_category('expenses')} AS category, amount
+                FROM expenses WHERE project_id IS NOT NULL
+                UNION ALL
+                SELECT e.project_id, {_employee_category('e.type')} AS category, p.total
+                FROM payroll p JOIN employees e ON e.id = p.employee_id
+                WHERE e.project_id IS NOT NULL
+                UNION ALL
+                SELECT project_id, category, total FROM closed_period_totals
+                WHERE ledger IN ('expenses', 'payroll') AND project_id != 0
+            )
+            GROUP BY project_id, category
+        ''')
+        return {(row[0], row[1]): row[2] or 0 for row in cursor.fetchall()}
+
+    @staticmethod
+    def _drift(db):
+        """(drift entries, expected per (project, category), expected per project)"""
+        expected = BudgetConsumption._expected(db)
+        stored = {(row[0], row[1]): row[2] for row in
+                  db.execute('SELECT project_id, category, spent FROM project_consumption').fetchall()}
+
+        drift = []
+        for key in sorted(set(expected) | set(stored), key=str):
+            want, have = expected.get(key, 0), stored.get(key, 0)
+            if abs(want - have) > DRIFT_TOLERANCE:
+                drift.append({'project_id': key[0], 'category': key[1], 'expected': want, 'stored': have})
+
+        totals = {}
+        for (project, _), spent in expected.items():
+            totals[project] = totals.get(project, 0) + spent
+        for project_id, spent_amount in db.execute('SELECT id, spent_amount FROM projects').fetchall():
+            want = totals.get(project_id, 0)
+            if abs(want - (spent_amount or 0)) > DRIFT_TOLERANCE:
+                drift.append({'project_id': project_id, 'category': 'spent_amount',
+                              'expected': want, 'stored': spent_amount})
+        return drift, expected, totals
+
+    @staticmethod
+    def reconcile(db, repair=True):
+        """Compare the maintained totals with a full recomputation
+
+        Returns a list of drift entries. The full scan runs in a read
+        transaction, which does not block writers. Only when it finds drift
+        to repair is the write lock taken (BEGIN IMMEDIATE), and the check
+        repeated under it, so no write can slip in before the repair.
+        """
+        if not db.in_transaction:
+            db.execute('BEGIN')  # one consistent snapshot for the scan
+            try:
+                drift, _, _ = BudgetConsumption._drift(db)
+            finally:
+                db.rollback()
+            if not (repair and drift):
+                return drift
+            db.execute('BEGIN IMMEDIATE')
+        try:
+            drift, expected, totals = BudgetConsumption._drift(db)
+            if repair and drift:
+                db.execute('DELETE FROM project_consumption')
+                db.executemany(
+                    'INSERT INTO project_consumption (project_id, category, spent) VALUES (?, ?, ?)',
+                    [(project, category, spent) for (project, category), spent in expected.items()]
+                )
+                db.executemany('UPDATE projects SET spent_amount = ? WHERE id = ?',
+                               [(totals.get(item['project_id'], 0), item['project_id'])
+                                for item in drift if item['category'] == 'spent_amount'])
+                DataVersion.bump(db, 'projects')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return drift
+
+    @staticmethod
+    def get(db, project_id=None):
+        """Budget vs actual per project and budget category"""
+        where = 'WHERE p.id = ?' if project_id else ''
+        params = (project_id,) if project_id else ()
+        budgets = ', '.join(f'COALESCE(b.{column}, 0) AS {column}' for column in BUDGET_CATEGORIES)
+        projects = db.execute(f'''
+            SELECT p.id, p.name, p.status, p.total_budget, p.spent_amount, {budgets}
+            FROM projects p LEFT JOIN budget_breakdown b ON b.project_id = p.id
+            {where} ORDER BY p.id
+        ''', params).fetchall()
+
+        consumption = {}
+        cursor = db.execute(
+            f"SELECT project_id, category, spent FROM project_consumption {'WHERE project_id = ?' if project_id else ''}",
+            params
+        )
+        for row in cursor.fetchall():
+            consumption.setdefault(row[0], {})[row[1]] = row[2]
+
+        result = []
+        for project in projects:
+            spent = consumption.get(project['id'], {})
+            result.append({
+                'project_id': project['id'],
+                'name': project['name'],
+                'status': project['status'],
+                'total_budget': project['total_budget'],
+                'spent_amount': project['spent_amount'] or 0,
+                'remaining': project['total_budget'] - (project['spent_amount'] or 0),
+                'categories': {
+                    column: {'budget': project[column], 'spent': spent.get(column, 0),
+                             'remaining': project[column] - spent.get(column, 0)}
+                    for column in BUDGET_CATEGORIES
+                }
+            })
+        return result
+
+def start_reconciler(pool, interval):
+    """Run reconcile() every `interval` seconds on a daemon thread
+
+    Every process that calls this runs its own scan, so enable it in one
+    process rather than in every gunicorn worker.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            db = pool.acquire()
+            try:
+                drift = BudgetConsumption.reconcile(db)
+                if drift:
+                    logger.warning('Repaired budget drift: %s', drift)
+            except Exception:
+                logger.exception('Budget reconciliation failed')
+            finally:
+                pool.release(db)
+
+    thread = threading.Thread(target=run, name='budget-reconciler', daemon=True)
+    thread.start()
+    return stop
@@ -0,0 +1,75 @@
+from flask import request
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# API responses smaller than this are sent as is
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+# Response types worth compressing (JSON lists, CSV exports)
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+
+def available_encodings():
+    """Content codings this process can produce, preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate(encodings):
+    """Best of `encodings` the client accepts (None for identity)"""
+    for encoding in encodings:
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+def compress(data, encoding, level=COMPRESS_LEVEL):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def _gzip_chunks(chunks, level):
+    """gzip a streamed body, flushing after every chunk so the client can
+    start parsing before the stream ends"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def compress_response(response):
+    """after_request hook compressing large JSON/CSV API responses with the
+    best coding the client accepts. Streamed bodies are gzipped chunk by
+    chunk. The ETag becomes weak since the bytes now depend on the coding."""
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES or response.direct_passthrough):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if response.is_streamed:
+        if not negotiate(('gzip',)):
+            return response
+        response.response = _gzip_chunks(response.response, COMPRESS_LEVEL)
+        encoding = 'gzip'
+    else:
+        data = response.get_data()
+        encoding = negotiate(available_encodings())
+        if len(data) < COMPRESS_MIN_SIZE or not encoding:
+            return response
+        response.set_data(compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
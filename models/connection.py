@@ -0,0 +1,93 @@
+from flask import g
+import sqlite3
+import os
+import queue
+import threading
+from models.metrics import InstrumentedConnection, METRICS_ENABLED
+
+# Applied to every new connection. journal_mode=WAL is persistent in the
+# database file; the others are per connection.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', '5000'),
+    ('cache_size', '-65536'),       # 64 MiB page cache
+    ('mmap_size', '268435456'),     # 256 MiB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+)
+
+# Size of sqlite3's per-connection prepared statement LRU. Because pooled
+# connections outlive the request, the cache is reused across requests.
+CACHED_STATEMENTS = 256
+
+class ConnectionPool:
+    """Per-process pool of configured SQLite connections
+
+    gunicorn forks its workers, so the pool remembers the pid it was filled
+    in and drops (without closing) connections inherited from a parent.
+    """
+
+    def __init__(self, database, size=8):
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Open a new connection with the pool's pragmas applied"""
+        # uri=True lets closed period archives be ATTACHed read-only by URI
+        db = sqlite3.connect(self.database, check_same_thread=False, uri=True,
+                             cached_statements=CACHED_STATEMENTS,
+                             factory=InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection)
+        db.row_factory = sqlite3.Row
+        for name, value in PRAGMAS:
+            db.execute(f'PRAGMA {name} = {value}')
+        return db
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue(maxsize=self.size)
+                    self._pid = os.getpid()
+
+    def acquire(self):
+        """Get an idle connection, or open one if none is available"""
+        self._check_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, db):
+        """Return a connection to the pool, rolling back anything left open"""
+        self._check_fork()
+        try:
+            if db.in_transaction:
+                db.rollback()
+            self._idle.put_nowait(db)
+        except (queue.Full, sqlite3.Error):
+            db.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(database, size=8):
+    """Get the process-wide pool for a database path"""
+    database = os.path.abspath(database)
+    pool = _pools.get(database)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(database)
+            if pool is None:
+                pool = _pools[database] = ConnectionPool(database, size)
+    return pool
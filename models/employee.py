@@ -1,9 +1,33 @@
 from flask import g
 import sqlite3
+from models.pagination import list_page, list_page_json
+from models.group_commit import run_write
+from models.updates import update_row, delete_row
+from models.versions import DataVersion
 
 class Employee:
+    COLUMNS = ('id', 'name', 'type', 'project_id', 'salary', 'payment_type', 'phone',
+               'id_number', 'start_date', 'notes', 'created_at', 'version')
+    FILTERS = {
+        'project_id': 'project_id = ?',
+        'type': 'type = ?',
+        'payment_type': 'payment_type = ?',
+        'from': 'start_date >= ?',
+        'to': 'start_date <= ?',
+    }
+    ORDER = ('name', False, False)
+    # Columns a PATCH may set, with the converter applied to non-null values
+    UPDATABLE = {
+        'name': None, 'type': None, 'project_id': None, 'salary': float, 'payment_type': None,
+        'phone': None, 'id_number': None, 'start_date': None, 'notes': None,
+    }
+
+    # Instances are built per row on bulk imports; no per-instance __dict__
+    __slots__ = ('id', 'name', 'type', 'project_id', 'salary', 'payment_type', 'phone',
+                 'id_number', 'start_date', 'notes', 'version')
+
     def __init__(self, id=None, name=None, type=None, project_id=None, salary=None, 
-                 payment_type=None, phone=None, id_number=None, start_date=None, notes=None):
+                 payment_type=None, phone=None, id_number=None, start_date=None, notes=None, version=None):
         self.id = id
         self.name = name
         self.type = type
@@ -14,6 +38,7 @@ class Employee:
         self.id_number = id_number
         self.start_date = start_date
         self.notes = notes
+        self.version = version
 
     @staticmethod
     def create_table(db):
@@ -40,31 +65,63 @@ class Employee:
         """Save employee to database"""
         if self.id:
             # Update existing employee
-            db.execute('''
+            row = db.execute('''
                 UPDATE employees 
                 SET name=?, type=?, project_id=?, salary=?, payment_type=?, 
-                    phone=?, id_number=?, start_date=?, notes=?
+                    phone=?, id_number=?, start_date=?, notes=?, version=version + 1
                 WHERE id=?
+                RETURNING version
             ''', (self.name, self.type, self.project_id, self.salary, self.payment_type,
-                  self.phone, self.id_number, self.start_date, self.notes, self.id))
+                  self.phone, self.id_number, self.start_date, self.notes, self.id)).fetchone()
+            if row is not None:
+                self.version = row[0]
+            DataVersion.bump(db, 'employees')
+            db.commit()
         else:
-            # Insert new employee
-            cursor = db.execute('''
-                INSERT INTO employees (name, type, project_id, salary, payment_type, 
-                                     phone, id_number, start_date, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (self.name, self.type, self.project_id, self.salary, self.payment_type,
-                  self.phone, self.id_number, self.start_date, self.notes))
-            self.id = cursor.lastrowid
-        db.commit()
+            # Insert new employee, batched with concurrent inserts under group commit
+            self.id = run_write(db, self._insert)
         return self
 
+    def _insert(self, db):
+        cursor = db.execute('''
+            INSERT INTO employees (name, type, project_id, salary, payment_type, 
+                                 phone, id_number, start_date, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.name, self.type, self.project_id, self.salary, self.payment_type,
+              self.phone, self.id_number, self.start_date, self.notes))
+        DataVersion.bump(db, 'employees')
+        self.version = 1  # the column default
+        return cursor.lastrowid
+
+    @staticmethod
+    def insert_many(db, employees):
+        """Insert many employees with one executemany (caller commits)"""
+        db.executemany('''
+            INSERT INTO employees (name, type, project_id, salary, payment_type, 
+                                 phone, id_number, start_date, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(e.name, e.type, e.project_id, e.salary, e.payment_type,
+               e.phone, e.id_number, e.start_date, e.notes) for e in employees])
+        DataVersion.bump(db, 'employees')
+
     @staticmethod
     def get_all(db):
         """Get all employees"""
         cursor = db.execute('SELECT * FROM employees ORDER BY name')
         return [dict(row) for row in cursor.fetchall()]
 
+    @staticmethod
+    def get_page(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of employees, returns (rows, next_cursor)"""
+        return list_page(db, 'employees', Employee.COLUMNS, Employee.ORDER, Employee.FILTERS,
+                         filters, fields, cursor, limit)
+
+    @staticmethod
+    def get_page_json(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of employees, returns (JSON body, next_cursor)"""
+        return list_page_json(db, 'employees', Employee.COLUMNS, Employee.ORDER, Employee.FILTERS,
+                              filters, fields, cursor, limit)
+
     @staticmethod
     def get_by_id(db, employee_id):
         """Get employee by ID"""
@@ -75,10 +132,24 @@ class Employee:
         return None
 
     @staticmethod
-    def delete(db, employee_id):
-        """Delete employee"""
-        db.execute('DELETE FROM employees WHERE id = ?', (employee_id,))
+    def update(db, employee_id, changes, version=None):
+        """Update only the given columns in one statement, returns the updated
+        row or None if there is none (VersionConflict if `version` is stale)"""
+        row = update_row(db, 'employees', employee_id, changes, version)
+        if row is not None and changes:
+            DataVersion.bump(db, 'employees')
+        db.commit()
+        return row
+
+    @staticmethod
+    def delete(db, employee_id, version=None):
+        """Delete employee, returns False if there is none (VersionConflict if
+        `version` is stale)"""
+        deleted = delete_row(db, 'employees', employee_id, version)
+        if deleted:
+            DataVersion.bump(db, 'employees')
         db.commit()
+        return deleted
 
     def to_dict(self):
         """Convert employee to dictionary"""
@@ -92,6 +163,7 @@ class Employee:
             'phone': self.phone,
             'id_number': self.id_number,
             'start_date': self.start_date,
-            'notes': self.notes
+            'notes': self.notes,
+            'version': self.version
         }
 
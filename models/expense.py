@@ -1,9 +1,34 @@
 from flask import g
 import sqlite3
+from models.pagination import list_page, list_page_json
+from models.group_commit import run_write
+from models.updates import update_row, delete_row
+from models.versions import DataVersion
 
 class Expense:
+    COLUMNS = ('id', 'category', 'project_id', 'description', 'amount', 'date', 'vendor',
+               'receipt', 'payment_method', 'status', 'notes', 'created_at', 'version')
+    FILTERS = {
+        'project_id': 'project_id = ?',
+        'category': 'category = ?',
+        'status': 'status = ?',
+        'payment_method': 'payment_method = ?',
+        'from': 'date >= ?',
+        'to': 'date <= ?',
+    }
+    ORDER = ('date', True, False)
+    # Columns a PATCH may set, with the converter applied to non-null values
+    UPDATABLE = {
+        'category': None, 'project_id': None, 'description': None, 'amount': float, 'date': None,
+        'vendor': None, 'receipt': None, 'payment_method': None, 'status': None, 'notes': None,
+    }
+
+    # Instances are built per row on bulk imports; no per-instance __dict__
+    __slots__ = ('id', 'category', 'project_id', 'description', 'amount', 'date', 'vendor',
+                 'receipt', 'payment_method', 'status', 'notes', 'version')
+
     def __init__(self, id=None, category=None, project_id=None, description=None, amount=None,
-                 date=None, vendor=None, receipt=None, payment_method=None, status='pending', notes=None):
+                 date=None, vendor=None, receipt=None, payment_method=None, status='pending', notes=None, version=None):
         self.id = id
         self.category = category
         self.project_id = project_id
@@ -15,6 +40,7 @@ class Expense:
         self.payment_method = payment_method
         self.status = status
         self.notes = notes
+        self.version = version
 
     @staticmethod
     def create_table(db):
@@ -42,31 +68,63 @@ class Expense:
         """Save expense to database"""
         if self.id:
             # Update existing expense
-            db.execute('''
+            row = db.execute('''
                 UPDATE expenses 
                 SET category=?, project_id=?, description=?, amount=?, date=?, 
-                    vendor=?, receipt=?, payment_method=?, status=?, notes=?
+                    vendor=?, receipt=?, payment_method=?, status=?, notes=?, version=version + 1
                 WHERE id=?
+                RETURNING version
             ''', (self.category, self.project_id, self.description, self.amount, self.date,
-                  self.vendor, self.receipt, self.payment_method, self.status, self.notes, self.id))
+                  self.vendor, self.receipt, self.payment_method, self.status, self.notes, self.id)).fetchone()
+            if row is not None:
+                self.version = row[0]
+            DataVersion.bump(db, 'expenses')
+            db.commit()
         else:
-            # Insert new expense
-            cursor = db.execute('''
-                INSERT INTO expenses (category, project_id, description, amount, date, 
-                                    vendor, receipt, payment_method, status, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (self.category, self.project_id, self.description, self.amount, self.date,
-                  self.vendor, self.receipt, self.payment_method, self.status, self.notes))
-            self.id = cursor.lastrowid
-        db.commit()
+            # Insert new expense, batched with concurrent inserts under group commit
+            self.id = run_write(db, self._insert)
         return self
 
+    def _insert(self, db):
+        cursor = db.execute('''
+            INSERT INTO expenses (category, project_id, description, amount, date, 
+                                vendor, receipt, payment_method, status, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.category, self.project_id, self.description, self.amount, self.date,
+              self.vendor, self.receipt, self.payment_method, self.status, self.notes))
+        DataVersion.bump(db, 'expenses')
+        self.version = 1  # the column default
+        return cursor.lastrowid
+
+    @staticmethod
+    def insert_many(db, expenses):
+        """Insert many expenses with one executemany (caller commits)"""
+        db.executemany('''
+            INSERT INTO expenses (category, project_id, description, amount, date, 
+                                vendor, receipt, payment_method, status, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(e.category, e.project_id, e.description, e.amount, e.date,
+               e.vendor, e.receipt, e.payment_method, e.status, e.notes) for e in expenses])
+        DataVersion.bump(db, 'expenses')
+
     @staticmethod
     def get_all(db):
         """Get all expenses"""
         cursor = db.execute('SELECT * FROM expenses ORDER BY date DESC')
         return [dict(row) for row in cursor.fetchall()]
 
+    @staticmethod
+    def get_page(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of expenses, returns (rows, next_cursor)"""
+        return list_page(db, 'expenses', Expense.COLUMNS, Expense.ORDER, Expense.FILTERS,
+                         filters, fields, cursor, limit)
+
+    @staticmethod
+    def get_page_json(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of expenses, returns (JSON body, next_cursor)"""
+        return list_page_json(db, 'expenses', Expense.COLUMNS, Expense.ORDER, Expense.FILTERS,
+                              filters, fields, cursor, limit)
+
     @staticmethod
     def get_by_id(db, expense_id):
         """Get expense by ID"""
@@ -89,10 +147,24 @@ class Expense:
         return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
-    def delete(db, expense_id):
-        """Delete expense"""
-        db.execute('DELETE FROM expenses WHERE id = ?', (expense_id,))
+    def update(db, expense_id, changes, version=None):
+        """Update only the given columns in one statement, returns the updated
+        row or None if there is none (VersionConflict if `version` is stale)"""
+        row = update_row(db, 'expenses', expense_id, changes, version)
+        if row is not None and changes:
+            DataVersion.bump(db, 'expenses')
+        db.commit()
+        return row
+
+    @staticmethod
+    def delete(db, expense_id, version=None):
+        """Delete expense, returns False if there is none (VersionConflict if
+        `version` is stale)"""
+        deleted = delete_row(db, 'expenses', expense_id, version)
+        if deleted:
+            DataVersion.bump(db, 'expenses')
         db.commit()
+        return deleted
 
     def to_dict(self):
         """Convert expense to dictionary"""
@@ -107,6 +179,7 @@ class Expense:
             'receipt': self.receipt,
             'payment_method': self.payment_method,
             'status': self.status,
-            'notes': self.notes
+            'notes': self.notes,
+            'version': self.version
         }
 
@@ -0,0 +1,174 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: with GROUP_COMMIT=1 single-row inserts go through one writer
+# thread per process, which commits them in batches
+GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT', '0') == '1'
+
+# How long the writer keeps collecting after the first write of a batch.
+# With the default 0 a batch is whatever queued up while the previous
+# commit ran, which needs no tuning and adds no latency when idle.
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 0))
+
+# Writes committed together at most
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 256))
+
+# Seconds a caller waits for its batch before giving up with
+# GroupCommitTimeout, so a stuck writer cannot hang request threads
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 30))
+
+# The writer commits with synchronous=FULL, so a write is only acknowledged
+# once it survives power loss; the fsync is paid once per batch
+GROUP_COMMIT_SYNCHRONOUS = os.environ.get('GROUP_COMMIT_SYNCHRONOUS', 'FULL')
+
+class GroupCommitTimeout(Exception):
+    """Raised when a write's batch was not committed within GROUP_COMMIT_TIMEOUT"""
+
+class _Job:
+    __slots__ = ('write', 'done', 'result', 'error', 'abandoned')
+
+    def __init__(self, write):
+        self.write = write
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+class GroupCommitWriter:
+    """Single writer thread committing queued writes in batches
+
+    A write is a callable taking a connection that runs its statements
+    without committing and returns a result (e.g. the new row id). Each
+    runs in its own savepoint, so one failing write is rolled back alone
+    and its exception is raised to its caller; the rest of the batch still
+    commits. Like ConnectionPool, the thread and queue are per process and
+    are recreated after a fork; a writer thread that died is restarted.
+    """
+
+    def __init__(self, pool, window=GROUP_COMMIT_WINDOW_MS / 1000, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, write, timeout=GROUP_COMMIT_TIMEOUT):
+        """Queue `write` and wait until the batch holding it is committed;
+        returns its result or raises its exception
+
+        Raises GroupCommitTimeout after `timeout` seconds. A write that has
+        not started by then is skipped; one already running may still commit.
+        """
+        self._ensure_running()
+        job = _Job(write)
+        self._queue.put(job)
+        if not job.done.wait(timeout):
+            job.abandoned = True
+            raise GroupCommitTimeout(f'write not committed within {timeout:g} s')
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _connect(self):
+        db = self.pool.connect()
+        db.execute(f'PRAGMA synchronous = {GROUP_COMMIT_SYNCHRONOUS}')
+        return db
+
+    def _collect(self):
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(jobs) < self.max_batch:
+            try:
+                jobs.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                jobs.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return jobs
+
+    def _commit(self, db, jobs):
+        db.execute('BEGIN IMMEDIATE')
+        for job in jobs:
+            if job.abandoned:
+                continue
+            db.execute('SAVEPOINT group_commit_write')
+            try:
+                job.result = job.write(db)
+            except BaseException as e:
+                job.error = e
+                db.execute('ROLLBACK TO group_commit_write')
+            db.execute('RELEASE group_commit_write')
+        db.commit()
+
+    def _run(self):
+        db = None
+        while True:
+            jobs = self._collect()
+            try:
+                if db is None:
+                    db = self._connect()
+                self._commit(db, jobs)
+            except BaseException as e:
+                # The batch as a whole failed (busy timeout, disk full...):
+                # nothing was committed, so every caller gets the error.
+                # Anything is caught so the thread survives to serve later writes.
+                logger.exception('Group commit of %d writes failed', len(jobs))
+                for job in jobs:
+                    job.result = None
+                    job.error = job.error or e
+                try:
+                    db.rollback()
+                except Exception:
+                    if db is not None:
+                        db.close()
+                    db = None
+            finally:
+                for job in jobs:
+                    job.done.set()
+
+_writer = None
+
+def start_writer(pool):
+    """Send run_write() calls through a group-commit writer on `pool`'s
+    database (the thread starts with the first write)"""
+    global _writer
+    _writer = GroupCommitWriter(pool)
+    return _writer
+
+def run_write(db, write):
+    """Run write(connection) and commit it, returning its result
+
+    With group commit on, the write runs on the writer's connection and this
+    returns once its batch is committed. Otherwise, or when `db` already has
+    uncommitted changes the write must commit with, it runs on `db`.
+    """
+    if _writer is None or db.in_transaction:
+        result = write(db)
+        db.commit()
+        return result
+    return _writer.submit(write)
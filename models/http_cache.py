@@ -0,0 +1,111 @@
+from flask import g, request, make_response
+import sqlite3
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from models.versions import DataVersion
+
+# Serialized bodies kept per process, and the largest body worth keeping
+HTTP_CACHE_SIZE = int(os.environ.get('HTTP_CACHE_SIZE', 256))
+HTTP_CACHE_MAX_BODY = int(os.environ.get('HTTP_CACHE_MAX_BODY', 1024 * 1024))
+
+# Response headers replayed from the cache along with the body
+CACHED_HEADERS = ('Content-Type', 'X-Next-Cursor')
+
+class ResponseCache:
+    # LRU of serialized 200 responses keyed by ETag. An ETag covers the
+    # request path, query string and the DataVersion counters of every table
+    # the endpoint reads, so a write simply makes old entries unreachable.
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag):
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is not None:
+                self._entries.move_to_end(etag)
+            return entry
+
+    def put(self, etag, entry):
+        with self._lock:
+            self._entries[etag] = entry
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+response_cache = ResponseCache(HTTP_CACHE_SIZE)
+
+def _get_db():
+    db = g.get('_database')
+    if not db:
+        from main import get_db
+        db = get_db()
+    return db
+
+def make_etag(path, versions):
+    """Strong ETag for a request path and its tables' data versions"""
+    payload = json.dumps([path, versions], sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+def _not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def conditional_get(*tables, daily=False):
+    """Serve a GET endpoint with a strong ETag derived from the data versions
+    of `tables`, answering If-None-Match with 304 and repeat reads from the
+    in-process body cache (X-Cache: hit, or miss when the view ran).
+    Checking freshness costs one primary-key lookup on data_versions
+    instead of the endpoint's own queries.
+
+    Stack it below login_required so cached bodies are never served to
+    anonymous requests. Pass daily=True for endpoints whose body depends on
+    today's date, so the ETag also changes at midnight."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = DataVersion.get(_get_db(), *tables)
+            if daily:
+                versions['today'] = date.today().isoformat()
+            etag = make_etag(request.full_path, versions)
+            # Weak match: compress_response() weakens the ETag of gzipped bodies
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+
+            entry = response_cache.get(etag)
+            if entry is not None:
+                body, headers = entry
+                response = make_response(body, 200)
+                response.headers.update(headers)
+                response.headers['X-Cache'] = 'hit'
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.headers['X-Cache'] = 'miss'
+                # Streamed lists get the ETag too, but are too big to keep
+                body = None if response.is_streamed else response.get_data()
+                if body is not None and len(body) <= HTTP_CACHE_MAX_BODY:
+                    headers = {name: response.headers[name] for name in CACHED_HEADERS
+                               if name in response.headers}
+                    response_cache.put(etag, (body, headers))
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,49 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Flask's JSON provider with orjson as the encoder and decoder when it is
+    # installed, falling back to the standard json module otherwise. Output
+    # matches the default provider: sorted keys, dates as HTTP dates (through
+    # default()), two-space indent when pretty-printing, trailing newline on
+    # responses. Responses are encoded straight to bytes.
+
+    def _encode(self, obj, pretty=False, newline=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if newline:
+            option |= orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        # Explicit json.dumps arguments (indent, separators, ...) need the stdlib
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._encode(obj).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits and the like
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        try:
+            body = self._encode(obj, pretty, newline=True)
+        except orjson.JSONEncodeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
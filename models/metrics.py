@@ -0,0 +1,342 @@
+from flask import request
+import sqlite3
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Pooled connections are instrumented unless METRICS=0
+METRICS_ENABLED = os.environ.get('METRICS', '1') != '0'
+
+# Statements taking at least this long (execute plus fetches) are logged
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+
+# Stack sampling period in milliseconds; 0 leaves the profiler off
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 0))
+
+# Distinct stacks kept by the profiler before new ones are lumped together
+PROFILE_MAX_STACKS = 10000
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Route label for requests that matched no URL rule (keeps label cardinality bounded)
+UNMATCHED_ROUTE = 'unmatched'
+
+class RequestMetrics:
+    # What one request spent: filled in by the middleware and the
+    # instrumented connection while the request is being served
+    __slots__ = ('method', 'route', 'status', 'sql_time', 'queries', 'rows', 'bytes', 'slow_queries')
+
+    def __init__(self, method):
+        self.method = method
+        self.route = UNMATCHED_ROUTE
+        self.status = '500'
+        self.sql_time = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        self.slow_queries = 0
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+def current_metrics():
+    """RequestMetrics of the request being served in this context, if any"""
+    return _current.get()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Adds statement time (execute and every fetch, since SQLite steps
+    # lazily), query and row counts to the current request, and logs slow
+    # statements once each
+    _sql = None
+    _elapsed = 0.0
+    _logged = False
+
+    def _start(self, sql):
+        self._sql = sql
+        self._elapsed = 0.0
+        self._logged = False
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.queries += 1
+        return metrics
+
+    def _add(self, elapsed, metrics, rows):
+        self._elapsed += elapsed
+        if metrics is not None:
+            metrics.sql_time += elapsed
+            metrics.rows += rows
+        if not self._logged and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            self._logged = True
+            if metrics is not None:
+                metrics.slow_queries += 1
+            logger.warning('Slow query (%.0f ms) on %s: %s', self._elapsed * 1000,
+                           metrics.route if metrics is not None else '-', ' '.join(str(self._sql).split()))
+
+    def execute(self, sql, parameters=()):
+        metrics = self._start(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start, metrics, 0)
+
+    def executemany(self, sql, parameters):
+        metrics = self._start(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start, metrics, 0)
+
+    def executescript(self, script):
+        metrics = self._start(script)
+        start = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            self._add(time.perf_counter() - start, metrics, 0)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start, _current.get(), row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - start, _current.get(), len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start, _current.get(), len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - start, _current.get(), 0)
+            raise
+        self._add(time.perf_counter() - start, _current.get(), 1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    # sqlite3.Connection whose cursors are InstrumentedCursor. The execute
+    # shortcuts are redefined because the C versions bypass cursor().
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.sql_time += time.perf_counter() - start
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsRegistry:
+    # Per-process totals by (method, route, status), rendered in the
+    # Prometheus text format. Under gunicorn every worker keeps its own;
+    # the scraper sees whichever worker answered, so scrape each worker or
+    # sum over the pid label.
+
+    COUNTERS = (
+        ('sql_duration_seconds_total', 'sql_time', 'Time spent in SQLite statements and commits'),
+        ('sql_queries_total', 'queries', 'SQL statements executed'),
+        ('sql_rows_total', 'rows', 'Rows fetched from SQLite'),
+        ('sql_slow_queries_total', 'slow_queries', f'Statements slower than {SLOW_QUERY_MS:g} ms'),
+        ('http_response_bytes_total', 'bytes', 'Response body bytes sent'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, metrics, wall_time):
+        key = (metrics.method, metrics.route, metrics.status)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'count': 0, 'wall_time': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+                    **{attribute: 0 for _, attribute, _ in self.COUNTERS},
+                }
+            series['count'] += 1
+            series['wall_time'] += wall_time
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if wall_time <= bound:
+                    series['buckets'][i] += 1
+            for _, attribute, _ in self.COUNTERS:
+                series[attribute] += getattr(metrics, attribute)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            series = {key: {**value, 'buckets': list(value['buckets'])} for key, value in self._series.items()}
+
+        pid = os.getpid()
+        lines = []
+
+        def labels(key, **extra):
+            method, route, status = key
+            pairs = {'method': method, 'route': route, 'status': status, 'pid': pid, **extra}
+            return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs.items()) + '}'
+
+        lines += ['# HELP http_requests_total Requests served',
+                  '# TYPE http_requests_total counter']
+        lines += [f'http_requests_total{labels(key)} {value["count"]}' for key, value in series.items()]
+
+        lines += ['# HELP http_request_duration_seconds Wall time until the response body was sent',
+                  '# TYPE http_request_duration_seconds histogram']
+        for key, value in series.items():
+            for bound, count in zip(DURATION_BUCKETS, value['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{labels(key, le=f"{bound:g}")} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{labels(key, le="+Inf")} {value["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{labels(key)} {value["wall_time"]}')
+            lines.append(f'http_request_duration_seconds_count{labels(key)} {value["count"]}')
+
+        for name, attribute, description in self.COUNTERS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            lines += [f'{name}{labels(key)} {value[attribute]}' for key, value in series.items()]
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class StackSampler:
+    # Opt-in statistical profiler: a daemon thread snapshots the stacks of
+    # threads serving a request every interval and counts them in the
+    # folded format flame graph tools read ("route;file:function;... N").
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, metrics in list(self.active.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(f'{metrics.method} {metrics.route}')
+                key = ';'.join(reversed(stack))
+                if key not in self.stacks and len(self.stacks) >= PROFILE_MAX_STACKS:
+                    key = '[other]'
+                self.stacks[key] += 1
+
+    def folded(self, reset=False):
+        with self._lock:
+            text = ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+            if reset:
+                self.stacks.clear()
+        return text
+
+sampler = StackSampler(PROFILE_INTERVAL_MS / 1000) if PROFILE_INTERVAL_MS > 0 else None
+
+class _ResponseBody:
+    # The app's response iterable, counting bytes; the request is recorded
+    # when the server closes it, after the last byte (streamed or not)
+
+    def __init__(self, iterable, metrics, start, ident):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._metrics = metrics
+        self._start = start
+        self._ident = ident
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._iterator)
+        self._metrics.bytes += len(chunk)
+        return chunk
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            _finish(self._metrics, self._start, self._ident)
+
+def _finish(metrics, start, ident):
+    registry.observe(metrics, time.perf_counter() - start)
+    if sampler is not None:
+        sampler.active.pop(ident, None)
+    if _current.get() is metrics:
+        _current.set(None)
+
+class MetricsMiddleware:
+    """WSGI middleware timing each request from the first byte in to the
+    last byte out, so session loading, streamed bodies and compression are
+    included"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        metrics = RequestMetrics(environ.get('REQUEST_METHOD', 'GET'))
+        _current.set(metrics)
+        ident = threading.get_ident()
+        if sampler is not None:
+            sampler.active[ident] = metrics
+        start = time.perf_counter()
+
+        def _start_response(status, headers, exc_info=None):
+            metrics.status = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        try:
+            iterable = self.wsgi_app(environ, _start_response)
+        except BaseException:
+            _finish(metrics, start, ident)
+            raise
+        return _ResponseBody(iterable, metrics, start, ident)
+
+def label_request():
+    """before_request hook naming the current request by its URL rule"""
+    metrics = _current.get()
+    if metrics is not None and request.url_rule is not None:
+        metrics.route = request.url_rule.rule
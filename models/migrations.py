@@ -0,0 +1,124 @@
+from flask import g
+import sqlite3
+import sys
+
+# Versioned schema changes, applied in order on top of the tables created by
+# init_db and the model create_table methods. Never edit an applied entry;
+# append a new version instead.
+#
+# Indexes end with the sort column so that the ORDER BY of the matching query
+# is satisfied by the index; the rowid (id) is implicitly the last key, which
+# also serves the keyset pagination tie-breaker.
+MIGRATIONS = [
+    (1, 'add access path indexes', '''
+        CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+        CREATE INDEX IF NOT EXISTS idx_expenses_project_date ON expenses (project_id, date);
+        CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses (category, date);
+        CREATE INDEX IF NOT EXISTS idx_expenses_status_date ON expenses (status, date);
+        CREATE INDEX IF NOT EXISTS idx_payroll_payment_date ON payroll (payment_date);
+        CREATE INDEX IF NOT EXISTS idx_payroll_employee_payment_date ON payroll (employee_id, payment_date);
+        CREATE INDEX IF NOT EXISTS idx_payroll_status_payment_date ON payroll (status, payment_date);
+        CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (name);
+        CREATE INDEX IF NOT EXISTS idx_employees_project_name ON employees (project_id, name);
+        CREATE INDEX IF NOT EXISTS idx_projects_created_at ON projects (created_at);
+        CREATE INDEX IF NOT EXISTS idx_budget_breakdown_project ON budget_breakdown (project_id);
+        CREATE INDEX IF NOT EXISTS idx_salaries_project ON salaries (project_id);
+    '''),
+    (2, 'index payroll by employee and period', '''
+        CREATE INDEX IF NOT EXISTS idx_payroll_employee_period ON payroll (employee_id, period);
+    '''),
+    (3, 'add row versions for optimistic concurrency', '''
+        ALTER TABLE employees ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE payroll ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE expenses ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+    '''),
+]
+
+# Queries that must be answered from an index: (name, sql, params)
+HOT_QUERIES = [
+    ('Employee.get_all', 'SELECT * FROM employees ORDER BY name', ()),
+    ('Employee.get_page project_id',
+     'SELECT * FROM employees WHERE project_id = ? ORDER BY name ASC, id ASC LIMIT 101', (1,)),
+    ('Payroll.get_all', 'SELECT * FROM payroll ORDER BY payment_date DESC', ()),
+    ('Payroll.get_by_employee',
+     'SELECT * FROM payroll WHERE employee_id = ? ORDER BY payment_date DESC', (1,)),
+    ('Payroll.get_page status',
+     'SELECT * FROM payroll WHERE status = ? ORDER BY payment_date DESC, id DESC LIMIT 101', ('paid',)),
+    ('Expense.get_all', 'SELECT * FROM expenses ORDER BY date DESC', ()),
+    ('Expense.get_by_project', 'SELECT * FROM expenses WHERE project_id = ? ORDER BY date DESC', (1,)),
+    ('Expense.get_by_category', 'SELECT * FROM expenses WHERE category = ? ORDER BY date DESC', ('x',)),
+    ('Expense.get_page date range',
+     'SELECT * FROM expenses WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT 101',
+     ('2024-01-01', '2024-12-31')),
+    ('Expense.get_page next page',
+     'SELECT * FROM expenses WHERE ((date, id) < (?, ?)) ORDER BY date DESC, id DESC LIMIT 101',
+     ('2024-06-01', 1000)),
+    ('get_projects', 'SELECT * FROM projects ORDER BY created_at DESC, id DESC LIMIT 101', ()),
+]
+
+def create_table(db):
+    """Create the table that records applied schema versions"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.commit()
+
+def get_version(db):
+    """Get the current schema version (0 if no migration was applied)"""
+    create_table(db)
+    row = db.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+def run_migrations(db):
+    """Apply pending migrations in order, each in its own transaction"""
+    current = get_version(db)
+    applied = []
+    for version, name, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            # IMMEDIATE takes the write lock up front; re-check the version
+            # in case another gunicorn worker applied it meanwhile
+            db.execute('BEGIN IMMEDIATE')
+            if db.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                db.rollback()
+                continue
+            for statement in sql.split(';'):
+                if statement.strip():
+                    db.execute(statement)
+            db.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+def check_query_plans(db):
+    """Run EXPLAIN QUERY PLAN on HOT_QUERIES, return the ones not using an index"""
+    problems = []
+    for name, sql, params in HOT_QUERIES:
+        plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+        for detail in plan:
+            full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            if full_scan or 'TEMP B-TREE' in detail:
+                problems.append((name, ' | '.join(plan)))
+                break
+    return problems
+
+if __name__ == '__main__':
+    # python -m models.migrations [path/to/app.db] [--check]
+    args = [arg for arg in sys.argv[1:] if arg != '--check']
+    connection = sqlite3.connect(args[0] if args else 'src/database/app.db')
+    print('Applied versions:', run_migrations(connection) or 'none')
+    print('Schema version:', get_version(connection))
+    if '--check' in sys.argv:
+        problems = check_query_plans(connection)
+        for name, plan in problems:
+            print(f'NO INDEX: {name}: {plan}')
+        print('All hot queries use an index' if not problems else f'{len(problems)} queries need an index')
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,191 @@
+from flask import current_app, jsonify, stream_with_context
+import base64
+import json
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Rows per chunk when an unpaginated list is streamed from the cursor
+STREAM_BATCH_SIZE = 1000
+
+def encode_cursor(value, row_id):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    raw = json.dumps([value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_list_args(args, columns, filters):
+    """Parse fields/limit/cursor and filter query parameters
+
+    Raises ValueError for anything the caller should answer with a 400.
+    Pagination is opt-in: without limit or cursor the whole filtered list
+    is returned, as before.
+    """
+    fields = None
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        for field in fields:
+            if field not in columns:
+                raise ValueError(f'Unknown field: {field}')
+
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, MAX_LIMIT)
+
+    cursor = None
+    if args.get('cursor'):
+        cursor = decode_cursor(args['cursor'])
+        if limit is None:
+            limit = DEFAULT_LIMIT
+
+    filter_values = {}
+    for name in filters:
+        value = args.get(name)
+        if value is not None and value != '':
+            filter_values[name] = value
+
+    return {'fields': fields, 'limit': limit, 'cursor': cursor, 'filters': filter_values}
+
+def _keyset_clause(column, descending, nullable, value, row_id):
+    """WHERE clause selecting the rows after (value, row_id) in sort order
+
+    Uses a row-value comparison so SQLite can seek the (column) index
+    directly. SQLite sorts NULL first, so for nullable columns NULL keys
+    come last in DESC order and first in ASC order.
+    """
+    if descending:
+        if value is None:
+            return f'{column} IS NULL AND id < ?', [row_id]
+        clause = f'({column}, id) < (?, ?)'
+        return (clause + f' OR {column} IS NULL' if nullable else clause), [value, row_id]
+    if value is None:
+        return f'({column} IS NULL AND id > ?) OR {column} IS NOT NULL', [row_id]
+    return f'({column}, id) > (?, ?)', [value, row_id]
+
+def build_select(table, columns, order, filter_sql, filters=None, fields=None, cursor=None, limit=None,
+                 as_json=False):
+    """Build a filtered, projected, keyset-paginated SELECT
+
+    Returns (sql, params, selected). The id and sort columns are always
+    selected (after the requested fields) so a cursor can be built. With
+    as_json the fields come back as one json_object() column, followed by
+    id and the sort column.
+    """
+    order_column, descending, nullable = order
+    selected = list(fields or columns)
+    if as_json:
+        pairs = ', '.join(f"'{column}', {column}" for column in selected)
+        keys = [f'json_object({pairs})', 'id', order_column]
+        columns_sql = ', '.join(keys)
+    else:
+        keys = [column for column in ('id', order_column) if column not in selected]
+        columns_sql = ', '.join(selected + keys)
+
+    where = []
+    params = []
+    for name, value in (filters or {}).items():
+        where.append(filter_sql[name])
+        params.append(value)
+
+    if cursor:
+        clause, clause_params = _keyset_clause(order_column, descending, nullable, *cursor)
+        where.append(clause)
+        params.extend(clause_params)
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {columns_sql} FROM {table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(f'({clause})' for clause in where)
+    sql += f' ORDER BY {order_column} {direction}, id {direction}'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    return sql, params, selected
+
+def list_page(db, table, columns, order, filter_sql, filters=None, fields=None, cursor=None, limit=None):
+    """Run a filtered, projected, keyset-paginated SELECT
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    order_column = order[0]
+    sql, params, selected = build_select(table, columns, order, filter_sql, filters, fields, cursor, limit)
+    rows = db.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][order_column], rows[-1]['id'])
+
+    return [{column: row[column] for column in selected} for row in rows], next_cursor
+
+def _json_chunks(rows, batch):
+    """Yield a JSON array from an open cursor, STREAM_BATCH_SIZE rows per chunk"""
+    separator = b'['
+    while batch:
+        yield separator + b','.join([row[0].encode('utf-8') for row in batch])
+        separator = b','
+        batch = rows.fetchmany(STREAM_BATCH_SIZE)
+    yield b'[]' if separator == b'[' else b']'
+
+def list_page_json(db, table, columns, order, filter_sql, filters=None, fields=None, cursor=None, limit=None):
+    """list_page() serialized by SQLite: each row arrives as a json_object()
+    string in a plain tuple, so no Row or dict is built per row
+
+    Returns (body, next_cursor) with body the page as a UTF-8 JSON array.
+    An unpaginated list longer than STREAM_BATCH_SIZE rows comes back as an
+    iterator of chunks read from the still open cursor instead.
+    SQLite writes REAL values with 15 significant digits, which drops float
+    noise such as 2.4000000000000004 but is exact for currency amounts.
+    """
+    sql, params, _ = build_select(table, columns, order, filter_sql, filters, fields, cursor, limit,
+                                  as_json=True)
+    rows = db.cursor()
+    rows.row_factory = None
+    rows.execute(sql, params)
+
+    if not limit:
+        batch = rows.fetchmany(STREAM_BATCH_SIZE)
+        if len(batch) < STREAM_BATCH_SIZE:
+            return b''.join(_json_chunks(rows, batch)), None
+        return _json_chunks(rows, batch), None
+
+    # Iterate instead of fetchall() so only the encoded rows are kept
+    body = []
+    last = next_cursor = None
+    for row in rows:
+        if len(body) == limit:
+            next_cursor = encode_cursor(last[2], last[1])
+            break
+        body.append(row[0].encode('utf-8'))
+        last = row
+
+    return b'[' + b','.join(body) + b']', next_cursor
+
+def paginated_response(rows, next_cursor):
+    """JSON list response carrying the next page cursor in X-Next-Cursor
+
+    rows is a list to serialize or the JSON body from list_page_json(),
+    which is streamed when it is an iterator of chunks.
+    """
+    if isinstance(rows, bytes):
+        response = current_app.response_class(rows, mimetype='application/json')
+    elif not isinstance(rows, list):
+        response = current_app.response_class(stream_with_context(rows), mimetype='application/json')
+    else:
+        response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
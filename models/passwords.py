@@ -0,0 +1,126 @@
+from werkzeug.security import generate_password_hash, check_password_hash
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+# Stored hashes made with any other method are upgraded on the next login.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+# Processes doing KDF work, and how many verifications may wait for them
+LOGIN_WORKERS = int(os.environ.get('LOGIN_WORKERS', 2))
+LOGIN_QUEUE_LIMIT = int(os.environ.get('LOGIN_QUEUE_LIMIT', 16))
+LOGIN_TIMEOUT = float(os.environ.get('LOGIN_TIMEOUT', 10))
+
+# Attempts allowed per username within the window (a success clears them)
+LOGIN_MAX_ATTEMPTS = int(os.environ.get('LOGIN_MAX_ATTEMPTS', 5))
+LOGIN_WINDOW = int(os.environ.get('LOGIN_WINDOW', 300))
+
+class LoginBusy(Exception):
+    """Raised when the hashing pool's queue is full or it does not answer in time"""
+
+class HashPool:
+    # Bounded process pool for password hashing, so the KDF neither holds
+    # the GIL of the request process nor runs unbounded during login bursts.
+    # Recreated after fork, like ConnectionPool, and after a worker dies,
+    # which leaves a ProcessPoolExecutor broken for good.
+
+    def __init__(self, workers, queue_limit):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, function, *args):
+        """Submit to the current pool, returns (executor, future)"""
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(function, *args)
+        except BrokenProcessPool:
+            # Broken by an earlier task: start over with a fresh pool
+            self._discard(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(function, *args)
+
+    def run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise LoginBusy()
+        try:
+            executor, future = self._submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the task is done, not just until the caller
+        # stops waiting, so LOGIN_QUEUE_LIMIT bounds the work in the pool
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=LOGIN_TIMEOUT)
+        except TimeoutError:
+            raise LoginBusy()
+        except BrokenProcessPool:
+            # A worker died while running it; later calls get a new pool
+            self._discard(executor)
+            raise LoginBusy()
+
+hash_pool = HashPool(LOGIN_WORKERS, LOGIN_QUEUE_LIMIT)
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    return hash_pool.run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+def verify_password(stored_hash, password):
+    """Check a password against its stored hash in the hashing pool"""
+    return hash_pool.run(check_password_hash, stored_hash, password)
+
+def needs_rehash(stored_hash):
+    """Whether a stored hash was made with other parameters than the configured ones"""
+    return stored_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+class LoginRateLimiter:
+    # Sliding window of login attempts per username, checked before any
+    # hashing so brute-force attempts cannot occupy the pool.
+
+    def __init__(self, max_attempts, window):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def hit(self, username):
+        """Record an attempt; returns seconds to wait if over the limit, else 0"""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.setdefault(username, deque())
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            if len(attempts) >= self.max_attempts:
+                return int(attempts[0] + self.window - now) + 1
+            attempts.append(now)
+            # Drop idle usernames now and then so the dict stays small
+            if len(self._attempts) > 10000:
+                self._attempts = {name: times for name, times in self._attempts.items()
+                                  if times and times[-1] > now - self.window}
+            return 0
+
+    def reset(self, username):
+        with self._lock:
+            self._attempts.pop(username, None)
+
+login_limiter = LoginRateLimiter(LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW)
@@ -1,10 +1,41 @@
 from flask import g
 import sqlite3
+from models.pagination import list_page, list_page_json
+from models.group_commit import run_write
+from models.updates import update_row, delete_row
+from models.versions import DataVersion
+
+# Same assumptions as calculatePayrollTotal() in static/payroll.js
+MONTHLY_HOURS = 160
+OVERTIME_RATE = 1.5
 
 class Payroll:
+    COLUMNS = ('id', 'employee_id', 'period', 'start_date', 'end_date', 'base_amount', 'bonus',
+               'deductions', 'overtime', 'total', 'payment_date', 'status', 'notes', 'created_at',
+               'version')
+    FILTERS = {
+        'employee_id': 'employee_id = ?',
+        'project_id': 'employee_id IN (SELECT id FROM employees WHERE project_id = ?)',
+        'period': 'period = ?',
+        'status': 'status = ?',
+        'from': 'payment_date >= ?',
+        'to': 'payment_date <= ?',
+    }
+    ORDER = ('payment_date', True, True)
+    # Columns a PATCH may set, with the converter applied to non-null values
+    UPDATABLE = {
+        'employee_id': int, 'period': None, 'start_date': None, 'end_date': None,
+        'base_amount': float, 'bonus': float, 'deductions': float, 'overtime': float, 'total': float,
+        'payment_date': None, 'status': None, 'notes': None,
+    }
+
+    # Instances are built per row on bulk imports; no per-instance __dict__
+    __slots__ = ('id', 'employee_id', 'period', 'start_date', 'end_date', 'base_amount', 'bonus',
+                 'deductions', 'overtime', 'total', 'payment_date', 'status', 'notes', 'version')
+
     def __init__(self, id=None, employee_id=None, period=None, start_date=None, end_date=None,
                  base_amount=None, bonus=None, deductions=None, overtime=None, total=None,
-                 payment_date=None, status='pending', notes=None):
+                 payment_date=None, status='pending', notes=None, version=None):
         self.id = id
         self.employee_id = employee_id
         self.period = period
@@ -18,6 +49,7 @@ class Payroll:
         self.payment_date = payment_date
         self.status = status
         self.notes = notes
+        self.version = version
 
     @staticmethod
     def create_table(db):
@@ -47,34 +79,151 @@ class Payroll:
         """Save payroll record to database"""
         if self.id:
             # Update existing payroll record
-            db.execute('''
+            row = db.execute('''
                 UPDATE payroll 
                 SET employee_id=?, period=?, start_date=?, end_date=?, base_amount=?, 
                     bonus=?, deductions=?, overtime=?, total=?, payment_date=?, 
-                    status=?, notes=?
+                    status=?, notes=?, version=version + 1
                 WHERE id=?
+                RETURNING version
             ''', (self.employee_id, self.period, self.start_date, self.end_date, 
                   self.base_amount, self.bonus, self.deductions, self.overtime, 
-                  self.total, self.payment_date, self.status, self.notes, self.id))
+                  self.total, self.payment_date, self.status, self.notes, self.id)).fetchone()
+            if row is not None:
+                self.version = row[0]
+            DataVersion.bump(db, 'payroll')
+            db.commit()
         else:
-            # Insert new payroll record
-            cursor = db.execute('''
-                INSERT INTO payroll (employee_id, period, start_date, end_date, base_amount, 
-                                   bonus, deductions, overtime, total, payment_date, status, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (self.employee_id, self.period, self.start_date, self.end_date, 
-                  self.base_amount, self.bonus, self.deductions, self.overtime, 
-                  self.total, self.payment_date, self.status, self.notes))
-            self.id = cursor.lastrowid
-        db.commit()
+            # Insert new payroll record, batched with concurrent inserts under group commit
+            self.id = run_write(db, self._insert)
         return self
 
+    def _insert(self, db):
+        cursor = db.execute('''
+            INSERT INTO payroll (employee_id, period, start_date, end_date, base_amount, 
+                               bonus, deductions, overtime, total, payment_date, status, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.employee_id, self.period, self.start_date, self.end_date, 
+              self.base_amount, self.bonus, self.deductions, self.overtime, 
+              self.total, self.payment_date, self.status, self.notes))
+        DataVersion.bump(db, 'payroll')
+        self.version = 1  # the column default
+        return cursor.lastrowid
+
+    @staticmethod
+    def insert_many(db, records):
+        """Insert many payroll records with one executemany (caller commits)"""
+        db.executemany('''
+            INSERT INTO payroll (employee_id, period, start_date, end_date, base_amount, 
+                               bonus, deductions, overtime, total, payment_date, status, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(p.employee_id, p.period, p.start_date, p.end_date,
+               p.base_amount, p.bonus, p.deductions, p.overtime,
+               p.total, p.payment_date, p.status, p.notes) for p in records])
+        DataVersion.bump(db, 'payroll')
+
+    @staticmethod
+    def run_period(db, period, start_date, end_date, payment_date, days,
+                   project_id=None, employee_type=None, adjustments=None,
+                   hours=MONTHLY_HOURS, status='pending', notes=None):
+        """Create the payroll of every matching employee for one period
+
+        All rows are written by a single INSERT ... SELECT over employees.
+        Employees that already have a record for the period are skipped, so
+        re-running a period is safe. adjustments maps employee_id to a dict
+        with optional units, bonus, deductions and overtime (hours). Without
+        units, daily employees are paid for `days` and hourly employees for
+        `hours`; every other payment type is paid its salary once.
+
+        Returns (created, skipped, total_amount).
+        """
+        db.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS payroll_run_adjustments (
+                employee_id INTEGER PRIMARY KEY,
+                units REAL,
+                bonus REAL,
+                deductions REAL,
+                overtime REAL
+            )
+        ''')
+        db.execute('DELETE FROM temp.payroll_run_adjustments')
+        if adjustments:
+            db.executemany('''
+                INSERT INTO temp.payroll_run_adjustments (employee_id, units, bonus, deductions, overtime)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(int(employee_id), values.get('units'), values.get('bonus'),
+                   values.get('deductions'), values.get('overtime'))
+                  for employee_id, values in adjustments.items()])
+
+        where = ['1 = 1']
+        params = {'period': period, 'start_date': start_date, 'end_date': end_date,
+                  'payment_date': payment_date, 'days': days, 'hours': hours,
+                  'hourly_divisor': MONTHLY_HOURS, 'overtime_rate': OVERTIME_RATE,
+                  'status': status, 'notes': notes}
+        if project_id is not None:
+            where.append('e.project_id = :project_id')
+            params['project_id'] = project_id
+        if employee_type is not None:
+            where.append('e.type = :employee_type')
+            params['employee_type'] = employee_type
+
+        matched = db.execute(
+            f"SELECT COUNT(*) FROM employees e WHERE {' AND '.join(where)}", params
+        ).fetchone()[0]
+        last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM payroll').fetchone()[0]
+
+        cursor = db.execute(f'''
+            INSERT INTO payroll (employee_id, period, start_date, end_date, base_amount,
+                               bonus, deductions, overtime, total, payment_date, status, notes)
+            SELECT id, :period, :start_date, :end_date, base, bonus, deductions, overtime,
+                   ROUND(base + bonus + overtime * (base / :hourly_divisor) * :overtime_rate - deductions, 2),
+                   :payment_date, :status, :notes
+            FROM (
+                SELECT e.id,
+                       ROUND(e.salary * COALESCE(a.units, CASE e.payment_type
+                           WHEN 'يومي' THEN :days
+                           WHEN 'بالساعة' THEN :hours
+                           ELSE 1 END), 2) AS base,
+                       COALESCE(a.bonus, 0) AS bonus,
+                       COALESCE(a.deductions, 0) AS deductions,
+                       COALESCE(a.overtime, 0) AS overtime
+                FROM employees e
+                LEFT JOIN temp.payroll_run_adjustments a ON a.employee_id = e.id
+                WHERE {' AND '.join(where)}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM payroll p WHERE p.employee_id = e.id AND p.period = :period
+                  )
+                ORDER BY e.id
+            )
+        ''', params)
+        created = cursor.rowcount
+
+        total_amount = db.execute(
+            'SELECT COALESCE(SUM(total), 0) FROM payroll WHERE id > ? AND period = ?', (last_id, period)
+        ).fetchone()[0]
+        db.execute('DELETE FROM temp.payroll_run_adjustments')
+        DataVersion.bump(db, 'payroll')
+        db.commit()
+        return created, matched - created, total_amount
+
     @staticmethod
     def get_all(db):
         """Get all payroll records"""
         cursor = db.execute('SELECT * FROM payroll ORDER BY payment_date DESC')
         return [dict(row) for row in cursor.fetchall()]
 
+    @staticmethod
+    def get_page(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of payroll records, returns (rows, next_cursor)"""
+        return list_page(db, 'payroll', Payroll.COLUMNS, Payroll.ORDER, Payroll.FILTERS,
+                         filters, fields, cursor, limit)
+
+    @staticmethod
+    def get_page_json(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of payroll records, returns (JSON body, next_cursor)"""
+        return list_page_json(db, 'payroll', Payroll.COLUMNS, Payroll.ORDER, Payroll.FILTERS,
+                              filters, fields, cursor, limit)
+
     @staticmethod
     def get_by_id(db, payroll_id):
         """Get payroll record by ID"""
@@ -91,10 +240,24 @@ class Payroll:
         return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
-    def delete(db, payroll_id):
-        """Delete payroll record"""
-        db.execute('DELETE FROM payroll WHERE id = ?', (payroll_id,))
+    def update(db, payroll_id, changes, version=None):
+        """Update only the given columns in one statement, returns the updated
+        row or None if there is none (VersionConflict if `version` is stale)"""
+        row = update_row(db, 'payroll', payroll_id, changes, version)
+        if row is not None and changes:
+            DataVersion.bump(db, 'payroll')
+        db.commit()
+        return row
+
+    @staticmethod
+    def delete(db, payroll_id, version=None):
+        """Delete payroll record, returns False if there is none (VersionConflict if
+        `version` is stale)"""
+        deleted = delete_row(db, 'payroll', payroll_id, version)
+        if deleted:
+            DataVersion.bump(db, 'payroll')
         db.commit()
+        return deleted
 
     def to_dict(self):
         """Convert payroll record to dictionary"""
@@ -111,6 +274,7 @@ class Payroll:
             'total': self.total,
             'payment_date': self.payment_date,
             'status': self.status,
-            'notes': self.notes
+            'notes': self.notes,
+            'version': self.version
         }
 
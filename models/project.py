@@ -0,0 +1,30 @@
+from flask import g
+import sqlite3
+from models.pagination import list_page, list_page_json
+
+class Project:
+    # Projects are created in main.create_project; this holds the list/export metadata
+    COLUMNS = ('id', 'name', 'type', 'description', 'total_budget', 'spent_amount',
+               'start_date', 'end_date', 'status')
+    FILTERS = {
+        'project_id': 'id = ?',
+        'type': 'type = ?',
+        'status': 'status = ?',
+        'from': 'start_date >= ?',
+        'to': 'start_date <= ?',
+    }
+    ORDER = ('created_at', True, True)
+    # spent_amount is maintained by triggers on these (see models.budget)
+    SOURCE_TABLES = ('projects', 'expenses', 'payroll', 'employees')
+
+    @staticmethod
+    def get_page(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of projects, returns (rows, next_cursor)"""
+        return list_page(db, 'projects', Project.COLUMNS, Project.ORDER, Project.FILTERS,
+                         filters, fields, cursor, limit)
+
+    @staticmethod
+    def get_page_json(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of projects, returns (JSON body, next_cursor)"""
+        return list_page_json(db, 'projects', Project.COLUMNS, Project.ORDER, Project.FILTERS,
+                              filters, fields, cursor, limit)
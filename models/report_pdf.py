@@ -0,0 +1,222 @@
+from flask import g
+import sqlite3
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import date
+from models.reports import Reports, BUDGET_CATEGORIES
+from models.versions import DataVersion
+
+REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', 'src/database/report_cache')
+
+# Rendered PDFs kept at most; the least recently served are removed first
+REPORT_CACHE_MAX_FILES = int(os.environ.get('REPORT_CACHE_MAX_FILES', 256))
+
+# A TTF with Arabic glyphs; reportlab's built-in fonts are Latin only
+REPORT_FONT = os.environ.get('REPORT_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+BUDGET_LABELS = {
+    'artists_salaries': 'رواتب الفنانين',
+    'technical_crew': 'الطاقم الفني',
+    'equipment': 'المعدات',
+    'locations': 'المواقع',
+    'marketing': 'التسويق',
+    'other': 'أخرى',
+}
+
+TITLES = {
+    'project-budget': 'ميزانية المشاريع',
+    'payroll-period': 'كشف الرواتب',
+    'expense-by-category': 'المصروفات حسب الفئة',
+}
+
+def _shape(text):
+    """Shape and reorder Arabic text for a left-to-right PDF canvas if the
+    optional arabic_reshaper/python-bidi packages are installed"""
+    text = '' if text is None else str(text)
+    try:
+        import arabic_reshaper
+        from bidi.algorithm import get_display
+    except ImportError:
+        return text
+    return get_display(arabic_reshaper.reshape(text))
+
+def _font_name():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if 'ReportFont' in pdfmetrics.getRegisteredFontNames():
+        return 'ReportFont'
+    if os.path.exists(REPORT_FONT):
+        pdfmetrics.registerFont(TTFont('ReportFont', REPORT_FONT))
+        return 'ReportFont'
+    return 'Helvetica'
+
+def _table_rows(name, rows):
+    """Header row plus body rows for a report"""
+    if name == 'project-budget':
+        header = ['المشروع', 'الحالة', 'الميزانية', *[BUDGET_LABELS[column] for column in BUDGET_CATEGORIES], 'المصروفات', 'الرواتب', 'المتبقي']
+        body = [[row['name'], row['status'], row['total_budget'],
+                 *[row[column] for column in BUDGET_CATEGORIES],
+                 row['expenses_spent'], row['payroll_spent'],
+                 row['total_budget'] - row['expenses_spent'] - row['payroll_spent']]
+                for row in rows]
+    elif name == 'payroll-period':
+        header = ['الموظف', 'النوع', 'الأساسي', 'مكافآت', 'خصومات', 'إضافي', 'الإجمالي', 'تاريخ الدفع', 'الحالة']
+        body = [[row['name'], row['type'], row['base_amount'], row['bonus'], row['deductions'],
+                 row['overtime'], row['total'], row['payment_date'], row['status']] for row in rows]
+        body.append(['الإجمالي', '', '', '', '', '', sum(row['total'] or 0 for row in rows), '', ''])
+    else:
+        header = ['الفئة', 'العدد', 'الإجمالي']
+        body = [[row['category'], row['count'], row['total']] for row in rows]
+        body.append(['الإجمالي', sum(row['count'] for row in rows), sum(row['total'] or 0 for row in rows)])
+    return header, body
+
+_PERIOD = re.compile(r'\d{4}-(0[1-9]|1[0-2])')
+
+def _iso_date(value, label):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f'{label} must be a YYYY-MM-DD date')
+
+def _project_id(value):
+    try:
+        project_id = int(value)
+    except ValueError:
+        raise ValueError('project_id must be an integer')
+    if project_id < 1:
+        raise ValueError('project_id must be an integer')
+    return project_id
+
+def parse_report_params(name, args):
+    """Validated, normalised parameters of a report from its query string
+
+    Only these values reach the render cache's file names, so each report
+    has one cache entry per distinct request. Raises ValueError for
+    anything else.
+    """
+    params = {}
+    if name == 'payroll-period':
+        period = args.get('period')
+        if not period:
+            raise ValueError('Missing required field: period')
+        if not _PERIOD.fullmatch(period):
+            raise ValueError('period must be YYYY-MM')
+        params['period'] = period
+    if name == 'expense-by-category':
+        if args.get('from'):
+            params['start_date'] = _iso_date(args['from'], 'from')
+        if args.get('to'):
+            params['end_date'] = _iso_date(args['to'], 'to')
+    if name in ('project-budget', 'expense-by-category') and args.get('project_id'):
+        params['project_id'] = _project_id(args['project_id'])
+    return params
+
+def render_pdf(name, params, rows, output):
+    """Render report rows to a PDF file object"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    font = _font_name()
+    styles = getSampleStyleSheet()
+    styles['Title'].fontName = font
+    styles['Normal'].fontName = font
+
+    header, body = _table_rows(name, rows)
+    cells = [[_shape(value) for value in header]]
+    for row in body:
+        cells.append([_shape(f'{value:,.2f}' if isinstance(value, float) else value) for value in row])
+
+    table = Table(cells, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dc2626')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ]))
+
+    subtitle = ' | '.join(f'{key}: {value}' for key, value in sorted(params.items()) if value)
+    story = [Paragraph(_shape(TITLES[name]), styles['Title'])]
+    if subtitle:
+        story.append(Paragraph(_shape(subtitle), styles['Normal']))
+    story += [Spacer(1, 12), table]
+
+    SimpleDocTemplate(output, pagesize=landscape(A4), title=TITLES[name]).build(story)
+
+def _build_rows(db, name, params):
+    if name == 'project-budget':
+        return Reports.project_budget(db, params.get('project_id'))
+    if name == 'payroll-period':
+        return Reports.payroll_period(db, params['period'])
+    return Reports.expense_by_category(db, params.get('start_date'), params.get('end_date'),
+                                       params.get('project_id'))
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def _prune(cache_dir, keep):
+    """Remove the least recently served PDFs beyond REPORT_CACHE_MAX_FILES"""
+    files = []
+    for path in glob.glob(os.path.join(cache_dir, '*.pdf')):
+        try:
+            files.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            pass
+    files.sort(reverse=True)
+    for _, path in files[REPORT_CACHE_MAX_FILES:]:
+        if path != keep:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+def get_report_pdf(db, name, params):
+    """Path of the rendered report, rendering it only on a cache miss
+
+    params come from parse_report_params(). Files are named
+    <report>-<params hash>-<data version hash>.pdf. Any write to a table the
+    report reads bumps its DataVersion, so the next request misses,
+    re-renders and removes the stale sibling files. Serving a file touches
+    its mtime, and the cache keeps the REPORT_CACHE_MAX_FILES most recently
+    served.
+
+    Returns (path, cache_hit).
+    """
+    versions = DataVersion.get(db, *Reports.TABLES[name])
+    cache_dir = os.path.abspath(REPORT_CACHE_DIR)
+    prefix = os.path.join(cache_dir, f'{name}-{_digest(params)}')
+    path = f'{prefix}-{_digest(versions)}.pdf'
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+            return path, True
+        except FileNotFoundError:
+            pass  # pruned meanwhile, render it again
+
+    os.makedirs(cache_dir, exist_ok=True)
+    rows = _build_rows(db, name, params)
+    handle, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            render_pdf(name, params, rows, output)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+    for stale in glob.glob(f'{prefix}-*.pdf'):
+        if stale != path:
+            try:
+                os.unlink(stale)
+            except FileNotFoundError:
+                pass
+    _prune(cache_dir, path)
+    return path, False
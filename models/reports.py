@@ -0,0 +1,78 @@
+from flask import g
+import sqlite3
+
+BUDGET_CATEGORIES = ('artists_salaries', 'technical_crew', 'equipment', 'locations', 'marketing', 'other')
+PAYROLL_CATEGORIES = ('artists_salaries', 'technical_crew')
+
+class Reports:
+    # Each report lists the tables it reads so caches can key on their
+    # DataVersion counters.
+    TABLES = {
+        'project-budget': ('projects', 'budget_breakdown', 'expenses', 'payroll', 'employees'),
+        'payroll-period': ('payroll', 'employees'),
+        'expense-by-category': ('expenses',),
+    }
+
+    @staticmethod
+    def project_budget(db, project_id=None):
+        """Budget, per-category breakdown and actual spend per project"""
+        where = 'WHERE p.id = ?' if project_id else ''
+        params = (project_id,) if project_id else ()
+        breakdown = ', '.join(f'COALESCE(b.{column}, 0) AS {column}' for column in BUDGET_CATEGORIES)
+        # Spend comes from project_consumption (see models.budget): payroll is
+        # booked against the two salary categories, expenses against the rest.
+        cursor = db.execute(f'''
+            SELECT p.id, p.name, p.status, p.total_budget, {breakdown},
+                   (SELECT COALESCE(SUM(c.spent), 0) FROM project_consumption c
+                    WHERE c.project_id = p.id AND c.category NOT IN {PAYROLL_CATEGORIES}) AS expenses_spent,
+                   (SELECT COALESCE(SUM(c.spent), 0) FROM project_consumption c
+                    WHERE c.project_id = p.id AND c.category IN {PAYROLL_CATEGORIES}) AS payroll_spent
+            FROM projects p
+            LEFT JOIN budget_breakdown b ON b.project_id = p.id
+            {where}
+            ORDER BY p.name
+        ''', params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def payroll_period(db, period):
+        """Payroll records of one period with employee names"""
+        from models.archive import Archives
+
+        # Archived payroll is filed by payment date, so the archives holding
+        # the period are looked up by the period itself
+        source = Archives.source(db, 'payroll', periods=Archives.holding_payroll(db, period))
+        cursor = db.execute(f'''
+            SELECT e.name, e.type, p.base_amount, p.bonus, p.deductions, p.overtime,
+                   p.total, p.payment_date, p.status
+            FROM {source} p
+            LEFT JOIN employees e ON e.id = p.employee_id
+            WHERE p.period = ?
+            ORDER BY e.name
+        ''', (period,))
+        return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def expense_by_category(db, start_date=None, end_date=None, project_id=None):
+        """Expense count and total per category"""
+        from models.archive import Archives
+
+        where = []
+        params = []
+        if start_date:
+            where.append('date >= ?')
+            params.append(start_date)
+        if end_date:
+            where.append('date <= ?')
+            params.append(end_date)
+        if project_id:
+            where.append('project_id = ?')
+            params.append(project_id)
+        clause = ('WHERE ' + ' AND '.join(where)) if where else ''
+        cursor = db.execute(f'''
+            SELECT category, COUNT(*) AS count, SUM(amount) AS total
+            FROM {Archives.source(db, 'expenses', start_date, end_date)} {clause}
+            GROUP BY category
+            ORDER BY total DESC
+        ''', params)
+        return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,179 @@
+from flask import g
+import sqlite3
+
+# Bucket granularity -> length of the 'YYYY-MM-DD' prefix that names a bucket
+GRAINS = {'day': 10, 'month': 7, 'year': 4}
+
+_GRAINS_SQL = ' UNION ALL '.join(f"SELECT '{grain}' AS grain, {length} AS length"
+                                 for grain, length in GRAINS.items())
+
+class Rollups:
+    # Time-bucketed totals per (project, category or employee type, status)
+    # at day, month and year grain, maintained by triggers like the
+    # dashboard stats. project_id 0 and dimension '' stand for "none" so the
+    # primary key (and the upserts) work without NULLs.
+    LEDGERS = {
+        'expenses': {
+            'amount': '{row}.amount',
+            'day': '{row}.date',
+            'project_id': '{row}.project_id',
+            'dimension': '{row}.category',
+        },
+        'payroll': {
+            'amount': '{row}.total',
+            'day': 'COALESCE({row}.payment_date, {row}.start_date)',
+            'project_id': '(SELECT project_id FROM employees WHERE id = {row}.employee_id)',
+            'dimension': '(SELECT type FROM employees WHERE id = {row}.employee_id)',
+        },
+    }
+    DIMENSIONS = {'expenses': 'category', 'payroll': 'employee_type'}
+
+    @staticmethod
+    def create_table(db):
+        """Create the rollups table and the triggers that keep it current"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='rollups'"
+        ).fetchone()
+
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS rollups (
+                ledger TEXT NOT NULL,
+                grain TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                project_id INTEGER NOT NULL,
+                dimension TEXT NOT NULL,
+                status TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (ledger, grain, bucket, project_id, dimension, status)
+            );
+        ''')
+
+        for ledger, columns in Rollups.LEDGERS.items():
+            db.executescript(Rollups._trigger_sql(ledger, columns))
+        db.executescript(Rollups._employee_trigger_sql())
+
+        if not exists:
+            Rollups.rebuild(db)
+        db.commit()
+
+    @staticmethod
+    def _upsert(ledger, select):
+        return f'''
+            INSERT INTO rollups (ledger, grain, bucket, project_id, dimension, status, row_count, total)
+            {select}
+            ON CONFLICT (ledger, grain, bucket, project_id, dimension, status) DO UPDATE SET
+                row_count = row_count + excluded.row_count,
+                total = total + excluded.total;
+        '''
+
+    @staticmethod
+    def _trigger_sql(ledger, columns):
+        """Build the insert/update/delete triggers for one ledger table"""
+
+        def add(row, sign):
+            expression = {name: value.format(row=row) for name, value in columns.items()}
+            return Rollups._upsert(ledger, f'''
+                SELECT '{ledger}', grains.grain, substr({expression['day']}, 1, grains.length),
+                       COALESCE({expression['project_id']}, 0), COALESCE({expression['dimension']}, ''),
+                       COALESCE({row}.status, ''), {sign}1, {sign}COALESCE({expression['amount']}, 0)
+                FROM ({_GRAINS_SQL}) grains
+                WHERE {expression['day']} IS NOT NULL
+            ''')
+
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS rollups_{ledger}_insert AFTER INSERT ON {ledger}
+            BEGIN
+                {add('NEW', '')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS rollups_{ledger}_update AFTER UPDATE ON {ledger}
+            BEGIN
+                {add('OLD', '-')}
+                {add('NEW', '')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS rollups_{ledger}_delete AFTER DELETE ON {ledger}
+            BEGIN
+                {add('OLD', '-')}
+            END;
+        '''
+
+    @staticmethod
+    def _employee_trigger_sql():
+        """Move an employee's payroll buckets when their project or type changes"""
+        day = Rollups.LEDGERS['payroll']['day'].format(row='payroll')
+
+        def add(row, sign):
+            return Rollups._upsert('payroll', f'''
+                SELECT 'payroll', grains.grain, substr({day}, 1, grains.length),
+                       COALESCE({row}.project_id, 0), COALESCE({row}.type, ''),
+                       COALESCE(payroll.status, ''), {sign}COUNT(*), {sign}SUM(COALESCE(payroll.total, 0))
+                FROM payroll, ({_GRAINS_SQL}) grains
+                WHERE payroll.employee_id = {row}.id AND {day} IS NOT NULL
+                GROUP BY grains.grain, substr({day}, 1, grains.length), COALESCE(payroll.status, '')
+            ''')
+
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS rollups_employees_update AFTER UPDATE ON employees
+            WHEN OLD.project_id IS NOT NEW.project_id OR OLD.type IS NOT NEW.type
+            BEGIN
+                {add('OLD', '-')}
+                {add('NEW', '')}
+            END;
+        '''
+
+    @staticmethod
+    def rebuild(db):
+        """Recompute the rollups from the ledgers (one full scan each)"""
+        db.execute('DELETE FROM rollups')
+        for ledger, columns in Rollups.LEDGERS.items():
+            expression = {name: value.format(row=ledger) for name, value in columns.items()}
+            bucket = f"substr({expression['day']}, 1, grains.length)"
+            keys = (f"grains.grain, {bucket}, COALESCE({expression['project_id']}, 0), "
+                    f"COALESCE({expression['dimension']}, ''), COALESCE({ledger}.status, '')")
+            db.execute(f'''
+                INSERT INTO rollups (ledger, grain, bucket, project_id, dimension, status, row_count, total)
+                SELECT '{ledger}', {keys}, COUNT(*), SUM(COALESCE({expression['amount']}, 0))
+                FROM {ledger}, ({_GRAINS_SQL}) grains
+                WHERE {expression['day']} IS NOT NULL
+                GROUP BY {keys}
+            ''')
+
+    @staticmethod
+    def timeseries(db, ledger, grain='month', start=None, end=None, project_id=None,
+                   dimension=None, status=None, group_by=()):
+        """Totals per bucket, optionally split by project_id, dimension and/or
+        status (group_by); the dimension comes back as category or employee_type.
+
+        start/end are compared with bucket names, so '2024', '2024-03' and
+        '2024-03-15' all work at any grain.
+        """
+        where = ['ledger = ?', 'grain = ?', 'row_count != 0']
+        params = [ledger, grain]
+        if start:
+            where.append('bucket >= substr(?, 1, ?)')
+            params += [start, GRAINS[grain]]
+        if end:
+            where.append('bucket <= substr(?, 1, ?)')
+            params += [end, GRAINS[grain]]
+        if project_id is not None:
+            where.append('project_id = ?')
+            params.append(project_id)
+        if dimension is not None:
+            where.append('dimension = ?')
+            params.append(dimension)
+        if status is not None:
+            where.append('status = ?')
+            params.append(status)
+
+        columns = ['bucket', *group_by]
+        selected = [f'dimension AS {Rollups.DIMENSIONS[ledger]}' if column == 'dimension' else column
+                    for column in columns]
+        cursor = db.execute(f'''
+            SELECT {', '.join(selected)}, SUM(row_count) AS count, SUM(total) AS total
+            FROM rollups WHERE {' AND '.join(where)}
+            GROUP BY {', '.join(columns)}
+            ORDER BY {', '.join(columns)}
+        ''', params)
+        return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,142 @@
+from flask import g
+import sqlite3
+import re
+from models.pagination import DEFAULT_LIMIT, encode_cursor
+
+# Folded before indexing and querying: hamza/madda forms of alef, taa
+# marbuta, alef maqsura, hamza carriers, tatweel, harakat and Arabic-Indic
+# digits (phone and ID numbers are often typed with them).
+ARABIC_FOLDS = (
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ة', 'ه'), ('ى', 'ي'), ('ؤ', 'و'), ('ئ', 'ي'), ('ـ', ''),
+    *((chr(code), '') for code in range(0x064B, 0x0653)), ('ٰ', ''),
+    *((chr(0x0660 + digit), str(digit)) for digit in range(10)),
+)
+_FOLD_TABLE = str.maketrans({source: target for source, target in ARABIC_FOLDS})
+FOLDS_PER_QUERY = 10
+
+# unicode61 handles case and Latin diacritics; prefix indexes make 2 and 3
+# character prefix queries cheap
+TOKENIZE = "unicode61 remove_diacritics 2"
+PREFIX = '2 3'
+
+# Searchable sources: kind -> (table, indexed columns, title column, column
+# weights for bm25)
+INDEXES = {
+    'employee': ('employees', ('name', 'phone', 'id_number'), 'name', (10.0, 5.0, 5.0)),
+    'expense': ('expenses', ('vendor', 'description', 'notes'), 'description', (5.0, 10.0, 2.0)),
+    'project': ('projects', ('name', 'description'), 'name', (10.0, 2.0)),
+}
+
+def normalize(text):
+    """Python twin of the SQL folding applied by the index triggers"""
+    return (text or '').translate(_FOLD_TABLE)
+
+def _folded_select(columns, row):
+    """SELECT of id plus `columns` of `row` (NEW or a table) folded like
+    normalize(). The replace() calls are split over nested subqueries to
+    stay within SQLite's parser depth."""
+    source = 'NEW.id AS id' if row == 'NEW' else 'id'
+    from_clause = '' if row == 'NEW' else f' FROM {row}'
+    select = f"SELECT {source}, {', '.join(f'COALESCE({row}.{column}, {chr(39) * 2}) AS {column}' for column in columns)}{from_clause}"
+    for start in range(0, len(ARABIC_FOLDS), FOLDS_PER_QUERY):
+        expressions = []
+        for column in columns:
+            expression = column
+            for fold, target in ARABIC_FOLDS[start:start + FOLDS_PER_QUERY]:
+                expression = f"replace({expression}, '{fold}', '{target}')"
+            expressions.append(f'{expression} AS {column}')
+        select = f"SELECT id, {', '.join(expressions)} FROM ({select})"
+    return select
+
+def build_match(query):
+    """FTS5 MATCH expression requiring every term, each as a prefix"""
+    terms = re.findall(r'\w+', normalize(query))
+    return ' '.join(f'"{term}"*' for term in terms)
+
+class Search:
+    # One FTS5 table per source (<table>_fts, rowid = source id), holding
+    # the folded text. Triggers keep it in sync with the source table, so
+    # writes from anywhere, bulk imports included, are searchable at once.
+
+    @staticmethod
+    def create_table(db):
+        """Create the FTS tables and their sync triggers, indexing existing rows"""
+        for kind, (table, columns, _, _) in INDEXES.items():
+            fts = f'{table}_fts'
+            exists = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,)
+            ).fetchone()
+
+            column_list = ', '.join(columns)
+            db.executescript(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {column_list}, tokenize = '{TOKENIZE}', prefix = '{PREFIX}'
+                );
+
+                CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO {fts} (rowid, {column_list}) {_folded_select(columns, 'NEW')};
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE ON {table}
+                WHEN {' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)}
+                BEGIN
+                    DELETE FROM {fts} WHERE rowid = OLD.id;
+                    INSERT INTO {fts} (rowid, {column_list}) {_folded_select(columns, 'NEW')};
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+                BEGIN
+                    DELETE FROM {fts} WHERE rowid = OLD.id;
+                END;
+            ''')
+            if not exists:
+                db.execute(f'INSERT INTO {fts} (rowid, {column_list}) {_folded_select(columns, table)}')
+        db.commit()
+
+    @staticmethod
+    def search(db, query, kinds=None, cursor=None, limit=DEFAULT_LIMIT):
+        """Ranked hits for `query`, best first, returns (hits, next_cursor)
+
+        Hits are ordered by (bm25 score, kind, id); `cursor` is the decoded
+        ([score, kind], id) of the previous page's last hit.
+        """
+        match = build_match(query)
+        if not match:
+            return [], None
+
+        parts = []
+        params = []
+        for kind, (table, columns, title, weights) in INDEXES.items():
+            if kinds and kind not in kinds:
+                continue
+            parts.append(f'''
+                SELECT '{kind}' AS kind, f.rowid AS id, s.{title} AS title,
+                       bm25({table}_fts, {', '.join(str(weight) for weight in weights)}) AS score,
+                       snippet({table}_fts, -1, '[', ']', '…', 8) AS snippet
+                FROM {table}_fts f JOIN {table} s ON s.id = f.rowid
+                WHERE {table}_fts MATCH ?
+            ''')
+            params.append(match)
+        if not parts:
+            return [], None
+
+        where = ''
+        if cursor is not None:
+            (score, kind), row_id = cursor
+            where = 'WHERE (score, kind, id) > (?, ?, ?)'
+            params += [score, kind, row_id]
+
+        rows = db.execute(f'''
+            SELECT * FROM ({' UNION ALL '.join(parts)}) {where}
+            ORDER BY score, kind, id
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+
+        hits = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = hits[-1]
+            next_cursor = encode_cursor([last['score'], last['kind']], last['id'])
+        return hits, next_cursor
@@ -0,0 +1,219 @@
+from flask import g, session, jsonify
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+import sqlite3
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from models.versions import DataVersion
+
+# Seconds a session lives without activity
+SESSION_LIFETIME = int(os.environ.get('SESSION_LIFETIME', 7 * 24 * 3600))
+
+# User records kept per process
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
+class ServerSession(CallbackDict, SessionMixin):
+    # Session data held in the sessions table; the cookie carries only an
+    # opaque token whose hash is the row id.
+
+    def __init__(self, initial=None, token=None, expires_at=None, users_version=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.token = token
+        self.expires_at = expires_at
+        # 'users' data version read along with the session row
+        self.users_version = users_version
+        self.modified = False
+        self.rotated = False
+
+    def rotate(self):
+        """Issue a new token on the next save (call on login)"""
+        self.rotated = True
+        self.modified = True
+
+class SessionStore(SessionInterface):
+    # Server-side sessions in SQLite, so deleting a row (or the user) ends
+    # the session immediately instead of when a signed cookie expires.
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, get_db):
+        self.get_db = get_db
+
+    @staticmethod
+    def create_table(db):
+        """Create the sessions table and the users triggers that keep it honest"""
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                data TEXT NOT NULL,
+                expires_at INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions (user_id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
+
+            -- Any change to users, including ones made outside the app,
+            -- invalidates the cached user records in every process.
+            CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users
+            BEGIN
+                INSERT INTO data_versions (name, version) VALUES ('users', 1)
+                ON CONFLICT (name) DO UPDATE SET version = version + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE ON users
+            BEGIN
+                INSERT INTO data_versions (name, version) VALUES ('users', 1)
+                ON CONFLICT (name) DO UPDATE SET version = version + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users
+            BEGIN
+                INSERT INTO data_versions (name, version) VALUES ('users', 1)
+                ON CONFLICT (name) DO UPDATE SET version = version + 1;
+                DELETE FROM sessions WHERE user_id = OLD.id;
+            END;
+        ''')
+        db.commit()
+
+    @staticmethod
+    def _row_id(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def revoke_user(db, user_id):
+        """End every session of a user (caller commits)"""
+        db.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.get_cookie_name(app))
+        if not token:
+            return ServerSession()
+
+        # The users version rides along so user_cache can answer without
+        # a query of its own
+        row = self.get_db().execute('''
+            SELECT data, expires_at,
+                   COALESCE((SELECT version FROM data_versions WHERE name = 'users'), 0) AS users_version
+            FROM sessions WHERE id = ? AND expires_at > ?
+        ''', (self._row_id(token), int(time.time()))).fetchone()
+        if row is None:
+            return ServerSession()
+        return ServerSession(self.serializer.loads(row['data']), token, row['expires_at'],
+                             row['users_version'])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        db = self.get_db()
+        now = int(time.time())
+
+        if not session:
+            if session.token:
+                db.execute('DELETE FROM sessions WHERE id = ?', (self._row_id(session.token),))
+                db.commit()
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Extend the expiry only once half the lifetime has passed, so most
+        # requests do not write
+        refresh = session.expires_at is None or session.expires_at - now < SESSION_LIFETIME // 2
+        if not (session.modified or refresh):
+            return
+
+        if session.token and session.rotated:
+            db.execute('DELETE FROM sessions WHERE id = ?', (self._row_id(session.token),))
+            session.token = None
+        if session.token is None:
+            session.token = secrets.token_urlsafe(32)
+            # New sessions are rare enough to sweep expired ones here
+            db.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+        session.expires_at = now + SESSION_LIFETIME
+        db.execute('''
+            INSERT INTO sessions (id, user_id, data, expires_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, data = excluded.data,
+                                           expires_at = excluded.expires_at
+        ''', (self._row_id(session.token), session.get('user_id'),
+              self.serializer.dumps(dict(session)), session.expires_at))
+        db.commit()
+
+        response.set_cookie(
+            name, session.token,
+            expires=datetime.fromtimestamp(session.expires_at, timezone.utc),
+            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app)
+        )
+
+class UserCache:
+    # LRU of {id, username, role} records. Entries carry the 'users' data
+    # version they were read under and are dropped once it moves on. The
+    # current version comes with the session row, so a hit costs no query.
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db, user_id, version=None):
+        """User record by id; `version` is the current 'users' data version,
+        read here when the caller does not have it"""
+        if version is None:
+            version = DataVersion.get(db, 'users')['users']
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        row = db.execute('SELECT id, username, role FROM users WHERE id = ?', (user_id,)).fetchone()
+        user = dict(row) if row else None
+        with self._lock:
+            self._entries[user_id] = (version, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return user
+
+user_cache = UserCache(USER_CACHE_SIZE)
+
+def _get_db():
+    db = g.get('_database')
+    if not db:
+        from main import get_db
+        db = get_db()
+    return db
+
+def login_required(view=None, role=None):
+    """Require a live session whose user still exists (and has `role`)
+
+    The user record is looked up through user_cache on every request, so a
+    deleted user or changed role takes effect at once. The record is
+    available to the view as g.user.
+    """
+    if view is None:
+        return lambda view: login_required(view, role)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = session.get('user_id')
+        user = (user_cache.get(_get_db(), user_id, getattr(session, 'users_version', None))
+                if user_id is not None else None)
+        if user is None:
+            session.clear()
+            return jsonify({'error': 'Not logged in'}), 401
+        if role is not None and user['role'] != role:
+            return jsonify({'error': 'Unauthorized'}), 403
+        g.user = user
+        return view(*args, **kwargs)
+    return wrapper
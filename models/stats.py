@@ -0,0 +1,161 @@
+from flask import g
+import sqlite3
+from datetime import date
+
+class DashboardStats:
+    # Summary tables are maintained by triggers on the ledgers, so every
+    # save/delete updates the totals inside the same transaction.
+    LEDGERS = {
+        'expenses': {'amount': 'amount', 'day': 'date'},
+        'payroll': {'amount': 'total', 'day': 'payment_date'},
+        'projects': {'amount': 'total_budget', 'day': None},
+    }
+
+    @staticmethod
+    def create_table(db):
+        """Create the summary tables and the triggers that keep them current"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_totals'"
+        ).fetchone()
+
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS stats_totals (
+                ledger TEXT NOT NULL,
+                status TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (ledger, status)
+            );
+
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                ledger TEXT NOT NULL,
+                day DATE NOT NULL,
+                status TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (ledger, day, status)
+            );
+        ''')
+
+        for ledger, columns in DashboardStats.LEDGERS.items():
+            db.executescript(DashboardStats._trigger_sql(ledger, columns))
+
+        if not exists:
+            DashboardStats.rebuild(db)
+        db.commit()
+
+    @staticmethod
+    def _trigger_sql(ledger, columns):
+        """Build the insert/update/delete triggers for one ledger table"""
+        amount = columns['amount']
+
+        def add(row, sign):
+            sql = f'''
+                INSERT INTO stats_totals (ledger, status, row_count, total)
+                VALUES ('{ledger}', COALESCE({row}.status, ''), {sign}1, {sign}COALESCE({row}.{amount}, 0))
+                ON CONFLICT (ledger, status) DO UPDATE SET
+                    row_count = row_count + excluded.row_count,
+                    total = total + excluded.total;
+            '''
+            if columns['day']:
+                sql += f'''
+                INSERT INTO stats_daily (ledger, day, status, row_count, total)
+                SELECT '{ledger}', {row}.{columns['day']}, COALESCE({row}.status, ''),
+                       {sign}1, {sign}COALESCE({row}.{amount}, 0)
+                WHERE {row}.{columns['day']} IS NOT NULL
+                ON CONFLICT (ledger, day, status) DO UPDATE SET
+                    row_count = row_count + excluded.row_count,
+                    total = total + excluded.total;
+                '''
+            return sql
+
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS stats_{ledger}_insert AFTER INSERT ON {ledger}
+            BEGIN
+                {add('NEW', '')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS stats_{ledger}_update AFTER UPDATE ON {ledger}
+            BEGIN
+                {add('OLD', '-')}
+                {add('NEW', '')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS stats_{ledger}_delete AFTER DELETE ON {ledger}
+            BEGIN
+                {add('OLD', '-')}
+            END;
+        '''
+
+    @staticmethod
+    def rebuild(db):
+        """Recompute the summary tables from the ledgers (one full scan each)"""
+        db.execute('DELETE FROM stats_totals')
+        db.execute('DELETE FROM stats_daily')
+        for ledger, columns in DashboardStats.LEDGERS.items():
+            db.execute(f'''
+                INSERT INTO stats_totals (ledger, status, row_count, total)
+                SELECT '{ledger}', COALESCE(status, ''), COUNT(*), SUM(COALESCE({columns['amount']}, 0))
+                FROM {ledger} GROUP BY COALESCE(status, '')
+            ''')
+            if columns['day']:
+                db.execute(f'''
+                    INSERT INTO stats_daily (ledger, day, status, row_count, total)
+                    SELECT '{ledger}', {columns['day']}, COALESCE(status, ''), COUNT(*),
+                           SUM(COALESCE({columns['amount']}, 0))
+                    FROM {ledger} WHERE {columns['day']} IS NOT NULL
+                    GROUP BY {columns['day']}, COALESCE(status, '')
+                ''')
+
+    @staticmethod
+    def _by_status(db, ledger):
+        """Get {status: (row_count, total)} for one ledger"""
+        cursor = db.execute(
+            'SELECT status, row_count, total FROM stats_totals WHERE ledger = ? AND row_count != 0',
+            (ledger,)
+        )
+        return {row['status']: (row['row_count'], row['total']) for row in cursor.fetchall()}
+
+    @staticmethod
+    def _range_total(db, ledger, first_day, last_day):
+        """Sum a ledger between two days using the daily summary"""
+        row = db.execute(
+            'SELECT COALESCE(SUM(total), 0) FROM stats_daily WHERE ledger = ? AND day BETWEEN ? AND ?',
+            (ledger, first_day, last_day)
+        ).fetchone()
+        return row[0]
+
+    @staticmethod
+    def get(db, today=None):
+        """Get dashboard statistics from the summary tables"""
+        today = today or date.today()
+        day = today.isoformat()
+        month_start = today.replace(day=1).isoformat()
+        month_end = today.strftime('%Y-%m-31')
+
+        projects = DashboardStats._by_status(db, 'projects')
+        payroll = DashboardStats._by_status(db, 'payroll')
+        expenses = DashboardStats._by_status(db, 'expenses')
+
+        payroll_total = sum(total for _, total in payroll.values())
+        expenses_total = sum(total for _, total in expenses.values())
+
+        return {
+            'totalProjects': sum(count for count, _ in projects.values()),
+            'activeProjects': projects.get('in_progress', (0, 0))[0],
+            'totalBudget': sum(total for _, total in projects.values()),
+            'totalSpent': payroll_total + expenses_total,
+            'payroll': {
+                'count': sum(count for count, _ in payroll.values()),
+                'total': payroll_total,
+                'currentMonth': DashboardStats._range_total(db, 'payroll', month_start, month_end),
+                'byStatus': {status: total for status, (_, total) in payroll.items()}
+            },
+            'expenses': {
+                'count': sum(count for count, _ in expenses.values()),
+                'total': expenses_total,
+                'today': DashboardStats._range_total(db, 'expenses', day, day),
+                'currentMonth': DashboardStats._range_total(db, 'expenses', month_start, month_end),
+                'byStatus': {status: total for status, (_, total) in expenses.items()}
+            }
+        }
@@ -0,0 +1,158 @@
+from flask import g
+import sqlite3
+from models.pagination import list_page, list_page_json
+from models.versions import DataVersion
+
+# Ledger sources fed by triggers: (source, table, project_id, category,
+# description, amount, date) as SQL expressions over NEW/OLD rows (written
+# as {row}).
+SOURCES = (
+    ('expense', 'expenses', '{row}.project_id', '{row}.category', '{row}.description',
+     '{row}.amount', '{row}.date'),
+    ('payroll', 'payroll', '(SELECT project_id FROM employees WHERE id = {row}.employee_id)',
+     "'رواتب'", "'رواتب ' || {row}.period", '{row}.total',
+     "COALESCE({row}.payment_date, {row}.start_date, date('now'))"),
+    ('salary', 'salaries', '{row}.project_id', "'رواتب'", '{row}.employee_name',
+     '{row}.amount', "date(COALESCE({row}.created_at, 'now'))"),
+)
+
+class Transaction:
+    # Append-only ledger of income and expense entries. Source rows are never
+    # edited in place: a change appends a reversing entry and a new entry,
+    # and both the replaced entry and its reversal are marked voided.
+    COLUMNS = ('id', 'type', 'source', 'source_id', 'project_id', 'category', 'description',
+               'amount', 'date', 'voided', 'reverses', 'created_at')
+    FILTERS = {
+        'project_id': 'project_id = ?',
+        'type': 'type = ?',
+        'source': 'source = ?',
+        'category': 'category = ?',
+        'voided': 'voided = ?',
+        'from': 'date >= ?',
+        'to': 'date <= ?',
+    }
+    ORDER = ('date', True, False)
+    # Tables whose writes change the ledger, for cache versioning
+    SOURCE_TABLES = ('transactions', 'expenses', 'payroll', 'salaries')
+
+    @staticmethod
+    def create_table(db):
+        """Create the ledger table, its indexes and the triggers that feed it"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions'"
+        ).fetchone()
+
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                source TEXT NOT NULL,
+                source_id INTEGER,
+                project_id INTEGER,
+                category TEXT,
+                description TEXT,
+                amount REAL NOT NULL,
+                date DATE NOT NULL,
+                voided INTEGER NOT NULL DEFAULT 0,
+                reverses INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (project_id) REFERENCES projects (id)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_transactions_project_date_type
+                ON transactions (project_id, date, type);
+            CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);
+            CREATE INDEX IF NOT EXISTS idx_transactions_source
+                ON transactions (source, source_id) WHERE voided = 0;
+        ''')
+
+        for source in SOURCES:
+            db.executescript(Transaction._trigger_sql(*source))
+
+        if not exists:
+            for source, table, *columns in SOURCES:
+                values = ', '.join(column.format(row=table) for column in columns)
+                db.execute(f'''
+                    INSERT INTO transactions (type, source, source_id, project_id, category,
+                                              description, amount, date)
+                    SELECT 'expense', '{source}', {table}.id, {values} FROM {table}
+                ''')
+        db.commit()
+
+    @staticmethod
+    def _trigger_sql(source, table, project_id, category, description, amount, day):
+        """Build the insert/update/delete triggers for one source table"""
+        columns = (project_id, category, description, amount, day)
+
+        def append(row):
+            values = ', '.join(column.format(row=row) for column in columns)
+            return f'''
+                INSERT INTO transactions (type, source, source_id, project_id, category,
+                                          description, amount, date)
+                VALUES ('expense', '{source}', {row}.id, {values});
+            '''
+
+        reverse = f'''
+                INSERT INTO transactions (type, source, source_id, project_id, category,
+                                          description, amount, date, voided, reverses)
+                SELECT type, source, source_id, project_id, category, description, -amount,
+                       date, 1, id
+                FROM transactions
+                WHERE source = '{source}' AND source_id = OLD.id AND voided = 0;
+                UPDATE transactions SET voided = 1
+                WHERE source = '{source}' AND source_id = OLD.id AND voided = 0 AND reverses IS NULL;
+        '''
+        changed = ' OR '.join(
+            f'({column.format(row="OLD")}) IS NOT ({column.format(row="NEW")})' for column in columns
+        )
+
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS ledger_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                {append('NEW')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS ledger_{table}_update AFTER UPDATE ON {table}
+            WHEN {changed}
+            BEGIN
+                {reverse}
+                {append('NEW')}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS ledger_{table}_delete AFTER DELETE ON {table}
+            BEGIN
+                {reverse}
+            END;
+        '''
+
+    @staticmethod
+    def add_income(db, amount, date, project_id=None, category=None, description=None):
+        """Append an income entry to the ledger"""
+        cursor = db.execute('''
+            INSERT INTO transactions (type, source, project_id, category, description, amount, date)
+            VALUES ('income', 'income', ?, ?, ?, ?, ?)
+        ''', (project_id, category, description, amount, date))
+        DataVersion.bump(db, 'transactions')
+        db.commit()
+        return Transaction.get_by_id(db, cursor.lastrowid)
+
+    @staticmethod
+    def get_by_id(db, transaction_id):
+        """Get ledger entry by ID"""
+        cursor = db.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,))
+        row = cursor.fetchone()
+        if row:
+            return dict(row)
+        return None
+
+    @staticmethod
+    def get_page(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of ledger entries, returns (rows, next_cursor)"""
+        return list_page(db, 'transactions', Transaction.COLUMNS, Transaction.ORDER,
+                         Transaction.FILTERS, filters, fields, cursor, limit)
+
+    @staticmethod
+    def get_page_json(db, filters=None, fields=None, cursor=None, limit=None):
+        """Get a filtered page of ledger entries, returns (JSON body, next_cursor)"""
+        return list_page_json(db, 'transactions', Transaction.COLUMNS, Transaction.ORDER,
+                              Transaction.FILTERS, filters, fields, cursor, limit)
@@ -0,0 +1,88 @@
+import sqlite3
+
+class VersionConflict(Exception):
+    """The row changed since the client read it; carries the current row"""
+
+    def __init__(self, current):
+        super().__init__('Row was modified by another request')
+        self.current = current
+
+def parse_changes(data, fields):
+    """Pick the updatable columns present in a request body
+
+    `fields` maps column -> converter (None keeps the value as sent).
+    Returns (changes, version), where version is the row version the client
+    based its edit on, or None for a last-write-wins update. Raises
+    ValueError for anything the caller should answer with a 400.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    changes = {}
+    for column, convert in fields.items():
+        if column in data:
+            value = data[column]
+            changes[column] = convert(value) if convert and value is not None else value
+    return changes, parse_version(data.get('version'))
+
+def parse_version(value):
+    """Row version from a body field or query parameter (None if absent)"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('version must be an integer')
+
+def _check_conflict(db, table, row_id, version):
+    """After a write matched no row: raise VersionConflict if the row exists
+    (so only the version check failed), else return None for a 404"""
+    if version is None:
+        return None
+    row = db.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,)).fetchone()
+    if row is not None:
+        raise VersionConflict(dict(row))
+    return None
+
+def update_row(db, table, row_id, changes, version=None):
+    """Set only the `changes` columns of one row and bump its version, in
+    a single UPDATE ... RETURNING; the caller commits
+
+    Returns the updated row as a dict, or None if there is no such row.
+    With `version`, the update only applies to that version of the row
+    and raises VersionConflict otherwise.
+    """
+    if not changes:
+        row = db.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,)).fetchone()
+        if row is not None and version is not None and row['version'] != version:
+            raise VersionConflict(dict(row))
+        return dict(row) if row is not None else None
+
+    assignments = ', '.join(f'{column} = ?' for column in changes)
+    sql = f'UPDATE {table} SET {assignments}, version = version + 1 WHERE id = ?'
+    params = [*changes.values(), row_id]
+    if version is not None:
+        sql += ' AND version = ?'
+        params.append(version)
+    try:
+        row = db.execute(sql + ' RETURNING *', params).fetchone()
+    except sqlite3.IntegrityError as e:
+        raise ValueError(str(e))
+    if row is None:
+        return _check_conflict(db, table, row_id, version)
+    return dict(row)
+
+def delete_row(db, table, row_id, version=None):
+    """DELETE one row (only at `version` if given); the caller commits
+
+    Returns False if there is no such row, raises VersionConflict if it
+    exists at another version.
+    """
+    sql = f'DELETE FROM {table} WHERE id = ?'
+    params = [row_id]
+    if version is not None:
+        sql += ' AND version = ?'
+        params.append(version)
+    if db.execute(sql, params).rowcount:
+        return True
+    _check_conflict(db, table, row_id, version)
+    return False
@@ -0,0 +1,36 @@
+from flask import g
+import sqlite3
+
+class DataVersion:
+    # One counter per table, bumped by every model write path in the same
+    # transaction as the write. Caches key on these counters.
+
+    @staticmethod
+    def create_table(db):
+        """Create the data_versions table"""
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        db.commit()
+
+    @staticmethod
+    def bump(db, *names):
+        """Increment the counters of the given tables (caller commits)"""
+        db.executemany('''
+            INSERT INTO data_versions (name, version) VALUES (?, 1)
+            ON CONFLICT (name) DO UPDATE SET version = version + 1
+        ''', [(name,) for name in names])
+
+    @staticmethod
+    def get(db, *names):
+        """Get {name: version} for the given tables (0 if never written)"""
+        placeholders = ', '.join('?' for _ in names)
+        cursor = db.execute(
+            f'SELECT name, version FROM data_versions WHERE name IN ({placeholders})', names
+        )
+        versions = {name: 0 for name in names}
+        versions.update({row[0]: row[1] for row in cursor.fetchall()})
+        return versions
@@ -0,0 +1,31 @@
+from flask import Blueprint, request, jsonify, Response
+from models.metrics import registry, sampler
+import hmac
+import os
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Bearer token scrapers must send; without one only loopback clients are served
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+def _authorized():
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        return hmac.compare_digest(supplied, METRICS_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-route request metrics in the Prometheus text format"""
+    if not _authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@metrics_bp.route('/metrics/profile', methods=['GET'])
+def profile():
+    """Folded stacks from the sampling profiler (?reset=1 starts over)"""
+    if not _authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    if sampler is None:
+        return jsonify({'error': 'Profiler disabled, set PROFILE_INTERVAL_MS'}), 404
+    return Response(sampler.folded(reset=request.args.get('reset') == '1'), mimetype='text/plain')
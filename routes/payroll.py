@@ -2,61 +2,201 @@ from flask import Blueprint, request, jsonify, g
 from models.employee import Employee
 from models.payroll import Payroll
 from models.expense import Expense
+from models.pagination import parse_list_args, paginated_response
+from models.http_cache import conditional_get
+from models.updates import parse_changes, parse_version, VersionConflict
+from models.sessions import login_required
+import calendar
+import csv
+import io
+from datetime import date
 
 payroll_bp = Blueprint('payroll', __name__)
 
+# Rows validated and handed to executemany at a time by the bulk imports
+BULK_BATCH_SIZE = 500
+
+def build_employee(data):
+    """Validate request data and build a new Employee (raises ValueError)"""
+    required_fields = ['name', 'type', 'salary', 'payment_type', 'start_date']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            raise ValueError(f'Missing required field: {field}')
+    
+    return Employee(
+        name=data['name'],
+        type=data['type'],
+        project_id=data.get('project_id'),
+        salary=float(data['salary']),
+        payment_type=data['payment_type'],
+        phone=data.get('phone'),
+        id_number=data.get('id_number'),
+        start_date=data['start_date'],
+        notes=data.get('notes')
+    )
+
+def build_payroll(data):
+    """Validate request data and build a new Payroll record (raises ValueError)"""
+    required_fields = ['employee_id', 'period', 'base_amount', 'total', 'payment_date']
+    for field in required_fields:
+        if field not in data or data[field] is None:
+            raise ValueError(f'Missing required field: {field}')
+    
+    return Payroll(
+        employee_id=int(data['employee_id']),
+        period=data['period'],
+        start_date=data.get('start_date'),
+        end_date=data.get('end_date'),
+        base_amount=float(data['base_amount']),
+        bonus=float(data.get('bonus') or 0),
+        deductions=float(data.get('deductions') or 0),
+        overtime=float(data.get('overtime') or 0),
+        total=float(data['total']),
+        payment_date=data['payment_date'],
+        status=data.get('status') or 'pending',
+        notes=data.get('notes')
+    )
+
+def build_expense(data):
+    """Validate request data and build a new Expense (raises ValueError)"""
+    required_fields = ['category', 'description', 'amount', 'date', 'payment_method']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            raise ValueError(f'Missing required field: {field}')
+    
+    return Expense(
+        category=data['category'],
+        project_id=data.get('project_id'),
+        description=data['description'],
+        amount=float(data['amount']),
+        date=data['date'],
+        vendor=data.get('vendor'),
+        receipt=data.get('receipt'),
+        payment_method=data['payment_method'],
+        status=data.get('status') or 'pending',
+        notes=data.get('notes')
+    )
+
+def _bulk_rows():
+    """Yield row dicts from a JSON array body or a streamed text/csv body"""
+    if request.mimetype == 'text/csv':
+        reader = csv.DictReader(io.TextIOWrapper(request.stream, encoding='utf-8-sig'))
+        for row in reader:
+            # Empty CSV cells mean "not supplied", like a missing JSON key
+            yield {key: value for key, value in row.items() if value != ''}
+        return
+    
+    data = request.get_json()
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of records')
+    yield from data
+
+def _bulk_import(model, build):
+    """Validate rows in batches and insert them in a single transaction
+
+    Without ?skip_invalid=1 any invalid row aborts the whole import; with it,
+    valid rows are inserted and invalid ones are reported.
+    """
+    skip_invalid = request.args.get('skip_invalid') in ('1', 'true')
+    
+    db = g.get('_database')
+    if not db:
+        from main import get_db
+        db = get_db()
+    
+    errors = []
+    inserted = 0
+    batch = []
+    try:
+        for row_number, data in enumerate(_bulk_rows(), start=1):
+            try:
+                if not isinstance(data, dict):
+                    raise ValueError('Expected an object')
+                batch.append(build(data))
+            except (ValueError, TypeError) as e:
+                errors.append({'row': row_number, 'error': str(e)})
+            
+            if len(batch) >= BULK_BATCH_SIZE:
+                if skip_invalid or not errors:
+                    model.insert_many(db, batch)
+                    inserted += len(batch)
+                batch = []
+        
+        if errors and not skip_invalid:
+            db.rollback()
+            return jsonify({'inserted': 0, 'errors': errors}), 400
+        
+        if batch:
+            model.insert_many(db, batch)
+            inserted += len(batch)
+        db.commit()
+    except ValueError as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        db.rollback()
+        raise
+    
+    return jsonify({'inserted': inserted, 'errors': errors}), 201
+
 # Employee routes
 @payroll_bp.route('/api/employees', methods=['GET'])
+@login_required
+@conditional_get('employees')
 def get_employees():
-    """Get all employees"""
+    """Get employees, optionally filtered, projected and paginated"""
+    try:
+        query = parse_list_args(request.args, Employee.COLUMNS, Employee.FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        employees = Employee.get_all(db)
-        return jsonify(employees)
+        employees, next_cursor = Employee.get_page_json(db, **query)
+        return paginated_response(employees, next_cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @payroll_bp.route('/api/employees', methods=['POST'])
+@login_required
 def create_employee():
     """Create a new employee"""
     try:
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['name', 'type', 'salary', 'payment_type', 'start_date']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        try:
+            employee = build_employee(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Create employee
-        employee = Employee(
-            name=data['name'],
-            type=data['type'],
-            project_id=data.get('project_id'),
-            salary=float(data['salary']),
-            payment_type=data['payment_type'],
-            phone=data.get('phone'),
-            id_number=data.get('id_number'),
-            start_date=data['start_date'],
-            notes=data.get('notes')
-        )
-        
         employee.save(db)
         return jsonify(employee.to_dict()), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@payroll_bp.route('/api/employees/bulk', methods=['POST'])
+@login_required
+def bulk_create_employees():
+    """Import employees from a JSON array or CSV"""
+    try:
+        return _bulk_import(Employee, build_employee)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @payroll_bp.route('/api/employees/<int:employee_id>', methods=['GET'])
+@login_required
+@conditional_get('employees')
 def get_employee(employee_id):
     """Get employee by ID"""
     try:
@@ -73,117 +213,185 @@ def get_employee(employee_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@payroll_bp.route('/api/employees/<int:employee_id>', methods=['PUT'])
+@payroll_bp.route('/api/employees/<int:employee_id>', methods=['PUT', 'PATCH'])
+@login_required
 def update_employee(employee_id):
-    """Update employee"""
+    """Update only the supplied fields of an employee
+
+    Send the row's `version` to have the update refused with 409 if someone
+    else changed it since it was read.
+    """
     try:
-        data = request.get_json()
+        try:
+            changes, version = parse_changes(request.get_json(silent=True), Employee.UPDATABLE)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
         
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Check if employee exists
-        existing_employee = Employee.get_by_id(db, employee_id)
-        if not existing_employee:
+        employee = Employee.update(db, employee_id, changes, version)
+        if not employee:
             return jsonify({'error': 'Employee not found'}), 404
+        return jsonify(employee)
         
-        # Update employee
-        employee = Employee(
-            id=employee_id,
-            name=data.get('name', existing_employee['name']),
-            type=data.get('type', existing_employee['type']),
-            project_id=data.get('project_id', existing_employee['project_id']),
-            salary=float(data.get('salary', existing_employee['salary'])),
-            payment_type=data.get('payment_type', existing_employee['payment_type']),
-            phone=data.get('phone', existing_employee['phone']),
-            id_number=data.get('id_number', existing_employee['id_number']),
-            start_date=data.get('start_date', existing_employee['start_date']),
-            notes=data.get('notes', existing_employee['notes'])
-        )
-        
-        employee.save(db)
-        return jsonify(employee.to_dict())
-        
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'current': e.current}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @payroll_bp.route('/api/employees/<int:employee_id>', methods=['DELETE'])
+@login_required
 def delete_employee(employee_id):
-    """Delete employee"""
+    """Delete employee (only at ?version= if given)"""
     try:
+        try:
+            version = parse_version(request.args.get('version'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Check if employee exists
-        employee = Employee.get_by_id(db, employee_id)
-        if not employee:
+        if not Employee.delete(db, employee_id, version):
             return jsonify({'error': 'Employee not found'}), 404
-        
-        Employee.delete(db, employee_id)
         return jsonify({'message': 'Employee deleted successfully'})
         
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'current': e.current}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Payroll routes
 @payroll_bp.route('/api/payroll', methods=['GET'])
+@login_required
+@conditional_get('payroll', 'employees')
 def get_payroll_records():
-    """Get all payroll records"""
+    """Get payroll records, optionally filtered, projected and paginated"""
+    try:
+        query = parse_list_args(request.args, Payroll.COLUMNS, Payroll.FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        payroll_records = Payroll.get_all(db)
-        return jsonify(payroll_records)
+        payroll_records, next_cursor = Payroll.get_page_json(db, **query)
+        return paginated_response(payroll_records, next_cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @payroll_bp.route('/api/payroll', methods=['POST'])
+@login_required
 def create_payroll_record():
     """Create a new payroll record"""
     try:
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['employee_id', 'period', 'base_amount', 'total', 'payment_date']
-        for field in required_fields:
-            if field not in data or data[field] is None:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        try:
+            payroll = build_payroll(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Create payroll record
-        payroll = Payroll(
-            employee_id=int(data['employee_id']),
-            period=data['period'],
-            start_date=data.get('start_date'),
-            end_date=data.get('end_date'),
-            base_amount=float(data['base_amount']),
-            bonus=float(data.get('bonus', 0)),
-            deductions=float(data.get('deductions', 0)),
-            overtime=float(data.get('overtime', 0)),
-            total=float(data['total']),
-            payment_date=data['payment_date'],
-            status=data.get('status', 'pending'),
-            notes=data.get('notes')
-        )
-        
         payroll.save(db)
         return jsonify(payroll.to_dict()), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@payroll_bp.route('/api/payroll/bulk', methods=['POST'])
+@login_required
+def bulk_create_payroll_records():
+    """Import payroll records from a JSON array or CSV"""
+    try:
+        return _bulk_import(Payroll, build_payroll)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@payroll_bp.route('/api/payroll/run', methods=['POST'])
+@login_required
+def run_payroll():
+    """Generate payroll records for every matching employee for a period"""
+    try:
+        data = request.get_json() or {}
+        
+        # Validate required fields
+        for field in ['period', 'payment_date']:
+            if not data.get(field):
+                return jsonify({'error': f'Missing required field: {field}'}), 400
+        
+        period = data['period']
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        try:
+            if not (start_date and end_date):
+                # A "YYYY-MM" period covers the whole month
+                year, month = (int(part) for part in period.split('-'))
+                start_date = start_date or date(year, month, 1).isoformat()
+                end_date = end_date or date(year, month, calendar.monthrange(year, month)[1]).isoformat()
+            days = data.get('days')
+            if days is None:
+                days = (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days + 1
+            days = float(days)
+            hours = float(data['hours']) if data.get('hours') is not None else None
+            
+            adjustments = data.get('adjustments') or {}
+            if isinstance(adjustments, list):
+                adjustments = {item['employee_id']: item for item in adjustments}
+            for values in adjustments.values():
+                for key in ('units', 'bonus', 'deductions', 'overtime'):
+                    if values.get(key) is not None:
+                        values[key] = float(values[key])
+        except (ValueError, TypeError, KeyError):
+            return jsonify({'error': 'Invalid period, dates, days, hours or adjustments'}), 400
+        
+        db = g.get('_database')
+        if not db:
+            from main import get_db
+            db = get_db()
+        
+        options = {}
+        if hours is not None:
+            options['hours'] = hours
+        created, skipped, total = Payroll.run_period(
+            db, period, start_date, end_date, data['payment_date'], days,
+            project_id=data.get('project_id'),
+            employee_type=data.get('type'),
+            adjustments=adjustments,
+            status=data.get('status') or 'pending',
+            notes=data.get('notes'),
+            **options
+        )
+        return jsonify({
+            'period': period,
+            'start_date': start_date,
+            'end_date': end_date,
+            'created': created,
+            'skipped': skipped,
+            'total': total
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @payroll_bp.route('/api/payroll/<int:payroll_id>', methods=['GET'])
+@login_required
+@conditional_get('payroll')
 def get_payroll_record(payroll_id):
     """Get payroll record by ID"""
     try:
@@ -200,118 +408,119 @@ def get_payroll_record(payroll_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@payroll_bp.route('/api/payroll/<int:payroll_id>', methods=['PUT'])
+@payroll_bp.route('/api/payroll/<int:payroll_id>', methods=['PUT', 'PATCH'])
+@login_required
 def update_payroll_record(payroll_id):
-    """Update payroll record"""
+    """Update only the supplied fields of a payroll record
+
+    Send the row's `version` to have the update refused with 409 if someone
+    else changed it since it was read.
+    """
     try:
-        data = request.get_json()
+        try:
+            changes, version = parse_changes(request.get_json(silent=True), Payroll.UPDATABLE)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
         
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Check if payroll record exists
-        existing_payroll = Payroll.get_by_id(db, payroll_id)
-        if not existing_payroll:
+        payroll = Payroll.update(db, payroll_id, changes, version)
+        if not payroll:
             return jsonify({'error': 'Payroll record not found'}), 404
+        return jsonify(payroll)
         
-        # Update payroll record
-        payroll = Payroll(
-            id=payroll_id,
-            employee_id=int(data.get('employee_id', existing_payroll['employee_id'])),
-            period=data.get('period', existing_payroll['period']),
-            start_date=data.get('start_date', existing_payroll['start_date']),
-            end_date=data.get('end_date', existing_payroll['end_date']),
-            base_amount=float(data.get('base_amount', existing_payroll['base_amount'])),
-            bonus=float(data.get('bonus', existing_payroll['bonus'])),
-            deductions=float(data.get('deductions', existing_payroll['deductions'])),
-            overtime=float(data.get('overtime', existing_payroll['overtime'])),
-            total=float(data.get('total', existing_payroll['total'])),
-            payment_date=data.get('payment_date', existing_payroll['payment_date']),
-            status=data.get('status', existing_payroll['status']),
-            notes=data.get('notes', existing_payroll['notes'])
-        )
-        
-        payroll.save(db)
-        return jsonify(payroll.to_dict())
-        
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'current': e.current}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @payroll_bp.route('/api/payroll/<int:payroll_id>', methods=['DELETE'])
+@login_required
 def delete_payroll_record(payroll_id):
-    """Delete payroll record"""
+    """Delete payroll record (only at ?version= if given)"""
     try:
+        try:
+            version = parse_version(request.args.get('version'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Check if payroll record exists
-        payroll = Payroll.get_by_id(db, payroll_id)
-        if not payroll:
+        if not Payroll.delete(db, payroll_id, version):
             return jsonify({'error': 'Payroll record not found'}), 404
-        
-        Payroll.delete(db, payroll_id)
         return jsonify({'message': 'Payroll record deleted successfully'})
         
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'current': e.current}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Expense routes
 @payroll_bp.route('/api/expenses', methods=['GET'])
+@login_required
+@conditional_get('expenses')
 def get_expenses():
-    """Get all expenses"""
+    """Get expenses, optionally filtered, projected and paginated"""
+    try:
+        query = parse_list_args(request.args, Expense.COLUMNS, Expense.FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        expenses = Expense.get_all(db)
-        return jsonify(expenses)
+        expenses, next_cursor = Expense.get_page_json(db, **query)
+        return paginated_response(expenses, next_cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @payroll_bp.route('/api/expenses', methods=['POST'])
+@login_required
 def create_expense():
     """Create a new expense"""
     try:
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['category', 'description', 'amount', 'date', 'payment_method']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        try:
+            expense = build_expense(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Create expense
-        expense = Expense(
-            category=data['category'],
-            project_id=data.get('project_id'),
-            description=data['description'],
-            amount=float(data['amount']),
-            date=data['date'],
-            vendor=data.get('vendor'),
-            receipt=data.get('receipt'),
-            payment_method=data['payment_method'],
-            status=data.get('status', 'pending'),
-            notes=data.get('notes')
-        )
-        
         expense.save(db)
         return jsonify(expense.to_dict()), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@payroll_bp.route('/api/expenses/bulk', methods=['POST'])
+@login_required
+def bulk_create_expenses():
+    """Import expenses from a JSON array or CSV"""
+    try:
+        return _bulk_import(Expense, build_expense)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @payroll_bp.route('/api/expenses/<int:expense_id>', methods=['GET'])
+@login_required
+@conditional_get('expenses')
 def get_expense(expense_id):
     """Get expense by ID"""
     try:
@@ -328,60 +537,57 @@ def get_expense(expense_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@payroll_bp.route('/api/expenses/<int:expense_id>', methods=['PUT'])
+@payroll_bp.route('/api/expenses/<int:expense_id>', methods=['PUT', 'PATCH'])
+@login_required
 def update_expense(expense_id):
-    """Update expense"""
+    """Update only the supplied fields of an expense
+
+    Send the row's `version` to have the update refused with 409 if someone
+    else changed it since it was read.
+    """
     try:
-        data = request.get_json()
+        try:
+            changes, version = parse_changes(request.get_json(silent=True), Expense.UPDATABLE)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
         
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Check if expense exists
-        existing_expense = Expense.get_by_id(db, expense_id)
-        if not existing_expense:
+        expense = Expense.update(db, expense_id, changes, version)
+        if not expense:
             return jsonify({'error': 'Expense not found'}), 404
+        return jsonify(expense)
         
-        # Update expense
-        expense = Expense(
-            id=expense_id,
-            category=data.get('category', existing_expense['category']),
-            project_id=data.get('project_id', existing_expense['project_id']),
-            description=data.get('description', existing_expense['description']),
-            amount=float(data.get('amount', existing_expense['amount'])),
-            date=data.get('date', existing_expense['date']),
-            vendor=data.get('vendor', existing_expense['vendor']),
-            receipt=data.get('receipt', existing_expense['receipt']),
-            payment_method=data.get('payment_method', existing_expense['payment_method']),
-            status=data.get('status', existing_expense['status']),
-            notes=data.get('notes', existing_expense['notes'])
-        )
-        
-        expense.save(db)
-        return jsonify(expense.to_dict())
-        
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'current': e.current}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @payroll_bp.route('/api/expenses/<int:expense_id>', methods=['DELETE'])
+@login_required
 def delete_expense(expense_id):
-    """Delete expense"""
+    """Delete expense (only at ?version= if given)"""
     try:
+        try:
+            version = parse_version(request.args.get('version'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         db = g.get('_database')
         if not db:
             from main import get_db
             db = get_db()
         
-        # Check if expense exists
-        expense = Expense.get_by_id(db, expense_id)
-        if not expense:
+        if not Expense.delete(db, expense_id, version):
             return jsonify({'error': 'Expense not found'}), 404
-        
-        Expense.delete(db, expense_id)
         return jsonify({'message': 'Expense deleted successfully'})
         
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'current': e.current}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify, g
+from models.archive import Archives
+from models.http_cache import conditional_get
+from models.sessions import login_required
+
+periods_bp = Blueprint('periods', __name__)
+
+def _get_db():
+    db = g.get('_database')
+    if not db:
+        from main import get_db
+        db = get_db()
+    return db
+
+@periods_bp.route('/api/periods', methods=['GET'])
+@login_required
+@conditional_get('closed_periods')
+def get_closed_periods():
+    """Closed periods with the totals archived per ledger"""
+    try:
+        return jsonify(Archives.get_all(_get_db()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@periods_bp.route('/api/periods/<period>/close', methods=['POST'])
+@login_required(role='admin')
+def close_period(period):
+    """Archive a finished month (YYYY-MM) or year (YYYY); body
+    {"force": true} archives it even with rows still pending"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(Archives.close(_get_db(), period, force=bool(data.get('force')))), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,219 @@
+from flask import Blueprint, request, jsonify, g, Response, send_file, stream_with_context
+from models.employee import Employee
+from models.payroll import Payroll
+from models.expense import Expense
+from models.project import Project
+from models.transaction import Transaction
+from models.pagination import build_select, parse_list_args
+from models.report_pdf import get_report_pdf, parse_report_params
+from models.reports import Reports
+from models.archive import Archives, ARCHIVED_TABLES
+from models.rollups import Rollups, GRAINS
+from models.http_cache import conditional_get
+from models.sessions import login_required
+import csv
+import io
+import tempfile
+from datetime import date
+
+reports_bp = Blueprint('reports', __name__)
+
+# Rows pulled from the cursor per fetchmany() call while exporting
+EXPORT_BATCH_SIZE = 1000
+
+EXPORTS = {
+    'expenses': ('expenses', Expense),
+    'payroll': ('payroll', Payroll),
+    'projects': ('projects', Project),
+    'employees': ('employees', Employee),
+    'transactions': ('transactions', Transaction),
+}
+
+def _get_db():
+    db = g.get('_database')
+    if not db:
+        from main import get_db
+        db = get_db()
+    return db
+
+def _iter_batches(db, sql, params):
+    """Yield lists of row tuples from a cursor, EXPORT_BATCH_SIZE at a time"""
+    cursor = db.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            break
+        yield rows
+
+def _csv_stream(db, sql, params, selected):
+    """Generate CSV text chunks, one chunk per fetched batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the Arabic text as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(selected)
+    yield buffer.getvalue()
+
+    for rows in _iter_batches(db, sql, params):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(row[:len(selected)] for row in rows)
+        yield buffer.getvalue()
+
+def _xlsx_stream(db, sql, params, selected, title):
+    """Build the workbook in openpyxl write-only mode and stream the file
+
+    Write-only worksheets keep rows in a temporary file rather than in
+    memory; the finished zip is then sent in chunks from disk.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    sheet.append(list(selected))
+    for rows in _iter_batches(db, sql, params):
+        for row in rows:
+            sheet.append(list(row[:len(selected)]))
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+@reports_bp.route('/api/export/<resource>', methods=['GET'])
+@login_required
+def export(resource):
+    """Stream a filtered table as CSV (default) or XLSX
+
+    Voided ledger entries are left out of the transactions export unless
+    ?view=all is given, as in /api/transactions.
+    """
+    if resource not in EXPORTS:
+        return jsonify({'error': f'Unknown export: {resource}'}), 404
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'format must be csv or xlsx'}), 400
+
+    table, model = EXPORTS[resource]
+    try:
+        query = parse_list_args(request.args, model.COLUMNS, model.FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if resource == 'transactions' and request.args.get('view') != 'all':
+        # Like /api/transactions: voided entries only with ?view=all
+        query['filters'].setdefault('voided', 0)
+
+    try:
+        db = _get_db()
+        source = table
+        if table in ARCHIVED_TABLES:
+            # Rows of closed periods in the from..to range come from their archives
+            source = Archives.source(db, table, query['filters'].get('from'), query['filters'].get('to'))
+        sql, params, selected = build_select(source, model.COLUMNS, model.ORDER, model.FILTERS, **query)
+
+        if export_format == 'xlsx':
+            body = _xlsx_stream(db, sql, params, selected, resource)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            body = _csv_stream(db, sql, params, selected)
+            mimetype = 'text/csv; charset=utf-8'
+
+        response = Response(stream_with_context(body), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={resource}.{export_format}'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@reports_bp.route('/api/reports/timeseries', methods=['GET'])
+@login_required
+@conditional_get('expenses', 'payroll', 'employees')
+def timeseries():
+    """Pre-aggregated expense or payroll totals per day, month or year
+
+    ?ledger=expenses|payroll&grain=day|month|year&from=&to=&project_id=
+    &category= (expenses) or &employee_type= (payroll)&status=
+    &group_by=project_id,category|employee_type,status
+    """
+    ledger = request.args.get('ledger', 'expenses')
+    if ledger not in Rollups.LEDGERS:
+        return jsonify({'error': 'ledger must be expenses or payroll'}), 400
+    grain = request.args.get('grain', 'month')
+    if grain not in GRAINS:
+        return jsonify({'error': 'grain must be day, month or year'}), 400
+
+    dimension = Rollups.DIMENSIONS[ledger]
+    group_by = []
+    for column in (request.args.get('group_by') or '').split(','):
+        column = column.strip()
+        if not column:
+            continue
+        if column not in ('project_id', dimension, 'status'):
+            return jsonify({'error': f'Cannot group by: {column}'}), 400
+        group_by.append('dimension' if column == dimension else column)
+
+    project_id = request.args.get('project_id')
+    if project_id is not None:
+        try:
+            project_id = int(project_id)
+        except ValueError:
+            return jsonify({'error': 'project_id must be an integer'}), 400
+
+    try:
+        rows = Rollups.timeseries(_get_db(), ledger, grain, request.args.get('from'), request.args.get('to'),
+                                  project_id, request.args.get(dimension), request.args.get('status'),
+                                  group_by)
+        return jsonify(rows)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@reports_bp.route('/api/reports/analytics', methods=['GET'])
+@login_required
+def analytics():
+    """Burn rate, projected overrun dates, monthly moving average and
+    category variance (?project_id=&from=&to=&as_of=&window=&months=)"""
+    from models.analytics import Analytics, BURN_WINDOW_DAYS, MOVING_AVERAGE_MONTHS
+
+    try:
+        as_of = date.fromisoformat(request.args['as_of']) if request.args.get('as_of') else None
+        for name in ('from', 'to'):
+            if request.args.get(name):
+                date.fromisoformat(request.args[name])
+        project_id = int(request.args['project_id']) if request.args.get('project_id') else None
+        window = int(request.args.get('window', BURN_WINDOW_DAYS))
+        months = int(request.args.get('months', MOVING_AVERAGE_MONTHS))
+        if window < 1 or months < 1:
+            raise ValueError('window and months must be positive')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify(Analytics.forecast(_get_db(), as_of, project_id, request.args.get('from'),
+                                          request.args.get('to'), window, months))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@reports_bp.route('/api/reports/<name>.pdf', methods=['GET'])
+@login_required
+def report_pdf(name):
+    """Render (or serve from the render cache) a PDF report"""
+    if name not in Reports.TABLES:
+        return jsonify({'error': f'Unknown report: {name}'}), 404
+
+    try:
+        params = parse_report_params(name, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        path, cache_hit = get_report_pdf(_get_db(), name, params)
+        response = send_file(path, mimetype='application/pdf', as_attachment=True,
+                             download_name=f'{name}.pdf')
+        response.headers['X-Report-Cache'] = 'hit' if cache_hit else 'miss'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
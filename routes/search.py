@@ -0,0 +1,51 @@
+from flask import Blueprint, request, jsonify, g
+from models.search import Search, INDEXES
+from models.pagination import parse_list_args, paginated_response, DEFAULT_LIMIT
+from models.http_cache import conditional_get
+from models.sessions import login_required
+
+search_bp = Blueprint('search', __name__)
+
+@search_bp.route('/api/search', methods=['GET'])
+@login_required
+@conditional_get(*(table for table, *_ in INDEXES.values()))
+def search():
+    """Ranked full-text search over employees, expenses and projects
+
+    ?q= terms (all required, each matched as a prefix), optional
+    ?type=employee,expense,project, and limit/cursor pagination.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+
+    kinds = None
+    if request.args.get('type'):
+        kinds = [kind.strip() for kind in request.args['type'].split(',') if kind.strip()]
+        for kind in kinds:
+            if kind not in INDEXES:
+                return jsonify({'error': f'Unknown type: {kind}'}), 400
+
+    try:
+        page = parse_list_args(request.args, (), {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cursor = page['cursor']
+    if cursor is not None:
+        try:
+            (score, kind), row_id = cursor
+            cursor = ([float(score), str(kind)], row_id)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    try:
+        db = g.get('_database')
+        if not db:
+            from main import get_db
+            db = get_db()
+        
+        hits, next_cursor = Search.search(db, query, kinds, cursor, page['limit'] or DEFAULT_LIMIT)
+        return paginated_response(hits, next_cursor)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,69 @@
+from flask import Blueprint, request, jsonify, g
+from models.transaction import Transaction
+from models.pagination import parse_list_args, paginated_response
+from models.http_cache import conditional_get
+from models.sessions import login_required
+
+transactions_bp = Blueprint('transactions', __name__)
+
+@transactions_bp.route('/api/transactions', methods=['GET'])
+@login_required
+@conditional_get(*Transaction.SOURCE_TABLES)
+def get_transactions():
+    """Get ledger entries, optionally filtered, projected and paginated
+
+    Voided entries (replaced or deleted source rows and their reversals)
+    are hidden unless ?view=all is given.
+    """
+    try:
+        query = parse_list_args(request.args, Transaction.COLUMNS, Transaction.FILTERS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if request.args.get('view') != 'all':
+        query['filters'].setdefault('voided', 0)
+
+    try:
+        db = g.get('_database')
+        if not db:
+            from main import get_db
+            db = get_db()
+        
+        transactions, next_cursor = Transaction.get_page_json(db, **query)
+        return paginated_response(transactions, next_cursor)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@transactions_bp.route('/api/transactions', methods=['POST'])
+@login_required
+def create_transaction():
+    """Record an income entry (expenses and payroll enter the ledger on save)"""
+    try:
+        data = request.get_json() or {}
+        
+        if data.get('type', 'income') != 'income':
+            return jsonify({'error': 'Only income can be posted directly; use /api/expenses or /api/payroll'}), 400
+        
+        # Validate required fields
+        for field in ['amount', 'date']:
+            if not data.get(field):
+                return jsonify({'error': f'Missing required field: {field}'}), 400
+        try:
+            amount = float(data['amount'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'amount must be a number'}), 400
+        
+        db = g.get('_database')
+        if not db:
+            from main import get_db
+            db = get_db()
+        
+        transaction = Transaction.add_income(
+            db, amount, data['date'],
+            project_id=data.get('project_id') or None,
+            category=data.get('category'),
+            description=data.get('description')
+        )
+        return jsonify(transaction), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -428,29 +428,31 @@ function displayPayrollRecords(recordsToShow) {
     });
 }
 
-function updatePayrollStats() {
-    const monthlyTotal = payrollRecords.reduce((sum, record) => sum + (record.total || 0), 0);
-    const currentMonth = new Date().getMonth();
-    const currentYear = new Date().getFullYear();
-    
-    const currentMonthRecords = payrollRecords.filter(record => {
-        const recordDate = new Date(record.payment_date);
-        return recordDate.getMonth() === currentMonth && recordDate.getFullYear() === currentYear;
-    });
-    
-    const currentMonthTotal = currentMonthRecords.reduce((sum, record) => sum + (record.total || 0), 0);
-    const pendingTotal = payrollRecords.filter(r => r.status === 'pending').reduce((sum, record) => sum + (record.total || 0), 0);
-    const paidTotal = payrollRecords.filter(r => r.status === 'paid').reduce((sum, record) => sum + (record.total || 0), 0);
+async function fetchDashboardStats() {
+    try {
+        const response = await fetch('/api/dashboard/stats', { credentials: 'include' });
+        if (response.ok) {
+            return await response.json();
+        }
+    } catch (error) {
+        console.error('Error loading dashboard stats:', error);
+    }
+    return null;
+}
+
+async function updatePayrollStats() {
+    const stats = await fetchDashboardStats();
+    const payroll = stats ? stats.payroll : { total: 0, currentMonth: 0, byStatus: {} };
 
     const totalMonthlyPayrollEl = document.getElementById('totalMonthlyPayroll');
     const thisMonthPayrollEl = document.getElementById('thisMonthPayroll');
     const pendingPayrollEl = document.getElementById('pendingPayroll');
     const paidPayrollEl = document.getElementById('paidPayroll');
 
-    if (totalMonthlyPayrollEl) totalMonthlyPayrollEl.textContent = formatCurrency(monthlyTotal);
-    if (thisMonthPayrollEl) thisMonthPayrollEl.textContent = formatCurrency(currentMonthTotal);
-    if (pendingPayrollEl) pendingPayrollEl.textContent = formatCurrency(pendingTotal);
-    if (paidPayrollEl) paidPayrollEl.textContent = formatCurrency(paidTotal);
+    if (totalMonthlyPayrollEl) totalMonthlyPayrollEl.textContent = formatCurrency(payroll.total);
+    if (thisMonthPayrollEl) thisMonthPayrollEl.textContent = formatCurrency(payroll.currentMonth);
+    if (pendingPayrollEl) pendingPayrollEl.textContent = formatCurrency(payroll.byStatus.pending);
+    if (paidPayrollEl) paidPayrollEl.textContent = formatCurrency(payroll.byStatus.paid);
 }
 
 // Expense management functions
@@ -536,29 +538,19 @@ function displayExpenses(expensesToShow) {
     });
 }
 
-function updateExpenseStats() {
-    const totalExpenses = expenses.reduce((sum, expense) => sum + (expense.amount || 0), 0);
-    const today = new Date().toISOString().split('T')[0];
-    const todayExpenses = expenses.filter(e => e.date === today).reduce((sum, expense) => sum + (expense.amount || 0), 0);
-    
-    const currentMonth = new Date().getMonth();
-    const currentYear = new Date().getFullYear();
-    const monthExpenses = expenses.filter(expense => {
-        const expenseDate = new Date(expense.date);
-        return expenseDate.getMonth() === currentMonth && expenseDate.getFullYear() === currentYear;
-    }).reduce((sum, expense) => sum + (expense.amount || 0), 0);
-    
-    const pendingExpenses = expenses.filter(e => e.status === 'معلق').reduce((sum, expense) => sum + (expense.amount || 0), 0);
+async function updateExpenseStats() {
+    const stats = await fetchDashboardStats();
+    const expenseStats = stats ? stats.expenses : { total: 0, today: 0, currentMonth: 0, byStatus: {} };
 
     const totalExpensesEl = document.getElementById('totalExpenses');
     const todayExpensesEl = document.getElementById('todayExpenses');
     const monthExpensesEl = document.getElementById('monthExpenses');
     const pendingExpensesEl = document.getElementById('pendingExpenses');
 
-    if (totalExpensesEl) totalExpensesEl.textContent = formatCurrency(totalExpenses);
-    if (todayExpensesEl) todayExpensesEl.textContent = formatCurrency(todayExpenses);
-    if (monthExpensesEl) monthExpensesEl.textContent = formatCurrency(monthExpenses);
-    if (pendingExpensesEl) pendingExpensesEl.textContent = formatCurrency(pendingExpenses);
+    if (totalExpensesEl) totalExpensesEl.textContent = formatCurrency(expenseStats.total);
+    if (todayExpensesEl) todayExpensesEl.textContent = formatCurrency(expenseStats.today);
+    if (monthExpensesEl) monthExpensesEl.textContent = formatCurrency(expenseStats.currentMonth);
+    if (pendingExpensesEl) pendingExpensesEl.textContent = formatCurrency(expenseStats.byStatus['معلق']);
 }
 
 // Analytics functions
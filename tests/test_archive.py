@@ -0,0 +1,123 @@
+import importlib
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='module')
+def app_db(tmp_path_factory):
+    # main creates src/database/app.db relative to the working directory on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    os.environ['BUDGET_RECONCILE_INTERVAL'] = '0'
+    try:
+        main = importlib.import_module('main')
+        with main.app.app_context():
+            yield main.get_db()
+    finally:
+        os.chdir(cwd)
+
+def add_expense(db, day, status):
+    from models.expense import Expense
+    Expense(category='معدات', description='test', amount=100, date=day,
+            payment_method='نقدي', status=status).save(db)
+
+def test_close_refuses_arabic_pending_status(app_db):
+    from models.archive import Archives
+    add_expense(app_db, '2024-03-05', 'مدفوع')
+    add_expense(app_db, '2024-03-06', 'معلق')
+
+    with pytest.raises(ValueError, match='1 pending rows'):
+        Archives.close(app_db, '2024-03', as_of=date(2024, 4, 1))
+    assert app_db.execute("SELECT COUNT(*) FROM expenses WHERE date LIKE '2024-03%'").fetchone()[0] == 2
+
+    result = Archives.close(app_db, '2024-03', as_of=date(2024, 4, 1), force=True)
+    assert result['rows']['expenses'] == 2
+    assert app_db.execute("SELECT COUNT(*) FROM expenses WHERE date LIKE '2024-03%'").fetchone()[0] == 0
+
+def close_months(db, year, months, as_of):
+    from models.archive import Archives
+    for month in months:
+        Archives.close(db, f'{year}-{month:02d}', as_of=as_of, force=True)
+
+def test_source_reads_more_archives_than_can_be_attached(app_db):
+    from models.archive import Archives, MAX_ATTACHED_ARCHIVES
+    from models.reports import Reports
+    months = range(1, MAX_ATTACHED_ARCHIVES + 3)
+    for month in months:
+        add_expense(app_db, f'2021-{month:02d}-10', 'مدفوع')
+    close_months(app_db, 2021, months, date(2022, 1, 1))
+
+    totals = Reports.expense_by_category(app_db, '2021-01-01', '2021-12-31')
+    assert sum(row['count'] for row in totals) == len(months)
+    # No range: every closed period, in batches
+    source = Archives.source(app_db, 'expenses')
+    assert app_db.execute(f"SELECT COUNT(*) FROM {source} WHERE date LIKE '2021%'").fetchone()[0] == len(months)
+    source = Archives.source(app_db, 'expenses', '2021-03-01', '2021-05-31')
+    assert app_db.execute(f'SELECT COUNT(*) FROM {source}').fetchone()[0] == \
+        3 + app_db.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+
+def test_payroll_period_found_in_the_archive_it_was_paid_in(app_db):
+    from models.archive import Archives
+    from models.employee import Employee
+    from models.payroll import Payroll
+    from models.reports import Reports
+    employee = Employee(name='موظف', type='ممثل', salary=1000, payment_type='شهري').save(app_db)
+    Payroll(employee_id=employee.id, period='2022-03', start_date='2022-03-01', end_date='2022-03-31',
+            base_amount=1000, total=1000, payment_date='2022-06-10', status='paid').save(app_db)
+    close_months(app_db, 2022, range(3, 7), date(2022, 7, 1))
+
+    assert [row['total'] for row in Reports.payroll_period(app_db, '2022-03')] == [1000]
+    assert Archives.holding_payroll(app_db, '2022-03') == [('2022-06', '2022-06.db')]
+    # Recorded again from the archives if the table was lost
+    app_db.execute('DELETE FROM closed_period_payroll')
+    Archives.create_table(app_db)
+    assert Archives.holding_payroll(app_db, '2022-03') == [('2022-06', '2022-06.db')]
+
+    Archives.close(app_db, '2022', as_of=date(2023, 1, 1), force=True)
+    assert [row['total'] for row in Reports.payroll_period(app_db, '2022-03')] == [1000]
+
+def test_closing_a_year_folds_its_months(app_db):
+    from models.archive import Archives, _archive_dir
+    for day in ('2023-01-05', '2023-02-05', '2023-05-05'):
+        add_expense(app_db, day, 'مدفوع')
+    close_months(app_db, 2023, (1, 2), date(2024, 1, 1))
+
+    result = Archives.close(app_db, '2023', as_of=date(2024, 1, 1))
+    assert result['merged'] == ['2023-01', '2023-02']
+    assert result['rows']['expenses'] == 3
+    files = os.listdir(_archive_dir(app_db))
+    assert '2023.db' in files and '2023-01.db' not in files and '2023-02.db' not in files
+    assert [row['period'] for row in Archives.get_all(app_db) if row['period'].startswith('2023')] == ['2023']
+    source = Archives.source(app_db, 'expenses', '2023-01-01', '2023-12-31')
+    assert app_db.execute(f"SELECT COUNT(*) FROM {source} WHERE date LIKE '2023%'").fetchone()[0] == 3
+
+def test_summaries_unchanged_by_a_close(app_db):
+    from models.archive import Archives
+    from models.budget import BudgetConsumption
+    from models.expense import Expense
+    from models.reports import Reports
+    from models.rollups import Rollups
+    from models.stats import DashboardStats
+    project_id = app_db.execute(
+        "INSERT INTO projects (name, type, total_budget, status) VALUES ('مشروع', 'film', 100000, 'active')"
+    ).lastrowid
+    app_db.commit()
+    for day in ('2020-04-01', '2020-04-20'):
+        Expense(category='معدات', project_id=project_id, description='test', amount=250, date=day,
+                payment_method='نقدي', status='مدفوع').save(app_db)
+
+    def snapshot():
+        return (DashboardStats.get(app_db, date(2020, 5, 1)),
+                Reports.project_budget(app_db, project_id),
+                Rollups.timeseries(app_db, 'expenses', 'month', '2020-01-01', '2020-12-31'),
+                Reports.expense_by_category(app_db, '2020-04-01', '2020-04-30', project_id))
+
+    before = snapshot()
+    Archives.close(app_db, '2020-04', as_of=date(2020, 5, 1))
+    assert app_db.execute("SELECT COUNT(*) FROM expenses WHERE date LIKE '2020-04%'").fetchone()[0] == 0
+    assert snapshot() == before
+    assert BudgetConsumption.reconcile(app_db, repair=False) == []